@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Inventory360.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+from control.realtime import sse_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # El canal de eventos en vivo se atiende fuera del ciclo request/response de Django.
+    if scope['type'] == 'http' and scope['path'] == settings.REALTIME_STREAM_PATH:
+        return await sse_application(scope, receive, send)
+    return await django_application(scope, receive, send)
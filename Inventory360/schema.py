@@ -0,0 +1,98 @@
+"""
+Esquema OpenAPI precalculado. `python manage.py build_openapi_schema` lo genera
+en el despliegue como artefacto versionado (OPENAPI_SCHEMA_DIR/schema-<versión>.<formato>)
+y la vista lo sirve desde memoria con ETag, sin volver a introspeccionar las vistas.
+Si el artefacto de la versión actual no existe, se genera una vez en la primera
+solicitud.
+"""
+import hashlib
+import os
+import threading
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.settings import spectacular_settings
+from drf_spectacular.views import SpectacularAPIView
+
+RENDERERS = {'yaml': OpenApiYamlRenderer, 'json': OpenApiJsonRenderer}
+SOURCE_DIRS = ('Inventory360', 'control', 'user_control')
+
+_code_version = None
+_artifacts = {}
+_lock = threading.Lock()
+
+
+def code_version():
+    """INVENTORY360_VERSION si está definida; si no, un hash del código fuente Python."""
+    global _code_version
+    if _code_version is None:
+        version = os.environ.get('INVENTORY360_VERSION')
+        if not version:
+            digest = hashlib.sha256()
+            for directory in SOURCE_DIRS:
+                for root, dirs, files in sorted(os.walk(settings.BASE_DIR / directory)):
+                    dirs.sort()
+                    for name in sorted(files):
+                        if name.endswith('.py'):
+                            path = os.path.join(root, name)
+                            digest.update(path.encode('utf-8'))
+                            with open(path, 'rb') as source:
+                                digest.update(source.read())
+            version = digest.hexdigest()[:12]
+        _code_version = version
+    return _code_version
+
+
+def artifact_path(fmt, version=None):
+    return settings.OPENAPI_SCHEMA_DIR / f"schema-{version or code_version()}.{fmt}"
+
+
+def build_artifacts(version=None):
+    """Genera el esquema una vez y lo escribe en todos los formatos. Devuelve las rutas."""
+    generator = SchemaGenerator(urlconf=spectacular_settings.SERVE_URLCONF)
+    schema = generator.get_schema(request=None, public=True)
+    os.makedirs(settings.OPENAPI_SCHEMA_DIR, exist_ok=True)
+    paths = []
+    for fmt, renderer_class in RENDERERS.items():
+        path = artifact_path(fmt, version)
+        body = renderer_class().render(schema, renderer_class.media_type, {})
+        tmp = f"{path}.tmp"
+        with open(tmp, 'wb') as artifact:
+            artifact.write(body)
+        os.replace(tmp, path)
+        paths.append(path)
+    return paths
+
+
+def get_artifact(fmt):
+    key = (code_version(), fmt)
+    artifact = _artifacts.get(key)
+    if artifact is None:
+        with _lock:
+            artifact = _artifacts.get(key)
+            if artifact is None:
+                path = artifact_path(fmt)
+                if not path.exists():
+                    build_artifacts()
+                body = path.read_bytes()
+                artifact = (body, '"%s"' % hashlib.sha256(body).hexdigest()[:32])
+                _artifacts[key] = artifact
+    return artifact
+
+
+class CachedSchemaView(SpectacularAPIView):
+    def get(self, request, *args, **kwargs):
+        # Los esquemas por idioma o versión de API siguen generándose al vuelo.
+        if request.GET.get('lang') or request.GET.get('version'):
+            return super().get(request, *args, **kwargs)
+        fmt = request.accepted_renderer.format
+        body, etag = get_artifact(fmt)
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(body, content_type=request.accepted_media_type)
+            response['Content-Disposition'] = f'inline; filename="{spectacular_settings.TITLE or "schema"}.{fmt}"'
+        response['ETag'] = etag
+        response['Cache-Control'] = 'public, max-age=300'
+        return response
@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,6 +49,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'control.renderers.LargeResponseGZipMiddleware',
+    'control.throttling.AdmissionSlotMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -93,6 +97,40 @@ DATABASES = {
     }
 }
 
+# Modo de despliegue (variable INVENTORY360_MODE). 'central' usa MySQL; 'edge' corre un
+# nodo local de sucursal sobre SQLite en modo WAL con el catálogo y el stock de
+# EDGE_BRANCH_ID, que se sincroniza con el central con `python manage.py edge_sync`.
+INVENTORY360_MODE = os.environ.get('INVENTORY360_MODE', 'central')
+EDGE_MODE = INVENTORY360_MODE == 'edge'
+if EDGE_MODE:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('EDGE_DATABASE_PATH', str(BASE_DIR / 'edge.sqlite3')),
+            'OPTIONS': {
+                'timeout': 20,
+            }
+        }
+    }
+
+# Caché compartida por todos los workers (Redis en INVENTORY360_REDIS_URL, p. ej.
+# redis://127.0.0.1:6379/1): guarda la versión de la caché de referencia
+# (control/reference.py), los buckets y lugares del throttling
+# (control/throttling.py) y los tickets del stream SSE. Sin la variable se usa la
+# caché en memoria de cada proceso, suficiente para un solo worker (nodo edge,
+# desarrollo); con varios workers cada uno tendría sus propios límites y versiones,
+# así que en el central con más de un worker hay que definirla.
+REDIS_URL = os.environ.get('INVENTORY360_REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -136,16 +174,42 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    ]
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'control.renderers.ORJSONRenderer',
+        'control.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'control.renderers.ORJSONParser',
+        'control.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'control.throttling.CostAwareThrottle',
+    ],
 }
 
+# Tamaño mínimo (bytes) para comprimir con gzip una respuesta no streaming
+# (control.renderers.LargeResponseGZipMiddleware).
+GZIP_MIN_BYTES = 8 * 1024
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
     'ROTATE_REFRESH_TOKENS': True,
     'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_REFRESH_SERIALIZER': 'user_control.blacklist.TokenRefreshSerializer',
+    'TOKEN_VERIFY_SERIALIZER': 'user_control.blacklist.TokenVerifySerializer',
 }
 
+# Filtro en memoria de la lista negra de tokens (user_control/blacklist.py): cada
+# proceso relee las revocaciones nuevas como mucho cada TOKEN_BLACKLIST_SYNC_SECONDS.
+# Las revocaciones hechas en el mismo proceso se aplican al instante.
+TOKEN_BLACKLIST_SYNC_SECONDS = 1
+TOKEN_BLACKLIST_SYNC_OVERLAP = 1000
+
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
@@ -155,4 +219,111 @@ CORS_ALLOWED_ORIGINS = [
 
 CORS_ALLOW_CREDENTIALS = True
 
+CORS_ALLOW_HEADERS = (
+    *default_headers,
+    'idempotency-key',
+)
+
+# Tiempo durante el cual una Idempotency-Key reenviada devuelve la respuesta guardada.
+# Las claves vencidas se eliminan con `python manage.py purge_idempotency_keys`.
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# Caché en memoria del endpoint de escaneo (SKU/código de barras) del POS.
+# El TTL acota cuánto puede tardar otro proceso en ver un cambio de precio o stock.
+SCAN_CACHE_SIZE = 10000
+SCAN_CACHE_TTL = 5
+
+# Horizonte del comando archive_movements: los movimientos más antiguos pasan a
+# ArchivedMovement y solo se consultan con ?include_archived=true.
+MOVEMENT_ARCHIVE_AFTER_DAYS = 365
+
+# process_tenant_deletions: una solicitud en curso cuyo proceso no renovó su
+# heartbeat en este tiempo se considera abandonada y otra ejecución la retoma.
+TENANT_DELETION_LEASE_SECONDS = 300
+
+# Canal de eventos en vivo (SSE) servido por Inventory360/asgi.py. El broker por
+# defecto reparte dentro del proceso; con varios workers se reemplaza por uno
+# compartido que implemente control.realtime.BaseBroker.
+REALTIME_BROKER = 'control.realtime.InProcessBroker'
+REALTIME_STREAM_PATH = '/api/control/stream/'
+REALTIME_HEARTBEAT_SECONDS = 15
+# Vida de los tickets de un solo uso con los que el navegador abre el stream.
+REALTIME_TICKET_SECONDS = 30
+
+# Feed incremental de cambios (changes/?since=<cursor>). El cursor sigue el orden
+# de confirmación (control/changefeed.py). Las entradas más antiguas que la
+# retención se eliminan con `python manage.py purge_change_log`.
+CHANGE_FEED_PAGE_SIZE = 500
+CHANGE_FEED_RETENTION_DAYS = 30
+
+# Sincronización de lotes offline del POS (sync/movements/). Política por defecto
+# cuando una venta deja el stock negativo: 'reject', 'allow_negative' o 'adjust'.
+OFFLINE_SYNC_DEFAULT_POLICY = 'reject'
+OFFLINE_SYNC_MAX_ITEMS = 5000
+
+# Caché por proceso de empresas, sucursales, categorías y proveedores ya
+# serializados. La versión por empresa vive en la caché compartida (CACHES) y se
+# relee como mucho cada REFERENCE_CACHE_VERSION_CHECK_SECONDS.
+REFERENCE_CACHE_SIZE = 5000
+REFERENCE_CACHE_TTL = 300
+REFERENCE_CACHE_VERSION_CHECK_SECONDS = 2
+
+# Artefactos del esquema OpenAPI (`python manage.py build_openapi_schema`). La versión
+# del código se toma de INVENTORY360_VERSION o, si no está, de un hash del código fuente.
+OPENAPI_SCHEMA_DIR = BASE_DIR / 'openapi'
+
+# Control de admisión (control/throttling.py). Costo en tokens por clase de
+# endpoint; buckets por empresa y por usuario guardados en la caché compartida
+# (CACHES); las solicitudes anónimas (login, refresh) usan un bucket propio por
+# IP, THROTTLE_AUTH_BUCKET. Las lecturas no pueden bajar de THROTTLE_WRITE_RESERVE
+# del bucket ni usar los lugares reservados a escrituras, para que el POS siga
+# vendiendo mientras otros generan reportes.
+THROTTLE_COSTS = {
+    'detail': 1,
+    'list': 2,
+    'write': 1,
+    'report': 10,
+    'bulk': 20,
+}
+THROTTLE_BUSINESS_BUCKET = {'capacity': 600, 'refill_per_second': 20}
+THROTTLE_USER_BUCKET = {'capacity': 200, 'refill_per_second': 5}
+THROTTLE_AUTH_BUCKET = {'capacity': 60, 'refill_per_second': 1}
+THROTTLE_WRITE_RESERVE = 0.2
+THROTTLE_MAX_CONCURRENCY = 64
+THROTTLE_RESERVED_FOR_WRITES = 16
+THROTTLE_BUSINESS_MAX_CONCURRENCY = 8
+# Un lugar no devuelto (proceso caído) vence a los THROTTLE_SLOT_TTL segundos.
+THROTTLE_SLOT_TTL = 120
+THROTTLE_BUSY_RETRY_AFTER = 2
+
+# Tope de períodos por serie en reports/sales/ (p. ej. ~2,7 años con granularidad diaria).
+REPORT_MAX_BUCKETS = 1000
+
+# Procesos de `python manage.py precompute_reports`; None usa todos los núcleos.
+REPORT_PRECOMPUTE_WORKERS = None
+
+# Nodo de sucursal (control/edge.py). Se configura con variables de entorno: URL del
+# central, sucursal y usuario del central con el que se sincroniza. edge_sync envía
+# los movimientos locales a sync/movements/ y trae los cambios de changes/ en lotes
+# de EDGE_SYNC_BATCH_SIZE; el estado de la sincronización se guarda en EDGE_STATE_PATH.
+EDGE_CENTRAL_URL = os.environ.get('EDGE_CENTRAL_URL', '').rstrip('/')
+EDGE_BRANCH_ID = int(os.environ.get('EDGE_BRANCH_ID') or 0) or None
+EDGE_SYNC_EMAIL = os.environ.get('EDGE_SYNC_EMAIL', '')
+EDGE_SYNC_PASSWORD = os.environ.get('EDGE_SYNC_PASSWORD', '')
+EDGE_SYNC_BATCH_SIZE = int(os.environ.get('EDGE_SYNC_BATCH_SIZE') or 500)
+EDGE_SYNC_INTERVAL = int(os.environ.get('EDGE_SYNC_INTERVAL') or 30)
+EDGE_SYNC_TIMEOUT = 30
+EDGE_STATE_PATH = os.environ.get('EDGE_STATE_PATH') or f"{DATABASES['default']['NAME']}.sync.json"
+# PRAGMAs de cada conexión SQLite: WAL permite leer mientras se escribe y
+# synchronous=NORMAL evita un fsync por transacción.
+EDGE_SQLITE_PRAGMAS = (
+    ['journal_mode=WAL', 'synchronous=NORMAL', 'busy_timeout=20000', 'temp_store=MEMORY'] if EDGE_MODE else []
+)
+
+# Listados del admin sobre tablas grandes (control/admin.py): sin filtros se usa el
+# conteo estimado de la base (MySQL/PostgreSQL) si supera este tope; con filtros se
+# cuenta como mucho hasta el tope. Ese conteo aproximado solo se muestra: las páginas
+# posteriores se siguen pudiendo recorrer.
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
 AUTH_USER_MODEL = 'user_control.User'
\ No newline at end of file
@@ -1,10 +1,227 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.paginator import EmptyPage, Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from .models import *
 
-# Register your models here.
 
-admin.site.register(Business)
-admin.site.register(Branch)
-admin.site.register(Product)
-admin.site.register(Movement)
-admin.site.register(Stock)
\ No newline at end of file
+def estimated_count(queryset):
+    """Cantidad aproximada de filas de la tabla según las estadísticas de la base, o None."""
+    connection = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s",
+                [table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] and row[0] > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Evita el COUNT(*) exacto sobre tablas de millones de filas: sin filtros usa el
+    conteo estimado; con filtros cuenta hasta ADMIN_EXACT_COUNT_LIMIT + 1.
+
+    En ambos casos el conteo es aproximado y solo se muestra: las páginas
+    posteriores siguen navegables y una página se rechaza únicamente si sale vacía.
+    """
+
+    @cached_property
+    def _counted(self):
+        queryset = self.object_list
+        limit = settings.ADMIN_EXACT_COUNT_LIMIT
+        if not queryset.query.where:
+            estimate = estimated_count(queryset)
+            if estimate and estimate > limit:
+                return estimate, True
+        count = queryset.order_by()[:limit + 1].count()
+        return count, count > limit
+
+    @property
+    def count(self):
+        return self._counted[0]
+
+    @property
+    def approximate(self):
+        return self._counted[1]
+
+    def validate_number(self, number):
+        try:
+            return super().validate_number(number)
+        except EmptyPage:
+            # Más allá del conteo aproximado puede haber filas: lo decide page().
+            if not self.approximate or int(number) < 1:
+                raise
+            return int(number)
+
+    def page(self, number):
+        if not self.approximate:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page])
+        if not object_list and number > 1:
+            raise EmptyPage("Esa página no contiene resultados.")
+        return self._get_page(object_list, number, self)
+
+    def get_elided_page_range(self, number=1, *, on_each_side=3, on_ends=2):
+        if not self.approximate:
+            yield from super().get_elided_page_range(number, on_each_side=on_each_side, on_ends=on_ends)
+            return
+        # Sin una última página confiable: las primeras, las vecinas de la actual y la siguiente.
+        number = self.validate_number(number)
+        if number - on_each_side > on_ends + 1:
+            yield from range(1, on_ends + 1)
+            yield self.ELLIPSIS
+            yield from range(number - on_each_side, number + 1)
+        else:
+            yield from range(1, number + 1)
+        yield from range(number + 1, max(number + 1, min(number + on_each_side, self.num_pages)) + 1)
+        yield self.ELLIPSIS
+
+
+class BranchFilter(admin.SimpleListFilter):
+    """Filtro por sucursal que arma las opciones en una consulta (Branch.__str__ lee la empresa)."""
+    title = 'branch'
+    parameter_name = 'branch'
+
+    def lookups(self, request, model_admin):
+        branches = Branch.objects.order_by('business__name', 'name').values_list('id', 'name', 'business__name')
+        return [(str(pk), f"{name} - {business}") for pk, name, business in branches]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(branch_id=self.value())
+        return queryset
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(Business)
+class BusinessAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'phone', 'created_at', 'deletion_requested_at')
+    search_fields = ('name',)
+
+
+@admin.register(Branch)
+class BranchAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'business')
+    search_fields = ('name', 'business__name')
+    autocomplete_fields = ('business',)
+
+    def get_queryset(self, request):
+        # En lugar de list_select_related, para que también lo usen las opciones del
+        # autocompletado, que muestran __str__ (con la empresa).
+        return super().get_queryset(request).select_related('business')
+
+
+@admin.register(Category)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'business')
+    list_select_related = ('business',)
+    search_fields = ('name',)
+    autocomplete_fields = ('business',)
+
+
+@admin.register(Supplier)
+class SupplierAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'business')
+    list_select_related = ('business',)
+    search_fields = ('name',)
+    autocomplete_fields = ('business',)
+
+
+@admin.register(Product)
+class ProductAdmin(LargeTableAdmin):
+    list_display = ('id', 'name', 'sku', 'price', 'category_name', 'business_name')
+    search_fields = ('name', '=sku')
+    autocomplete_fields = ('business', 'category')
+
+    def get_queryset(self, request):
+        # Ver BranchAdmin.get_queryset.
+        return super().get_queryset(request).select_related('business', 'category')
+
+    @admin.display(description='category', ordering='category__name')
+    def category_name(self, obj):
+        return obj.category.name if obj.category else '-'
+
+    @admin.display(description='business', ordering='business__name')
+    def business_name(self, obj):
+        return obj.business.name
+
+
+class MovementAdmin(LargeTableAdmin):
+    list_display = ('id', 'date', 'movement_type', 'product_name', 'branch_name', 'branch_from_name', 'quantity',
+                    'unit_price', 'flagged')
+    # Las empresas de las sucursales las usa Movement.__str__ (casilla de acciones).
+    list_select_related = ('product', 'branch__business', 'branch_from__business')
+    list_filter = ('movement_type', BranchFilter)
+    date_hierarchy = 'date'
+    ordering = ('-date', '-id')
+    autocomplete_fields = ('product', 'branch', 'branch_from', 'supplier')
+    raw_id_fields = ('document', 'user')
+
+    @admin.display(description='product', ordering='product__name')
+    def product_name(self, obj):
+        return obj.product.name
+
+    @admin.display(description='branch')
+    def branch_name(self, obj):
+        return obj.branch.name
+
+    @admin.display(description='from')
+    def branch_from_name(self, obj):
+        return obj.branch_from.name if obj.branch_from else '-'
+
+
+admin.site.register(Movement, MovementAdmin)
+
+
+@admin.register(ArchivedMovement)
+class ArchivedMovementAdmin(MovementAdmin):
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Stock)
+class StockAdmin(LargeTableAdmin):
+    list_display = ('id', 'product_name', 'branch_name', 'quantity', 'minimum_stock')
+    list_select_related = ('product', 'branch')
+    list_filter = (BranchFilter,)
+    search_fields = ('product__name', '=product__sku')
+    autocomplete_fields = ('product', 'branch')
+
+    @admin.display(description='product', ordering='product__name')
+    def product_name(self, obj):
+        return obj.product.name
+
+    @admin.display(description='branch')
+    def branch_name(self, obj):
+        return obj.branch.name
+
+
+@admin.register(StockValuation)
+class StockValuationAdmin(StockAdmin):
+    list_display = ('id', 'product_name', 'branch_name', 'quantity', 'average_cost', 'average_value', 'fifo_value',
+                    'updated_at')
+
+
+@admin.register(TenantDeletion)
+class TenantDeletionAdmin(admin.ModelAdmin):
+    list_display = ('business_name', 'business_id', 'status', 'current_step', 'rows_deleted', 'requested_at',
+                    'heartbeat_at', 'finished_at')
+    list_filter = ('status',)
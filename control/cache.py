@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.db import transaction
+
+
+class LRUCache:
+    """
+    Caché LRU en memoria del proceso, acotada por tamaño y opcionalmente por TTL.
+    Cada entrada puede llevar etiquetas (por ejemplo ('product', 7)) para poder
+    invalidar de una vez todas las entradas que dependen de una misma fila.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._tags = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value, _ = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                self._remove(key)
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, tags=()):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (expires_at, value, tuple(tags))
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def invalidate_tag(self, tag):
+        with self._lock:
+            for key in list(self._tags.get(tag, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def _remove(self, key):
+        _, _, tags = self._data.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+scan_cache = LRUCache(maxsize=settings.SCAN_CACHE_SIZE, ttl=settings.SCAN_CACHE_TTL)
+
+
+def invalidate_scanned_products(product_ids):
+    """
+    Invalida las lecturas de escaneo de los productos indicados. Se invalida ya
+    y otra vez al confirmar la transacción, para que una lectura concurrente
+    hecha antes del commit no deje en caché el valor anterior.
+    """
+    product_ids = list(product_ids)
+
+    def invalidate():
+        for product_id in product_ids:
+            scan_cache.invalidate_tag(('product', product_id))
+
+    invalidate()
+    transaction.on_commit(invalidate)
@@ -0,0 +1,123 @@
+"""
+Feed incremental de cambios (changes/?since=<cursor>).
+
+Las entradas se graban sin número en la transacción de la escritura que las
+origina. Un id autoincremental no sirve de cursor: una transacción larga (una
+transferencia grande, un lote de sincronización) puede confirmar entradas con
+ids menores que otras ya servidas, y el cliente las saltearía para siempre.
+Por eso el número (`sequence`) se asigna al leer, con el contador de la empresa
+bloqueado, solo a las entradas que ya se ven confirmadas: las que confirmen más
+tarde reciben números mayores que cualquier cursor ya entregado.
+"""
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Min
+from .models import Branch, Category, ChangeFeedSequence, ChangeLogEntry, Product, Stock, Supplier
+
+PUBLISH_BATCH_SIZE = 5000
+
+# Columnas compactas que se envían en cada upsert, por entidad.
+FEED_FIELDS = {
+    'product': (Product, ['id', 'name', 'description', 'price', 'sku', 'category_id']),
+    'stock': (Stock, ['id', 'product_id', 'branch_id', 'quantity', 'minimum_stock']),
+    'category': (Category, ['id', 'name', 'description']),
+    'branch': (Branch, ['id', 'name', 'address', 'phone']),
+    'supplier': (Supplier, ['id', 'name', 'contact_person', 'phone', 'email']),
+}
+
+
+def record_changes(business_id, entity, object_ids, branch_id=None, deleted=False):
+    """Registra cambios en la misma transacción que la escritura que los origina."""
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(business_id=business_id, entity=entity, object_id=object_id, branch_id=branch_id, deleted=deleted)
+        for object_id in object_ids
+    ])
+
+
+def record_stock_changes(business_id, stocks):
+    ChangeLogEntry.objects.bulk_create([
+        ChangeLogEntry(business_id=business_id, entity='stock', object_id=stock.id, branch_id=stock.branch_id)
+        for stock in stocks
+    ])
+
+
+def _compact(value):
+    return str(value) if isinstance(value, Decimal) else value
+
+
+def publish(business_id):
+    """
+    Numera las entradas confirmadas de la empresa que aún no tienen número y
+    devuelve el último número asignado. Las filas de transacciones en curso se
+    saltean (SKIP LOCKED) en lugar de esperarlas: se numeran en otra llamada.
+    """
+    with transaction.atomic():
+        counter, _ = ChangeFeedSequence.objects.select_for_update().get_or_create(business_id=business_id)
+        while True:
+            ids = list(
+                ChangeLogEntry.objects.select_for_update(skip_locked=True)
+                .filter(business_id=business_id, sequence__isnull=True)
+                .order_by('id').values_list('id', flat=True)[:PUBLISH_BATCH_SIZE]
+            )
+            if not ids:
+                break
+            entries = []
+            for entry_id in ids:
+                counter.last_sequence += 1
+                entries.append(ChangeLogEntry(id=entry_id, sequence=counter.last_sequence))
+            ChangeLogEntry.objects.bulk_update(entries, ['sequence'], batch_size=1000)
+            if len(ids) < PUBLISH_BATCH_SIZE:
+                break
+        counter.save(update_fields=['last_sequence'])
+    return counter.last_sequence
+
+
+def build_page(business_id, since, limit, branch_id=None, entities=None):
+    """
+    Devuelve los cambios con número > since, compactados: por cada objeto solo
+    se envía su estado actual (upsert) o un tombstone si ya no existe.
+    `reset` indica que el cursor es anterior a la retención y el cliente debe
+    descargar todo de nuevo.
+    """
+    last = publish(business_id)
+    queryset = ChangeLogEntry.objects.filter(business_id=business_id, sequence__gt=since)
+    if entities:
+        queryset = queryset.filter(entity__in=entities)
+    entries = list(queryset.order_by('sequence').values('sequence', 'entity', 'object_id', 'branch_id', 'deleted')[:limit + 1])
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Las entradas de la empresa entre el cursor y la más antigua que queda se purgaron.
+    oldest = ChangeLogEntry.objects.filter(
+        business_id=business_id, sequence__isnull=False,
+    ).aggregate(oldest=Min('sequence'))['oldest'] or last + 1
+    reset = bool(since) and since < oldest - 1
+
+    latest = {}
+    for entry in entries:
+        if branch_id is not None and entry['entity'] == 'stock' and entry['branch_id'] != branch_id:
+            continue
+        latest[(entry['entity'], entry['object_id'])] = entry['deleted']
+
+    changes = {}
+    for entity, (model, fields) in FEED_FIELDS.items():
+        ids = [object_id for (kind, object_id), deleted in latest.items() if kind == entity and not deleted]
+        tombstones = [object_id for (kind, object_id), deleted in latest.items() if kind == entity and deleted]
+        upserts = []
+        if ids:
+            rows = {row['id']: row for row in model.objects.filter(id__in=ids).values(*fields)}
+            for object_id in ids:
+                row = rows.get(object_id)
+                if row is None:
+                    tombstones.append(object_id)
+                else:
+                    upserts.append({key: _compact(value) for key, value in row.items()})
+        if upserts or tombstones:
+            changes[entity] = {'upserts': upserts, 'deletes': sorted(tombstones)}
+
+    return {
+        'cursor': entries[-1]['sequence'] if entries else since,
+        'has_more': has_more,
+        'reset': reset,
+        'changes': changes,
+    }
@@ -0,0 +1,298 @@
+"""
+Nodo de sucursal (INVENTORY360_MODE=edge).
+
+El mismo proyecto corre en la sucursal sobre un SQLite local en modo WAL con el
+catálogo y el stock de EDGE_BRANCH_ID, y atiende al POS sin depender del enlace
+con el central. La sincronización es por lotes y la hace edge_sync:
+- push: los movimientos locales (ventas, compras y ajustes) se envían a
+  sync/movements/ del central. Cada movimiento recibe al grabarse un client_id
+  con un UUID, así que reenviar un lote tras un corte no duplica nada, ni
+  siquiera después de reiniciar el nodo con una base nueva. Los que el central
+  rechaza quedan pendientes y se reenvían en cada push;
+- pull: los cambios de catálogo y stock se traen de changes/ desde el último
+  cursor. El stock de un producto con movimientos locales aún no enviados no
+  se pisa: manda el valor local hasta el siguiente push.
+
+El nodo se inicia con una foto de la sucursal exportada en el central
+(export_edge_snapshot), que incluye el cursor desde el que seguir. El catálogo,
+los documentos y las transferencias se administran en el central: en el nodo
+solo se registran ventas, compras y ajustes (CentralWritesOnly).
+"""
+import json
+import os
+import urllib.error
+import urllib.request
+import uuid
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import serializers
+from django.db import transaction
+from django.db.models import Q
+from rest_framework.permissions import SAFE_METHODS, BasePermission
+from .changefeed import FEED_FIELDS, publish
+from .models import Branch, Business, Category, Movement, Product, Stock, Supplier
+
+PUSHED_TYPES = ('sale', 'purchase', 'adjustment')
+
+
+class EdgeSyncError(Exception):
+    pass
+
+
+class CentralWritesOnly(BasePermission):
+    """
+    En el nodo de sucursal rechaza las escrituras de lo que no viaja al central
+    (catálogo, documentos, transferencias, ediciones y bajas de movimientos):
+    se perderían o el siguiente pull las pisaría.
+    """
+    message = "Esta operación se hace en el central, no en el nodo de sucursal."
+
+    def has_permission(self, request, view):
+        return not settings.EDGE_MODE or request.method in SAFE_METHODS
+
+
+def new_client_id():
+    return f"edge-{uuid.uuid4().hex}"
+
+
+def configure_sqlite(connection):
+    if connection.vendor != 'sqlite' or not settings.EDGE_SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for pragma in settings.EDGE_SQLITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma}")
+
+
+def load_state():
+    try:
+        with open(settings.EDGE_STATE_PATH) as state_file:
+            return json.load(state_file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_state(state):
+    # Escritura atómica: un corte a mitad de camino no deja el archivo truncado.
+    temporary = f"{settings.EDGE_STATE_PATH}.tmp"
+    with open(temporary, 'w') as state_file:
+        json.dump(state, state_file)
+    os.replace(temporary, settings.EDGE_STATE_PATH)
+
+
+def export_snapshot(branch):
+    """
+    Foto de una sucursal para iniciar un nodo: empresa, sucursales, categorías,
+    proveedores, usuarios, los productos que maneja la sucursal y su stock.
+    El cursor se toma antes de leer, así los cambios posteriores se vuelven a
+    aplicar (son upserts) en lugar de perderse.
+    """
+    cursor = publish(branch.business_id)
+    User = get_user_model()
+    business_id = branch.business_id
+    product_ids = Stock.objects.filter(branch=branch).values('product_id')
+    querysets = [
+        Business.objects.filter(id=business_id),
+        Branch.objects.filter(business_id=business_id),
+        Category.objects.filter(business_id=business_id),
+        Supplier.objects.filter(business_id=business_id),
+        User.objects.filter(business_id=business_id).filter(Q(role='admin') | Q(branch=branch)),
+        Product.objects.filter(business_id=business_id, id__in=product_ids),
+        Stock.objects.filter(branch=branch),
+    ]
+    objects = []
+    for queryset in querysets:
+        objects.extend(json.loads(serializers.serialize('json', queryset.order_by('pk'))))
+    return {'business_id': business_id, 'branch_id': branch.id, 'cursor': cursor, 'objects': objects}
+
+
+def load_snapshot(snapshot):
+    if Movement.objects.exists():
+        raise EdgeSyncError("La base local ya tiene movimientos; la foto solo se carga en un nodo nuevo.")
+    with transaction.atomic():
+        for obj in serializers.deserialize('json', json.dumps(snapshot['objects'])):
+            obj.save()
+    save_state({
+        'business_id': snapshot['business_id'],
+        'branch_id': snapshot['branch_id'],
+        'cursor': snapshot['cursor'],
+        'pushed_movement_id': 0,
+        'retry': [],
+    })
+    return len(snapshot['objects'])
+
+
+class CentralClient:
+    """Cliente HTTP mínimo (urllib) contra la API del central, con JWT."""
+
+    def __init__(self, base_url, email, password, timeout):
+        if not base_url:
+            raise EdgeSyncError("Falta EDGE_CENTRAL_URL.")
+        self.base_url = base_url
+        self.email = email
+        self.password = password
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, method, path, payload=None, retry=True):
+        if self.token is None and path != '/user-control/login/':
+            self.login()
+        body = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        request.add_header('Accept', 'application/json')
+        if body is not None:
+            request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header('Authorization', f"Bearer {self.token}")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read() or b'null')
+        except urllib.error.HTTPError as exc:
+            if exc.code == 401 and retry and self.token:
+                self.token = None
+                return self.request(method, path, payload, retry=False)
+            raise EdgeSyncError(f"{method} {path}: {exc.code} {exc.read()[:500].decode(errors='replace')}")
+        except urllib.error.URLError as exc:
+            raise EdgeSyncError(f"No se pudo contactar al central: {exc.reason}")
+
+    def login(self):
+        tokens = self.request('POST', '/user-control/login/', {'email': self.email, 'password': self.password})
+        self.token = tokens['access']
+
+
+def _item(movement):
+    if not movement.client_id:
+        # Movimientos grabados antes de que el nodo asignara client_id al crearlos.
+        movement.client_id = new_client_id()
+        Movement.objects.filter(id=movement.id).update(client_id=movement.client_id)
+    return {
+        # Estable entre reintentos: el central deduplica por (sucursal, client_id).
+        'client_id': movement.client_id,
+        'client_timestamp': (movement.client_timestamp or movement.date).isoformat(),
+        'movement_type': movement.movement_type,
+        'product_id': movement.product_id,
+        'quantity': movement.quantity,
+        'unit_price': str(movement.unit_price) if movement.unit_price is not None else None,
+        'supplier_id': movement.supplier_id,
+    }
+
+
+def _send(client, state, movements, log):
+    """Envía un lote y devuelve los ids de los movimientos que el central rechazó."""
+    items = [_item(m) for m in movements]
+    ids = {item['client_id']: m.id for item, m in zip(items, movements)}
+    result = client.request('POST', '/api/control/sync/movements/', {
+        'branch_id': state['branch_id'], 'policy': 'allow_negative', 'items': items,
+    })
+    rejected = []
+    for item in result['results']:
+        if item['status'] == 'rejected':
+            rejected.append(ids[item['client_id']])
+            if log:
+                log(f"Movimiento {item['client_id']} rechazado por el central: {item.get('error')}")
+    return rejected
+
+
+def push(client, state, batch_size, log=None):
+    """
+    Envía primero los movimientos rechazados en pushes anteriores y después los
+    posteriores a pushed_movement_id. Con la política allow_negative: la venta
+    ya ocurrió en la sucursal y el central no debe rechazarla ni inventar
+    ajustes. Los rechazados (p. ej. un producto dado de baja en el central)
+    quedan en state['retry'] hasta que el central los acepte o se borren
+    localmente; el stock local de esos productos no se pisa mientras tanto.
+    """
+    pushed = 0
+    # Los que ya no existen (borrados en el nodo) salen de la lista.
+    retry = list(Movement.objects.filter(id__in=state.get('retry', [])).order_by('id'))
+    state['retry'] = []
+    for start in range(0, len(retry), batch_size):
+        batch = retry[start:start + batch_size]
+        rejected = _send(client, state, batch, log)
+        state['retry'] += rejected
+        pushed += len(batch) - len(rejected)
+    save_state(state)
+    while True:
+        movements = list(
+            Movement.objects.filter(id__gt=state['pushed_movement_id'], branch_id=state['branch_id'])
+            .order_by('id')[:batch_size]
+        )
+        if not movements:
+            break
+        sent = [m for m in movements if m.movement_type in PUSHED_TYPES]
+        if sent:
+            rejected = _send(client, state, sent, log)
+            state['retry'] += rejected
+            pushed += len(sent) - len(rejected)
+        skipped = len(movements) - len(sent)
+        if skipped and log:
+            log(f"{skipped} transferencias locales no se envían: se registran en el central.")
+        state['pushed_movement_id'] = movements[-1].id
+        save_state(state)
+    if state['retry'] and log:
+        log(f"{len(state['retry'])} movimientos rechazados por el central quedan pendientes de reenvío.")
+    return pushed
+
+
+def _fetch_products(client, state, product_ids):
+    """Productos que la sucursal empezó a manejar en el central y aún no están en el nodo."""
+    for product_id in sorted(product_ids):
+        row = client.request('GET', f"/api/control/products/{product_id}/")
+        category = row.get('category')
+        Product.objects.update_or_create(id=product_id, defaults={
+            'name': row['name'], 'description': row['description'], 'price': row['price'], 'sku': row.get('sku'),
+            'category_id': category['id'] if isinstance(category, dict) else category,
+            'business_id': state['business_id'],
+        })
+
+
+def _apply_changes(client, state, changes):
+    pending = set(
+        Movement.objects.filter(Q(id__gt=state['pushed_movement_id']) | Q(id__in=state.get('retry', [])))
+        .values_list('product_id', flat=True)
+    )
+    stocks = [row for row in changes.get('stock', {}).get('upserts', []) if row['branch_id'] == state['branch_id']]
+    known = set(Product.objects.filter(id__in=[row['product_id'] for row in stocks]).values_list('id', flat=True))
+    upserted = {row['id'] for row in changes.get('product', {}).get('upserts', [])}
+    # Antes que los productos y el stock, que las referencian.
+    for entity in ('category', 'branch', 'supplier', 'product'):
+        model, fields = FEED_FIELDS[entity]
+        entry = changes.get(entity)
+        if not entry:
+            continue
+        for row in entry['upserts']:
+            defaults = {field: value for field, value in row.items() if field != 'id'}
+            defaults['business_id'] = state['business_id']
+            model.objects.update_or_create(id=row['id'], defaults=defaults)
+        deletes = model.objects.filter(id__in=entry['deletes'])
+        if entity == 'product':
+            deletes = deletes.exclude(id__in=pending)
+        deletes.delete()
+    _fetch_products(client, state, {row['product_id'] for row in stocks} - known - upserted)
+    # El stock se identifica por (producto, sucursal): los ids locales no son los del
+    # central. Las bajas de stock no se replican por el mismo motivo.
+    for row in stocks:
+        if row['product_id'] in pending:
+            continue
+        Stock.objects.update_or_create(
+            product_id=row['product_id'], branch_id=row['branch_id'],
+            defaults={'quantity': row['quantity'], 'minimum_stock': row['minimum_stock']},
+        )
+
+
+def pull(client, state, batch_size):
+    """Aplica los cambios del central desde el cursor guardado, página por página."""
+    applied = 0
+    while True:
+        page = client.request('GET', f"/api/control/changes/?since={state['cursor']}&limit={batch_size}")
+        if page['reset']:
+            raise EdgeSyncError(
+                "El cursor es anterior a la retención del central: exporta una foto nueva "
+                "con export_edge_snapshot y vuelve a iniciar el nodo."
+            )
+        with transaction.atomic():
+            _apply_changes(client, state, page['changes'])
+        applied += sum(len(c['upserts']) + len(c['deletes']) for c in page['changes'].values())
+        state['cursor'] = page['cursor']
+        save_state(state)
+        if not page['has_more']:
+            return applied
@@ -0,0 +1,86 @@
+from datetime import datetime, time, timedelta
+import django_filters
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from .models import Document, Movement
+
+
+def _parse_bound(value, end=False):
+    """
+    Convierte 'YYYY-MM-DD' o un datetime ISO en un instante con zona horaria.
+    Para date_to con una fecha sin hora se devuelve el inicio del día siguiente,
+    de forma que el filtro siga siendo un rango (date < límite) sobre el índice.
+    """
+    try:
+        day = parse_date(value)
+        parsed = None if day else parse_datetime(value)
+    except ValueError:
+        day = parsed = None
+    if day is None and parsed is None:
+        raise ValidationError({"date": f"Fecha inválida: '{value}'. Usa YYYY-MM-DD o ISO 8601."})
+    if day is not None:
+        if end:
+            day += timedelta(days=1)
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _is_plain_date(value):
+    try:
+        return parse_date(value) is not None
+    except ValueError:
+        return False
+
+
+class MovementFilter(django_filters.FilterSet):
+    date_from = django_filters.CharFilter(method='filter_date_from')
+    date_to = django_filters.CharFilter(method='filter_date_to')
+    product = django_filters.NumberFilter(field_name='product_id')
+    branch = django_filters.NumberFilter(field_name='branch_id')
+    branch_from = django_filters.NumberFilter(field_name='branch_from_id')
+    supplier = django_filters.NumberFilter(field_name='supplier_id')
+    document = django_filters.NumberFilter(field_name='document_id')
+    user = django_filters.NumberFilter(field_name='user_id')
+    quantity_min = django_filters.NumberFilter(field_name='quantity', lookup_expr='gte')
+    quantity_max = django_filters.NumberFilter(field_name='quantity', lookup_expr='lte')
+    amount_min = django_filters.NumberFilter(method='filter_amount_min')
+    amount_max = django_filters.NumberFilter(method='filter_amount_max')
+
+    class Meta:
+        model = Movement
+        fields = ['movement_type']
+
+    def filter_date_from(self, queryset, name, value):
+        return queryset.filter(date__gte=_parse_bound(value))
+
+    def filter_date_to(self, queryset, name, value):
+        bound = _parse_bound(value, end=True)
+        if _is_plain_date(value):
+            return queryset.filter(date__lt=bound)
+        return queryset.filter(date__lte=bound)
+
+    def filter_amount_min(self, queryset, name, value):
+        return queryset.alias(amount=F('unit_price') * F('quantity')).filter(amount__gte=value)
+
+    def filter_amount_max(self, queryset, name, value):
+        return queryset.alias(amount=F('unit_price') * F('quantity')).filter(amount__lte=value)
+
+
+class DocumentFilter(django_filters.FilterSet):
+    date_from = django_filters.CharFilter(method='filter_date_from')
+    date_to = django_filters.CharFilter(method='filter_date_to')
+    amount_min = django_filters.NumberFilter(field_name='total_amount', lookup_expr='gte')
+    amount_max = django_filters.NumberFilter(field_name='total_amount', lookup_expr='lte')
+    lines_min = django_filters.NumberFilter(field_name='line_count', lookup_expr='gte')
+    lines_max = django_filters.NumberFilter(field_name='line_count', lookup_expr='lte')
+
+    class Meta:
+        model = Document
+        fields = ['document_type', 'document_number']
+
+    filter_date_from = MovementFilter.filter_date_from
+    filter_date_to = MovementFilter.filter_date_to
@@ -0,0 +1,83 @@
+import hashlib
+import json
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+
+def _request_hash(request):
+    payload = json.dumps(request.data, sort_keys=True, default=str)
+    raw = f"{request.method}:{request.path}:{payload}".encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _replay(record):
+    response = Response(record.response_body, status=record.status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def run_idempotent(request, handler):
+    """
+    Ejecuta handler() una sola vez por (usuario, Idempotency-Key).
+    Un reintento con la misma clave devuelve la respuesta guardada sin volver a
+    validar ni tocar el stock.
+
+    La fila de la clave, el handler y la respuesta guardada van en una sola
+    transacción: si el proceso muere a mitad de camino no queda nada confirmado
+    y el reintento vuelve a ejecutar. Un duplicado concurrente espera en la
+    restricción única hasta que la primera termina y recibe su respuesta.
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return handler()
+    if len(key) > 255:
+        return Response({"error": "La cabecera Idempotency-Key no puede superar los 255 caracteres."}, status=status.HTTP_400_BAD_REQUEST)
+
+    request_hash = _request_hash(request)
+    now = timezone.now()
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                # Las vencidas y las pendientes que quedaron de versiones que
+                # confirmaban la clave antes de ejecutar el handler.
+                IdempotencyKey.objects.filter(user=request.user, key=key).filter(
+                    Q(expires_at__lte=now) | Q(status_code__isnull=True),
+                ).delete()
+                record = IdempotencyKey.objects.create(
+                    user=request.user,
+                    key=key,
+                    request_hash=request_hash,
+                    expires_at=now + settings.IDEMPOTENCY_KEY_TTL,
+                )
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=request.user, key=key).first()
+            if record is None or record.status_code is None:
+                response = Response({"error": "Ya hay una solicitud en curso con esta Idempotency-Key."}, status=status.HTTP_409_CONFLICT)
+                response['Retry-After'] = '1'
+                return response
+            if record.request_hash != request_hash:
+                return Response({"error": "La Idempotency-Key ya fue usada con otra solicitud."}, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            return _replay(record)
+
+        response = handler()
+        if response.status_code >= 500:
+            record.delete()
+            return response
+        record.status_code = response.status_code
+        record.response_body = response.data
+        record.save(update_fields=['status_code', 'response_body'])
+    return response
+
+
+class IdempotentCreateMixin:
+    """Soporte de Idempotency-Key para el create() de un ModelViewSet."""
+
+    def create(self, request, *args, **kwargs):
+        return run_idempotent(request, lambda: super(IdempotentCreateMixin, self).create(request, *args, **kwargs))
@@ -0,0 +1,74 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from control.models import Movement, ArchivedMovement, TenantReport
+
+
+class Command(BaseCommand):
+    help = (
+        "Traslada por lotes los movimientos anteriores al horizonte configurado "
+        "(MOVEMENT_ARCHIVE_AFTER_DAYS) a la tabla de archivo. Se niega a hacerlo mientras "
+        "el resumen de ventas de precompute_reports no cubra el mes del corte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.MOVEMENT_ARCHIVE_AFTER_DAYS,
+                            help="Antigüedad mínima, en días, de los movimientos a archivar.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0,
+                            help="Pausa en segundos entre lotes para no saturar la base de datos.")
+        parser.add_argument('--force', action='store_true',
+                            help="Archivar aunque los resúmenes de ventas no cubran el mes del corte.")
+
+    def handle(self, *args, **options):
+        if options['days'] < settings.MOVEMENT_ARCHIVE_AFTER_DAYS:
+            # sales_series solo consulta el archivo para rangos anteriores a ese horizonte.
+            raise CommandError(
+                f"--days no puede ser menor que MOVEMENT_ARCHIVE_AFTER_DAYS ({settings.MOVEMENT_ARCHIVE_AFTER_DAYS})."
+            )
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        lagging = self._lagging_businesses(cutoff)
+        if lagging and not options['force']:
+            raise CommandError(
+                f"Empresas sin resumen de ventas hasta {timezone.localtime(cutoff):%Y-%m} "
+                f"({', '.join(map(str, lagging))}). Ejecutar antes precompute_reports para ese "
+                f"mes, o usar --force."
+            )
+        batch_size = options['batch_size']
+        fields = [f.attname for f in Movement._meta.concrete_fields]
+        archived = 0
+        while True:
+            with transaction.atomic():
+                batch = list(
+                    Movement.objects.select_for_update()
+                    .filter(date__lt=cutoff)
+                    .order_by('id')
+                    .values(*fields)[:batch_size]
+                )
+                if not batch:
+                    break
+                ArchivedMovement.objects.bulk_create([ArchivedMovement(**row) for row in batch])
+                # Borrado directo: los totales derivados ya se mantienen al escribir y
+                # archivar no debe dispararlos de nuevo.
+                Movement.objects.filter(id__in=[row['id'] for row in batch])._raw_delete(Movement.objects.db)
+            archived += len(batch)
+            self.stdout.write(f"{archived} movimientos archivados...")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+        self.stdout.write(self.style.SUCCESS(f"{archived} movimientos anteriores a {cutoff:%Y-%m-%d} archivados."))
+
+    def _lagging_businesses(self, cutoff):
+        """Empresas con movimientos a archivar cuyo último sales_summary no llega al mes del corte."""
+        month = timezone.localtime(cutoff).strftime('%Y-%m')
+        pending = set(
+            Movement.objects.filter(date__lt=cutoff).order_by()
+            .values_list('branch__business_id', flat=True).distinct()
+        )
+        covered = set(
+            TenantReport.objects.filter(business_id__in=pending, kind='sales_summary', period__gte=month)
+            .values_list('business_id', flat=True)
+        )
+        return sorted(pending - covered)
@@ -0,0 +1,88 @@
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from control.models import Branch, Business, Category, Product, Stock
+from control.services import branch_products
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara el listado de productos de una sucursal (rol 'user') con JOIN + DISTINCT "
+        "contra el semi-join sobre el índice (branch, product) de Stock. Sin --branch "
+        "genera un catálogo sintético dentro de una transacción que se revierte al final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, help="Medir con los datos reales de esta sucursal.")
+        parser.add_argument('--products', type=int, default=50000, help="Productos del catálogo sintético.")
+        parser.add_argument('--branches', type=int, default=10, help="Sucursales del catálogo sintético.")
+        parser.add_argument('--coverage', type=float, default=0.6,
+                            help="Fracción del catálogo que maneja cada sucursal sintética.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--explain', action='store_true', help="Mostrar el plan de cada consulta.")
+
+    def handle(self, *args, **options):
+        if options['branch']:
+            branch = Branch.objects.filter(id=options['branch']).first()
+            if branch is None:
+                raise CommandError(f"No existe la sucursal {options['branch']}.")
+            self.compare(branch, options)
+            return
+        try:
+            with transaction.atomic():
+                branch = self.synthetic_catalog(options)
+                self.compare(branch, options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def synthetic_catalog(self, options):
+        business = Business.objects.create(name='Benchmark surtido', address='-', phone='-')
+        category = Category.objects.create(name=f'Benchmark surtido {business.id}', business=business)
+        branches = Branch.objects.bulk_create([
+            Branch(name=f'Sucursal {i}', address='-', phone='-', business=business) for i in range(options['branches'])
+        ])
+        products = Product.objects.bulk_create([
+            Product(name=f'Producto {i}', description='-', price=1, business=business, category=category)
+            for i in range(options['products'])
+        ], batch_size=5000)
+        rng = random.Random(360)
+        stocks = [
+            Stock(product=product, branch=branch, quantity=10, minimum_stock=5)
+            for branch in branches for product in products if rng.random() < options['coverage']
+        ]
+        Stock.objects.bulk_create(stocks, batch_size=5000)
+        self.stdout.write(f"Catálogo sintético: {len(products)} productos, {len(branches)} sucursales, "
+                          f"{len(stocks)} filas de stock.")
+        return branches[0]
+
+    def compare(self, branch, options):
+        queries = [
+            ('JOIN + DISTINCT', Product.objects.filter(business_id=branch.business_id, stocks__branch=branch).distinct()),
+            ('semi-join (id__in)', branch_products(branch.business_id, branch.id)),
+        ]
+        self.stdout.write(f"Sucursal {branch.id}, mejor de {options['repeat']} ejecuciones")
+        self.stdout.write(f"{'consulta':<22}{'consulta ms':>12}{'count ms':>12}{'filas':>10}")
+        for name, queryset in queries:
+            best_list = best_count = None
+            for _ in range(options['repeat']):
+                # SQL y lectura de filas, sin construir los modelos (igual en ambas).
+                sql, params = queryset.query.sql_with_params()
+                start = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute(sql, params)
+                    rows = len(cursor.fetchall())
+                elapsed = time.perf_counter() - start
+                best_list = elapsed if best_list is None else min(best_list, elapsed)
+                start = time.perf_counter()
+                queryset.count()
+                elapsed = time.perf_counter() - start
+                best_count = elapsed if best_count is None else min(best_count, elapsed)
+            self.stdout.write(f"{name:<22}{best_list * 1000:>12.1f}{best_count * 1000:>12.1f}{rows:>10}")
+            if options['explain']:
+                self.stdout.write(queryset.explain())
@@ -0,0 +1,67 @@
+import gzip
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from control.renderers import ORJSONRenderer, MessagePackRenderer
+
+
+def movement_rows(count):
+    """Filas con la misma forma que la salida de MovementSerializer (producto, sucursales y empresa anidados)."""
+    now = timezone.now()
+    business = {'id': 1, 'name': 'Empresa Uno', 'address': 'Calle Principal 123', 'phone': '123456789',
+                'created_at': now.isoformat(), 'notes': ''}
+    branch = {'id': 1, 'name': 'Casa Central', 'address': 'Calle Principal 123', 'phone': '123456789', 'business': business}
+    rows = []
+    for i in range(count):
+        rows.append({
+            'id': i + 1,
+            'movement_type': 'sale',
+            'quantity': i % 7 + 1,
+            'date': now - timedelta(minutes=i),
+            'product': {
+                'id': i % 500 + 1, 'name': f'Producto {i % 500}', 'description': 'Descripcion del producto',
+                'price': Decimal('1499.90'), 'sku': f'779{i % 500:010d}',
+                'category': {'id': 3, 'name': 'Bebidas', 'description': '', 'business': 1},
+                'business': business, 'stock': 120,
+            },
+            'branch': branch,
+            'branch_from': None,
+            'user': 'cajero@empresa.com',
+            'document': None,
+            'unit_price': Decimal('1499.90'),
+            'supplier': None,
+            'client_id': None,
+            'client_timestamp': None,
+            'flagged': False,
+        })
+    return rows
+
+
+class Command(BaseCommand):
+    help = "Compara tiempo de render y tamaño de respuesta entre renderers para una lista grande de movimientos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        data = movement_rows(options['rows'])
+        renderers = [
+            ('DRF JSONRenderer', JSONRenderer()),
+            ('ORJSONRenderer', ORJSONRenderer()),
+            ('MessagePackRenderer', MessagePackRenderer()),
+        ]
+        self.stdout.write(f"{options['rows']} movimientos, mejor de {options['repeat']} ejecuciones\n")
+        self.stdout.write(f"{'renderer':<22}{'ms':>10}{'bytes':>12}{'gzip bytes':>12}")
+        for name, renderer in renderers:
+            best = None
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                body = renderer.render(data, renderer.media_type, {})
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            compressed = len(gzip.compress(body, compresslevel=6))
+            self.stdout.write(f"{name:<22}{best * 1000:>10.1f}{len(body):>12}{compressed:>12}")
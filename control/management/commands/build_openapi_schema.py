@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from Inventory360.schema import build_artifacts, code_version
+
+
+class Command(BaseCommand):
+    help = "Genera el esquema OpenAPI de la versión actual del código (ejecutar en cada despliegue)."
+
+    def handle(self, *args, **options):
+        for path in build_artifacts():
+            self.stdout.write(f"{path}")
+        self.stdout.write(self.style.SUCCESS(f"Esquema OpenAPI generado para la versión {code_version()}."))
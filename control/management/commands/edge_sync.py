@@ -0,0 +1,57 @@
+import json
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from control.edge import CentralClient, EdgeSyncError, load_snapshot, load_state, pull, push
+
+
+class Command(BaseCommand):
+    help = (
+        "Sincroniza un nodo de sucursal (INVENTORY360_MODE=edge) con el central: envía los "
+        "movimientos locales y trae los cambios de catálogo y stock. Con --bootstrap carga "
+        "primero la foto exportada con export_edge_snapshot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bootstrap', help="Foto JSON exportada en el central (solo en un nodo nuevo).")
+        parser.add_argument('--loop', action='store_true', help="Repetir cada EDGE_SYNC_INTERVAL segundos.")
+        parser.add_argument('--push-only', action='store_true')
+        parser.add_argument('--pull-only', action='store_true')
+
+    def handle(self, *args, **options):
+        if not settings.EDGE_MODE:
+            raise CommandError("edge_sync solo corre en un nodo de sucursal (INVENTORY360_MODE=edge).")
+        if options['bootstrap']:
+            with open(options['bootstrap']) as snapshot_file:
+                snapshot = json.load(snapshot_file)
+            if settings.EDGE_BRANCH_ID and snapshot['branch_id'] != settings.EDGE_BRANCH_ID:
+                raise CommandError(f"La foto es de la sucursal {snapshot['branch_id']}, no de EDGE_BRANCH_ID.")
+            try:
+                count = load_snapshot(snapshot)
+            except EdgeSyncError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(f"Foto cargada: {count} objetos, cursor {snapshot['cursor']}.")
+        state = load_state()
+        if not state:
+            raise CommandError("El nodo no está iniciado: ejecuta edge_sync --bootstrap <foto>.")
+        client = CentralClient(
+            settings.EDGE_CENTRAL_URL, settings.EDGE_SYNC_EMAIL, settings.EDGE_SYNC_PASSWORD, settings.EDGE_SYNC_TIMEOUT,
+        )
+        while True:
+            try:
+                # Primero push: así el stock que devuelve el central ya incluye lo vendido aquí.
+                pushed = 0 if options['pull_only'] else push(
+                    client, state, settings.EDGE_SYNC_BATCH_SIZE, log=lambda msg: self.stderr.write(msg),
+                )
+                pulled = 0 if options['push_only'] else pull(client, state, settings.EDGE_SYNC_BATCH_SIZE)
+                self.stdout.write(
+                    f"{pushed} movimientos enviados, {len(state.get('retry', []))} rechazados pendientes, "
+                    f"{pulled} cambios aplicados (cursor {state['cursor']})."
+                )
+            except EdgeSyncError as exc:
+                if not options['loop']:
+                    raise CommandError(str(exc))
+                self.stderr.write(f"Sincronización fallida, se reintenta: {exc}")
+            if not options['loop']:
+                break
+            time.sleep(settings.EDGE_SYNC_INTERVAL)
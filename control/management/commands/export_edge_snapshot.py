@@ -0,0 +1,27 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from control.edge import export_snapshot
+from control.models import Branch
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta (en el central) la foto con la que se inicia un nodo de sucursal: "
+        "catálogo, stock y usuarios de la sucursal, y el cursor del feed de cambios. "
+        "Incluye los hashes de contraseña de los usuarios: trátala como una credencial."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--branch', type=int, required=True)
+        parser.add_argument('--output', required=True, help="Archivo JSON de salida.")
+
+    def handle(self, *args, **options):
+        branch = Branch.objects.filter(id=options['branch']).first()
+        if branch is None:
+            raise CommandError(f"No existe la sucursal {options['branch']}.")
+        snapshot = export_snapshot(branch)
+        with open(options['output'], 'w') as output:
+            json.dump(snapshot, output)
+        self.stdout.write(self.style.SUCCESS(
+            f"Foto de la sucursal {branch.name}: {len(snapshot['objects'])} objetos, cursor {snapshot['cursor']}."
+        ))
@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+KINDS = ['sales_summary', 'low_stock', 'valuation']
+
+
+def _init_worker():
+    # Con 'spawn' el proceso hijo arranca sin Django; con 'fork' esto no hace nada.
+    import django
+    django.setup()
+
+
+def _run_tenant(business_id, period, kinds, resume):
+    """Se ejecuta en un proceso del pool, que mantiene su propia conexión a la base."""
+    from control.reports import store_tenant_reports
+    start = time.perf_counter()
+    try:
+        computed = store_tenant_reports(business_id, period, kinds, resume=resume)
+    except Exception as exc:
+        return business_id, None, f"{type(exc).__name__}: {exc}", time.perf_counter() - start
+    return business_id, computed, None, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = (
+        "Precalcula para todas las empresas el resumen de ventas del mes, el listado de "
+        "stock bajo y la valorización, en paralelo, y los guarda en TenantReport. Stock "
+        "bajo y valorización son fotos del momento y se guardan bajo el mes en curso. "
+        "Pensado para ejecutarse cada noche (cron); con --resume retoma solo lo que falló."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', help="Mes a resumir (AAAA-MM). Por defecto, el mes anterior.")
+        parser.add_argument('--workers', type=int, default=settings.REPORT_PRECOMPUTE_WORKERS or os.cpu_count(),
+                            help="Procesos en paralelo (cada uno con su conexión a la base).")
+        parser.add_argument('--kinds', default=','.join(KINDS), help="Reportes a calcular, separados por coma.")
+        parser.add_argument('--business', type=int, action='append', help="Limitar a estas empresas (repetible).")
+        parser.add_argument('--resume', action='store_true',
+                            help="Omitir los reportes que ya existen para el período.")
+
+    def handle(self, *args, **options):
+        from django.db.models import Count
+        from control.models import Business
+        from control.reports import month_bounds
+
+        today = date.today()
+        period = options['period'] or (date(today.year - 1, 12, 1) if today.month == 1 else date(today.year, today.month - 1, 1)).strftime('%Y-%m')
+        try:
+            month_bounds(period)
+        except ValueError:
+            raise CommandError("--period debe tener el formato AAAA-MM.")
+        kinds = [k for k in options['kinds'].split(',') if k]
+        unknown = set(kinds) - set(KINDS)
+        if unknown:
+            raise CommandError(f"Reportes desconocidos: {', '.join(sorted(unknown))}.")
+
+        businesses = Business.objects.filter(deletion_requested_at__isnull=True)
+        if options['business']:
+            businesses = businesses.filter(id__in=options['business'])
+        # Las empresas más grandes primero: así la última tarea del pool es corta.
+        business_ids = list(businesses.annotate(size=Count('products')).order_by('-size', 'id').values_list('id', flat=True))
+        workers = max(1, min(options['workers'], len(business_ids) or 1))
+        self.stdout.write(f"Período {period}: {len(business_ids)} empresas, {workers} procesos.")
+
+        started = time.perf_counter()
+        failures = []
+        tasks = [(business_id, period, kinds, options['resume']) for business_id in business_ids]
+        if workers == 1:
+            results = (_run_tenant(*task) for task in tasks)
+            self._report(results, failures)
+        else:
+            from django.db import connections
+            # Los hijos no deben heredar conexiones abiertas del proceso padre.
+            connections.close_all()
+            method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method),
+                                     initializer=_init_worker) as pool:
+                futures = [pool.submit(_run_tenant, *task) for task in tasks]
+                self._report((future.result() for future in as_completed(futures)), failures)
+
+        elapsed = time.perf_counter() - started
+        if failures:
+            raise CommandError(
+                f"{len(failures)} empresas fallaron ({', '.join(map(str, failures))}). "
+                f"Volver a ejecutar con --period {period} --resume para completarlas."
+            )
+        self.stdout.write(self.style.SUCCESS(f"Reportes de {period} listos en {elapsed:.1f} s."))
+
+    def _report(self, results, failures):
+        for business_id, computed, error, seconds in results:
+            if error:
+                failures.append(business_id)
+                self.stderr.write(f"[empresa {business_id}] error: {error}")
+            else:
+                detail = ', '.join(computed) if computed else 'ya calculados'
+                self.stdout.write(f"[empresa {business_id}] {detail} ({seconds:.2f} s)")
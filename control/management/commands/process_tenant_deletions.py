@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand
+from control.models import TenantDeletion
+from control.tenants import TenantDeletionLost, claim_tenant_deletion, run_tenant_deletion
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra por lotes las empresas marcadas para eliminación. Se puede ejecutar "
+        "periódicamente (cron) o como proceso permanente con --loop."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.05,
+                            help="Pausa en segundos entre lotes para no acaparar la base de datos.")
+        parser.add_argument('--loop', action='store_true', help="Seguir esperando nuevas solicitudes.")
+        parser.add_argument('--poll-interval', type=float, default=30)
+
+    def handle(self, *args, **options):
+        while True:
+            pending = list(TenantDeletion.objects.filter(status__in=['pending', 'running', 'failed']).order_by('requested_at'))
+            for deletion in pending:
+                # Otra ejecución (cron superpuesto, --loop en otro nodo) ya la tiene.
+                if not claim_tenant_deletion(deletion):
+                    continue
+                try:
+                    run_tenant_deletion(deletion, batch_size=options['batch_size'], sleep=options['sleep'], log=self.stdout.write)
+                except TenantDeletionLost as exc:
+                    self.stderr.write(str(exc))
+                except Exception as exc:
+                    TenantDeletion.objects.filter(pk=deletion.pk, heartbeat_at=deletion.heartbeat_at).update(
+                        status='failed', error=str(exc),
+                    )
+                    self.stderr.write(f"[{deletion.business_name}] error en '{deletion.current_step}': {exc}")
+                else:
+                    self.stdout.write(self.style.SUCCESS(f"[{deletion.business_name}] empresa eliminada ({deletion.rows_deleted} filas)."))
+            if not options['loop']:
+                break
+            time.sleep(options['poll_interval'])
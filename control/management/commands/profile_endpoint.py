@@ -0,0 +1,261 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import RequestFactory
+from django.urls import Resolver404, resolve
+from rest_framework import serializers
+from rest_framework_simplejwt.tokens import AccessToken
+from control.throttling import release_slots
+
+
+def _frame_label(filename, line, name):
+    if 'site-packages' + os.sep in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[1]
+    elif filename.startswith(str(settings.BASE_DIR)):
+        filename = os.path.relpath(filename, settings.BASE_DIR)
+    return f"{name} ({filename}:{line})"
+
+
+class Sampler:
+    """
+    Muestrea la pila del hilo indicado cada `interval` segundos. Las pilas se
+    recortan a partir de la función `root` para no incluir al propio comando.
+    """
+
+    def __init__(self, thread_id, interval, root):
+        self.thread_id = thread_id
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(_frame_label(code.co_filename, code.co_firstlineno, code.co_name))
+                if code is self.root:
+                    break
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval / 2))
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        sys.setswitchinterval(self._switch_interval)
+
+
+def collapse_pstats(stats, min_share=0.0005):
+    """
+    Pilas colapsadas (en microsegundos) aproximadas a partir del grafo
+    llamador/llamado de cProfile: el tiempo de cada función se reparte entre
+    sus llamadores en proporción al tiempo acumulado de cada arista.
+    """
+    raw = stats.stats
+    callees = defaultdict(dict)
+    for func, (_, _, _, _, callers) in raw.items():
+        for caller, edge in callers.items():
+            callees[caller][func] = edge[3]
+    total = sum(tt for (_, _, tt, _, _) in raw.values()) or 1
+    stacks = Counter()
+
+    def walk(func, path, labels, share):
+        _, _, tt, ct, _ = raw[func]
+        labels = labels + [_frame_label(*func)]
+        micros = int(tt * share * 1_000_000)
+        if micros:
+            stacks[';'.join(labels)] += micros
+        for callee, edge_ct in callees.get(func, {}).items():
+            callee_ct = raw[callee][3]
+            if callee in path or not callee_ct:
+                continue
+            callee_share = share * min(edge_ct / callee_ct, 1)
+            if callee_ct * callee_share >= total * min_share:
+                walk(callee, path | {callee}, labels, callee_share)
+
+    for func, (_, _, _, _, callers) in raw.items():
+        if not callers:
+            walk(func, {func}, [], 1.0)
+    return stacks
+
+
+class Breakdown:
+    """Mide el tiempo en SQL y en serialización (sin el SQL que esta dispara)."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sql = 0.0
+        self.queries = 0
+        self.serialization = 0.0
+        self.sql_in_serialization = 0.0
+        self.render = 0.0
+        self.total = 0.0
+        self._depth = 0
+
+    def execute(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.sql += elapsed
+            self.queries += 1
+            if self._depth:
+                self.sql_in_serialization += elapsed
+
+    def timed(self, prop):
+        def getter(instance):
+            if self._depth:
+                return prop.fget(instance)
+            self._depth += 1
+            start = time.perf_counter()
+            try:
+                return prop.fget(instance)
+            finally:
+                self._depth -= 1
+                self.serialization += time.perf_counter() - start
+        return property(getter)
+
+
+class Command(BaseCommand):
+    help = (
+        "Perfila un endpoint de la API ejecutándolo N veces como un usuario dado. "
+        "Genera pilas colapsadas para flame graphs (flamegraph.pl, speedscope) y un "
+        "desglose del tiempo en SQL, serialización y render."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Ruta completa, p. ej. /api/control/products/?search=agua")
+        parser.add_argument('--user', required=True, help="Email del usuario con el que se autentica la solicitud.")
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--data', help="Cuerpo JSON para POST/PUT/PATCH.")
+        parser.add_argument('--accept', default='application/json')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=1, help="Ejecuciones previas que no se miden.")
+        parser.add_argument('--profiler', choices=['sample', 'cprofile'], default='sample')
+        parser.add_argument('--interval', type=float, default=1.0, help="Intervalo de muestreo en milisegundos.")
+        parser.add_argument('--output', help="Prefijo de los archivos generados (por defecto profile-<ruta>).")
+        parser.add_argument('--commit', action='store_true',
+                            help="Confirmar las escrituras; por defecto cada ejecución se revierte.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        user = User.objects.filter(email=options['user']).first()
+        if user is None:
+            raise CommandError(f"No existe un usuario con email {options['user']}.")
+        path = options['path']
+        try:
+            match = resolve(urlsplit(path).path)
+        except Resolver404:
+            raise CommandError(f"La ruta {path} no corresponde a ningún endpoint.")
+
+        method = options['method'].upper()
+        body = options['data'] or ''
+        if body:
+            try:
+                json.loads(body)
+            except ValueError as exc:
+                raise CommandError(f"--data no es JSON válido: {exc}")
+        host = next((h.lstrip('.') for h in settings.ALLOWED_HOSTS if h not in ('*', '')), 'localhost')
+        factory = RequestFactory(
+            HTTP_HOST=host,
+            HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}",
+            HTTP_ACCEPT=options['accept'],
+        )
+        breakdown = Breakdown()
+
+        def dispatch():
+            request = factory.generic(method, path, body, content_type='application/json')
+            with transaction.atomic():
+                start = time.perf_counter()
+                response = match.func(request, *match.args, **match.kwargs)
+                if hasattr(response, 'render'):
+                    render_start = time.perf_counter()
+                    response.render()
+                    breakdown.render += time.perf_counter() - render_start
+                breakdown.total += time.perf_counter() - start
+                # Sin middleware: se devuelven aquí los lugares de concurrencia.
+                release_slots(getattr(request, 'admission_slots', ()))
+                if not options['commit']:
+                    transaction.set_rollback(True)
+            return response
+
+        for _ in range(options['warmup']):
+            dispatch()
+        breakdown.reset()
+
+        statuses = Counter()
+        profiler = cProfile.Profile() if options['profiler'] == 'cprofile' else None
+        sampler = None
+        originals = {cls: cls.data for cls in (serializers.Serializer, serializers.ListSerializer)}
+        try:
+            for cls, prop in originals.items():
+                cls.data = breakdown.timed(prop)
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(breakdown.execute))
+                if profiler:
+                    stack.callback(profiler.disable)
+                    profiler.enable()
+                else:
+                    sampler = stack.enter_context(Sampler(threading.get_ident(), options['interval'] / 1000, dispatch.__code__))
+                for _ in range(options['repeat']):
+                    statuses[dispatch().status_code] += 1
+        finally:
+            for cls, prop in originals.items():
+                cls.data = prop
+
+        prefix = options['output'] or 'profile-' + (urlsplit(path).path.strip('/').replace('/', '-') or 'root')
+        if profiler:
+            stats = pstats.Stats(profiler)
+            stats.dump_stats(f"{prefix}.prof")
+            stacks = collapse_pstats(stats)
+        else:
+            stacks = sampler.stacks
+        with open(f"{prefix}.collapsed", 'w') as output:
+            for stack, count in sorted(stacks.items()):
+                output.write(f"{stack} {count}\n")
+
+        runs = options['repeat'] or 1
+        serialization = breakdown.serialization - breakdown.sql_in_serialization
+        other = breakdown.total - breakdown.sql - serialization - breakdown.render
+        self.stdout.write(f"{method} {path} como {user.email}: {options['repeat']} ejecuciones, "
+                          f"respuestas {dict(statuses)}")
+        self.stdout.write(f"{'':<30}{'ms/solicitud':>14}{'%':>8}")
+        for label, seconds in [
+            (f"SQL ({breakdown.queries / runs:.1f} consultas)", breakdown.sql),
+            ("serialización (sin SQL)", serialization),
+            ("render", breakdown.render),
+            ("vista, auth y resto", other),
+            ("total", breakdown.total),
+        ]:
+            share = seconds / breakdown.total * 100 if breakdown.total else 0
+            self.stdout.write(f"{label:<30}{seconds / runs * 1000:>14.2f}{share:>8.1f}")
+        self.stdout.write("Los tiempos incluyen la sobrecarga del perfilador.")
+        files = f"{prefix}.collapsed" + (f" y {prefix}.prof" if profiler else "")
+        self.stdout.write(self.style.SUCCESS(
+            f"Pilas colapsadas en {files}. Flame graph: flamegraph.pl {prefix}.collapsed > {prefix}.svg"
+        ))
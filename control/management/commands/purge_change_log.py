@@ -0,0 +1,30 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from control.models import ChangeLogEntry
+
+
+class Command(BaseCommand):
+    help = (
+        "Elimina por lotes las entradas del feed de cambios más antiguas que "
+        "CHANGE_FEED_RETENTION_DAYS. Las que aún no tienen número se conservan: "
+        "ningún cliente las leyó todavía."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHANGE_FEED_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted = 0
+        while True:
+            ids = list(
+                ChangeLogEntry.objects.filter(created_at__lt=cutoff, sequence__isnull=False)
+                .order_by('id').values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            deleted += ChangeLogEntry.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"{deleted} entradas del feed de cambios eliminadas."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from control.models import Business
+from control.supplier_prices import recompute
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula el índice de precios de compra por proveedor y producto a partir de "
+        "todas las compras, incluidas las archivadas. Se puede ejecutar con el sistema en "
+        "uso: las filas se bloquean antes de leer las compras de cada empresa."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', type=int, help="Recalcular solo esta empresa.")
+
+    def handle(self, *args, **options):
+        businesses = Business.objects.order_by('id')
+        if options['business']:
+            businesses = businesses.filter(id=options['business'])
+        for business in businesses:
+            count = recompute(business.id)
+            self.stdout.write(f"[{business.name}] {count} precios de proveedor.")
+        self.stdout.write(self.style.SUCCESS("Índice de precios recalculado."))
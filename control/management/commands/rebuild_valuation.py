@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from control.models import ArchivedMovement, Business, CostLayer, Movement, StockValuation
+from control.valuation import replay
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula la valorización del inventario (promedio ponderado y capas FIFO) "
+        "reproduciendo todo el historial de movimientos, incluidos los archivados. "
+        "Conviene ejecutarlo con poco tráfico: cada empresa se recalcula en una transacción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', type=int, help="Recalcular solo esta empresa.")
+
+    def handle(self, *args, **options):
+        businesses = Business.objects.order_by('id')
+        if options['business']:
+            businesses = businesses.filter(id=options['business'])
+        for business in businesses:
+            with transaction.atomic():
+                CostLayer.objects.filter(branch__business=business)._raw_delete(CostLayer.objects.db)
+                StockValuation.objects.filter(branch__business=business)._raw_delete(StockValuation.objects.db)
+                ledger, count = replay([
+                    ArchivedMovement.objects.filter(branch__business=business),
+                    Movement.objects.filter(branch__business=business),
+                ])
+                ledger.save()
+            self.stdout.write(f"[{business.name}] {count} movimientos, {len(ledger.positions)} posiciones valorizadas.")
+        self.stdout.write(self.style.SUCCESS("Valorización recalculada."))
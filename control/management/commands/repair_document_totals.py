@@ -0,0 +1,52 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from control.models import ArchivedMovement, Document, Movement
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula line_count, total_quantity y total_amount de los documentos a partir "
+        "de sus movimientos, incluidos los archivados. Procesa por lotes de documentos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--business', type=int, help="Recalcular solo esta empresa.")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        documents = Document.objects.order_by('id')
+        if options['business']:
+            documents = documents.filter(business_id=options['business'])
+        last_id = 0
+        repaired = 0
+        while True:
+            ids = list(documents.filter(id__gt=last_id).values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            last_id = ids[-1]
+            with transaction.atomic():
+                batch = list(Document.objects.select_for_update().filter(id__in=ids).order_by('id'))
+                totals = {}
+                for model in (Movement, ArchivedMovement):
+                    rows = (
+                        model.objects.filter(document_id__in=ids).values('document_id')
+                        .annotate(lines=Count('id'), units=Sum('quantity'), amount=Sum(F('quantity') * F('unit_price')))
+                        .order_by()
+                    )
+                    for row in rows:
+                        lines, quantity, amount = totals.get(row['document_id'], (0, 0, Decimal('0')))
+                        totals[row['document_id']] = (
+                            lines + row['lines'], quantity + (row['units'] or 0), amount + (row['amount'] or 0),
+                        )
+                changed = []
+                for document in batch:
+                    lines, quantity, amount = totals.get(document.id, (0, 0, Decimal('0')))
+                    amount = Decimal(amount).quantize(Decimal('0.01'))
+                    if (document.line_count, document.total_quantity, document.total_amount) != (lines, quantity, amount):
+                        document.line_count, document.total_quantity, document.total_amount = lines, quantity, amount
+                        changed.append(document)
+                Document.objects.bulk_update(changed, ['line_count', 'total_quantity', 'total_amount'])
+            repaired += len(changed)
+        self.stdout.write(self.style.SUCCESS(f"Totales recalculados; {repaired} documentos corregidos."))
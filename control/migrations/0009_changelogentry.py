@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0008_archivedmovement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('business_id', models.BigIntegerField()),
+                ('entity', models.CharField(choices=[('product', 'Product'), ('stock', 'Stock'), ('category', 'Category'), ('branch', 'Branch'), ('supplier', 'Supplier')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('branch_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['business_id', 'id'], name='changelog_business_id_idx'), models.Index(fields=['created_at'], name='changelog_created_at_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0009_changelogentry'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedmovement',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedmovement',
+            name='client_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='archivedmovement',
+            name='flagged',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='movement',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='movement',
+            name='client_timestamp',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='movement',
+            name='flagged',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddConstraint(
+            model_name='movement',
+            constraint=models.UniqueConstraint(fields=('branch', 'client_id'), name='unique_movement_client_id_per_branch'),
+        ),
+    ]
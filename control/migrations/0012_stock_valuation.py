@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0011_tenant_deletion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CostLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit_cost', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('quantity_remaining', models.IntegerField()),
+                ('received_at', models.DateTimeField()),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='control.branch')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='control.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'branch', 'id'], name='costlayer_position_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockValuation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(default=0)),
+                ('average_cost', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('average_value', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('fifo_value', models.DecimalField(decimal_places=4, default=0, max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('branch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valuations', to='control.branch')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='valuations', to='control.product')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('product', 'branch'), name='unique_valuation_per_product_branch')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:27
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0012_stock_valuation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TenantReport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sales_summary', 'Sales summary'), ('low_stock', 'Low stock digest'), ('valuation', 'Valuation')], max_length=20)),
+                ('period', models.CharField(max_length=7)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reports', to='control.business')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('business', 'kind', 'period'), name='unique_tenant_report')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0013_tenantreport'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='line_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=16),
+        ),
+        migrations.AddField(
+            model_name='document',
+            name='total_quantity',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0014_document_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SupplierPrice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('min_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('max_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('average_price', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('purchase_count', models.IntegerField(default=0)),
+                ('quantity_purchased', models.BigIntegerField(default=0)),
+                ('last_purchase_at', models.DateTimeField()),
+                ('business', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='control.business')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='supplier_prices', to='control.product')),
+                ('supplier', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='control.supplier')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'last_price'], name='supplierprice_cheapest_idx'), models.Index(fields=['product', 'last_purchase_at'], name='supplierprice_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('business', 'supplier', 'product'), name='unique_supplier_price')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0016_stock_branch_product_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenantdeletion',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:09
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def number_existing_entries(apps, schema_editor):
+    # Las entradas ya servidas conservan su id como número: los cursores de los
+    # clientes siguen siendo válidos y los números nuevos continúan desde ahí.
+    ChangeLogEntry = apps.get_model('control', 'ChangeLogEntry')
+    ChangeFeedSequence = apps.get_model('control', 'ChangeFeedSequence')
+    ChangeLogEntry.objects.update(sequence=F('id'))
+    ChangeFeedSequence.objects.bulk_create([
+        ChangeFeedSequence(business_id=row['business_id'], last_sequence=row['last'])
+        for row in ChangeLogEntry.objects.values('business_id').annotate(last=Max('id')).order_by()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0017_tenantdeletion_heartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeFeedSequence',
+            fields=[
+                ('business_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('last_sequence', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='changelogentry',
+            name='sequence',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['business_id', 'sequence'], name='changelog_business_seq_idx'),
+        ),
+        migrations.RunPython(number_existing_entries, migrations.RunPython.noop),
+    ]
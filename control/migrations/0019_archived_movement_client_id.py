@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 12:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('control', '0018_changefeed_sequence'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedmovement',
+            index=models.Index(fields=['branch', 'client_id'], name='archived_mov_client_id_idx'),
+        ),
+    ]
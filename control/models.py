@@ -1,5 +1,6 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 
 class Business(models.Model):
     name = models.CharField(max_length=255)
@@ -7,10 +8,23 @@ class Business(models.Model):
     phone = models.CharField(max_length=20)
     created_at = models.DateTimeField(auto_now_add=True)
     notes = models.TextField(default="")
+    deletion_requested_at = models.DateTimeField(null=True, blank=True, db_index=True)
     def __str__(self):
         return self.name
 
-class Branch(models.Model):
+class ChangeLoggedModel(models.Model):
+    """
+    Modelos del feed de cambios: la señal post_save que registra la entrada
+    corre dentro de la misma transacción que el guardado.
+    """
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
+class Branch(ChangeLoggedModel):
     name = models.CharField(max_length=255)
     address = models.TextField()
     phone = models.CharField(max_length=20)
@@ -18,19 +32,24 @@ class Branch(models.Model):
     def __str__(self):
         return f"{self.name} - {self.business.name}"
 
-class Category(models.Model):
+class Category(ChangeLoggedModel):
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True)
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='categories')
     def __str__(self):
         return self.name
 
-class Product(models.Model):
+class Product(ChangeLoggedModel):
     name = models.CharField(max_length=255)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    sku = models.CharField(max_length=64, null=True, blank=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='products')
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['business', 'sku'], name='unique_product_sku_per_business'),
+        ]
     def __str__(self):
         return f"{self.name} ({self.business.name})"
 
@@ -46,10 +65,15 @@ class Document(models.Model):
     date = models.DateTimeField(auto_now_add=True)
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='documents')
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Totales de sus movimientos (incluidos los archivados), mantenidos al escribir;
+    # se recalculan con `python manage.py repair_document_totals`.
+    line_count = models.IntegerField(default=0)
+    total_quantity = models.BigIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
     def __str__(self):
         return f"{self.document_type} #{self.document_number}"
 
-class Supplier(models.Model):
+class Supplier(ChangeLoggedModel):
     business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='suppliers')
     name = models.CharField(max_length=255)
     contact_person = models.CharField(max_length=255, blank=True, null=True)
@@ -76,16 +100,245 @@ class Movement(models.Model):
     document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='movements')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True)
     supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True, related_name='movements')
+    client_id = models.CharField(max_length=64, null=True, blank=True)
+    client_timestamp = models.DateTimeField(null=True, blank=True)
+    flagged = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['branch', 'client_id'], name='unique_movement_client_id_per_branch'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='movement_date_idx'),
+            models.Index(fields=['branch', 'date'], name='movement_branch_date_idx'),
+            models.Index(fields=['product', 'date'], name='movement_product_date_idx'),
+            models.Index(fields=['movement_type', 'date'], name='movement_type_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.movement_type} - {self.product.name} ({self.quantity}) from {self.branch_from} to {self.branch}"
 
-class Stock(models.Model):
+class ArchivedMovement(models.Model):
+    """
+    Movimientos antiguos trasladados desde Movement por el comando
+    archive_movements. Conservan el id original y las mismas columnas, de modo
+    que se serializan igual que un Movement.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    movement_type = models.CharField(max_length=20, choices=Movement.MOVEMENT_TYPES)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='+')
+    branch_from = models.ForeignKey(Branch, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    quantity = models.IntegerField()
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    date = models.DateTimeField()
+    document = models.ForeignKey(Document, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='+')
+    supplier = models.ForeignKey(Supplier, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    client_id = models.CharField(max_length=64, null=True, blank=True)
+    client_timestamp = models.DateTimeField(null=True, blank=True)
+    flagged = models.BooleanField(default=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date'], name='archived_mov_date_idx'),
+            models.Index(fields=['branch', 'date'], name='archived_mov_branch_date_idx'),
+            models.Index(fields=['product', 'date'], name='archived_mov_product_date_idx'),
+            # Deduplicación de los lotes offline que se reenvían después de archivar.
+            models.Index(fields=['branch', 'client_id'], name='archived_mov_client_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"[archivado] {self.movement_type} #{self.id} ({self.quantity})"
+
+class Stock(ChangeLoggedModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stocks')
     branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='stocks')
     quantity = models.IntegerField(default=0)
     minimum_stock = models.IntegerField(default=0)
     class Meta:
         unique_together = ('product', 'branch')
+        indexes = [
+            # Surtido de la sucursal (productos con stock en ella) sin leer la tabla.
+            models.Index(fields=['branch', 'product'], name='stock_branch_product_idx'),
+        ]
+    def __str__(self):
+        return f"{self.product.name} in {self.branch.name}: {self.quantity}"
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status_code or 'pending'})"
+
+
+class ChangeLogEntry(models.Model):
+    """
+    Secuencia de cambios del catálogo y del stock para la sincronización
+    incremental de clientes. El cursor es `sequence`, numerada por empresa en
+    orden de confirmación (control/changefeed.py): las entradas se graban sin
+    número y lo reciben recién cuando su transacción ya se confirmó.
+    """
+    ENTITIES = [
+        ('product', 'Product'),
+        ('stock', 'Stock'),
+        ('category', 'Category'),
+        ('branch', 'Branch'),
+        ('supplier', 'Supplier'),
+    ]
+    # Sin clave foránea: el registro no debe impedir ni encarecer el borrado de la empresa.
+    business_id = models.BigIntegerField()
+    entity = models.CharField(max_length=20, choices=ENTITIES)
+    object_id = models.BigIntegerField()
+    branch_id = models.BigIntegerField(null=True, blank=True)
+    deleted = models.BooleanField(default=False)
+    sequence = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['business_id', 'id'], name='changelog_business_id_idx'),
+            models.Index(fields=['business_id', 'sequence'], name='changelog_business_seq_idx'),
+            models.Index(fields=['created_at'], name='changelog_created_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.id} {self.entity}:{self.object_id}{' (deleted)' if self.deleted else ''}"
+
+
+class ChangeFeedSequence(models.Model):
+    """Último número de `ChangeLogEntry.sequence` asignado por empresa; su fila hace de lock."""
+    business_id = models.BigIntegerField(primary_key=True)
+    last_sequence = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.business_id}: {self.last_sequence}"
+
+
+class TenantDeletion(models.Model):
+    """
+    Progreso del borrado diferido de una empresa (comando process_tenant_deletions).
+    Guarda el id sin clave foránea porque sobrevive a la empresa que borra.
+    """
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    business_id = models.BigIntegerField(db_index=True)
+    business_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending')
+    current_step = models.CharField(max_length=50, blank=True)
+    rows_deleted = models.BigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Lo renueva el proceso que está borrando; si envejece, otro puede retomar.
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.business_name} (#{self.business_id}): {self.status}"
+
+
+class StockValuation(models.Model):
+    """
+    Valor del inventario de un producto en una sucursal, mantenido en cada
+    movimiento (control/valuation.py) por costo promedio ponderado y por FIFO.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='valuations')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='valuations')
+    quantity = models.IntegerField(default=0)
+    average_cost = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    average_value = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    fifo_value = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'branch'], name='unique_valuation_per_product_branch'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}@{self.branch_id}: {self.quantity} u. / {self.average_value}"
+
+
+class CostLayer(models.Model):
+    """Capa FIFO abierta: unidades recibidas a un mismo costo que aún no salieron."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    branch = models.ForeignKey(Branch, on_delete=models.CASCADE, related_name='+')
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4)
+    quantity_remaining = models.IntegerField()
+    received_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'branch', 'id'], name='costlayer_position_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}@{self.branch_id}: {self.quantity_remaining} x {self.unit_cost}"
+
+
+class TenantReport(models.Model):
+    """Reporte precalculado por el comando precompute_reports y servido tal cual por la API."""
+    KINDS = [
+        ('sales_summary', 'Sales summary'),
+        ('low_stock', 'Low stock digest'),
+        ('valuation', 'Valuation'),
+    ]
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='reports')
+    kind = models.CharField(max_length=20, choices=KINDS)
+    period = models.CharField(max_length=7)  # AAAA-MM
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+    generated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['business', 'kind', 'period'], name='unique_tenant_report'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.period} ({self.business_id})"
+
+
+class SupplierPrice(models.Model):
+    """
+    Precios de compra de un producto a un proveedor, mantenidos en cada compra
+    (control/supplier_prices.py). El promedio está ponderado por cantidad.
+    """
+    business = models.ForeignKey(Business, on_delete=models.CASCADE, related_name='+')
+    supplier = models.ForeignKey(Supplier, on_delete=models.CASCADE, related_name='prices')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='supplier_prices')
+    last_price = models.DecimalField(max_digits=10, decimal_places=2)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2)
+    average_price = models.DecimalField(max_digits=14, decimal_places=4)
+    purchase_count = models.IntegerField(default=0)
+    quantity_purchased = models.BigIntegerField(default=0)
+    last_purchase_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['business', 'supplier', 'product'], name='unique_supplier_price'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'last_price'], name='supplierprice_cheapest_idx'),
+            models.Index(fields=['product', 'last_purchase_at'], name='supplierprice_recent_idx'),
+        ]
+
     def __str__(self):
-        return f"{self.product.name} in {self.branch.name}: {self.quantity}"
\ No newline at end of file
+        return f"{self.supplier_id} -> {self.product_id}: {self.last_price}"
@@ -0,0 +1,282 @@
+"""
+Canal de eventos en vivo (Server-Sent Events) servido por ASGI junto a Django.
+
+Las escrituras publican, una vez confirmada la transacción, pequeños deltas de
+stock, movimientos nuevos y transiciones de stock bajo. Cada suscriptor recibe
+solo los eventos de su empresa y, si corresponde, de su sucursal.
+
+El broker por defecto reparte los eventos dentro del proceso; para varios
+workers se configura otro broker en REALTIME_BROKER implementando BaseBroker.
+"""
+import asyncio
+import json
+import secrets
+import threading
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+
+class BaseBroker:
+    """Interfaz mínima de un broker de eventos."""
+
+    def publish(self, business_id, event):
+        raise NotImplementedError
+
+    def subscribe(self, business_id, branch_id=None):
+        """Devuelve una suscripción con `async get()` y `close()`."""
+        raise NotImplementedError
+
+
+class Subscription:
+    def __init__(self, broker, business_id, branch_id, loop, maxsize):
+        self.broker = broker
+        self.business_id = business_id
+        self.branch_id = branch_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def wants(self, event):
+        branches = event.get('branches')
+        return self.branch_id is None or not branches or self.branch_id in branches
+
+    def deliver(self, event):
+        if self.queue.full():
+            # El cliente no da abasto: se vacía la cola y se le pide resincronizar.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            event = {'type': 'resync'}
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker(BaseBroker):
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def publish(self, business_id, event):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(business_id, ()))
+        for subscription in subscriptions:
+            if subscription.wants(event):
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+
+    def subscribe(self, business_id, branch_id=None):
+        subscription = Subscription(self, business_id, branch_id, asyncio.get_running_loop(), self.maxsize)
+        with self._lock:
+            self._subscriptions.setdefault(business_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.business_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.business_id]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.REALTIME_BROKER)()
+    return _broker
+
+
+def publish_after_commit(business_id, events):
+    if not events:
+        return
+    broker = get_broker()
+
+    def publish():
+        for event in events:
+            broker.publish(business_id, event)
+
+    transaction.on_commit(publish)
+
+
+def publish_stock_changes(business_id, changes):
+    """changes: lista de (Stock, cantidad_anterior)."""
+    events = []
+    for stock, previous in changes:
+        if stock.quantity == previous:
+            continue
+        events.append({
+            'type': 'stock',
+            'branches': [stock.branch_id],
+            'product_id': stock.product_id,
+            'branch_id': stock.branch_id,
+            'quantity': stock.quantity,
+            'delta': stock.quantity - previous,
+        })
+        was_low = previous < stock.minimum_stock
+        is_low = stock.quantity < stock.minimum_stock
+        if was_low != is_low:
+            events.append({
+                'type': 'low_stock',
+                'branches': [stock.branch_id],
+                'product_id': stock.product_id,
+                'branch_id': stock.branch_id,
+                'quantity': stock.quantity,
+                'minimum_stock': stock.minimum_stock,
+                'is_low_stock': is_low,
+            })
+    publish_after_commit(business_id, events)
+
+
+def publish_movements(business_id, movements):
+    publish_after_commit(business_id, [
+        {
+            'type': 'movement',
+            'branches': [b for b in (m.branch_id, m.branch_from_id) if b],
+            'id': m.id,
+            'movement_type': m.movement_type,
+            'product_id': m.product_id,
+            'branch_id': m.branch_id,
+            'branch_from_id': m.branch_from_id,
+            'quantity': m.quantity,
+            'document_id': m.document_id,
+            'date': m.date,
+        }
+        for m in movements
+    ])
+
+
+def _authenticate(raw_token):
+    from rest_framework.exceptions import AuthenticationFailed
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+    authentication = JWTAuthentication()
+    try:
+        user = authentication.get_user(authentication.get_validated_token(raw_token))
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return None
+    return user if user.is_active and user.business_id else None
+
+
+def _ticket_key(ticket):
+    return f"inventory360:stream-ticket:{ticket}"
+
+
+def issue_stream_ticket(user):
+    """
+    Ticket de un solo uso y corta vida para abrir el stream. EventSource no
+    puede enviar cabeceras, y un JWT en la URL queda en los logs de acceso.
+    """
+    ticket = secrets.token_urlsafe(32)
+    cache.set(_ticket_key(ticket), user.pk, timeout=settings.REALTIME_TICKET_SECONDS)
+    return ticket
+
+
+def _redeem_ticket(ticket):
+    key = _ticket_key(ticket)
+    user_id = cache.get(key)
+    # delete() solo es verdadero para quien borró la clave: el ticket se canjea una vez.
+    if user_id is None or not cache.delete(key):
+        return None
+    user = get_user_model().objects.filter(pk=user_id).first()
+    return user if user is not None and user.is_active and user.business_id else None
+
+
+def _headers(scope):
+    return {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope.get('headers', [])}
+
+
+async def _reply(send, status, body, extra_headers=()):
+    payload = json.dumps(body).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), *extra_headers],
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+async def sse_application(scope, receive, send):
+    """
+    GET /api/control/stream/?ticket=<TICKET>[&branch_id=N]
+    El ticket se pide con POST stream/ticket/. Los clientes que pueden enviar
+    cabeceras usan Authorization: Bearer en su lugar.
+    """
+    headers = _headers(scope)
+    cors = []
+    origin = headers.get('origin')
+    if origin and origin in settings.CORS_ALLOWED_ORIGINS:
+        cors = [(b'access-control-allow-origin', origin.encode('latin-1')), (b'access-control-allow-credentials', b'true')]
+
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    ticket = (query.get('ticket') or [None])[0]
+    authorization = headers.get('authorization', '')
+    user = None
+    if ticket:
+        user = await sync_to_async(_redeem_ticket)(ticket)
+    elif authorization.lower().startswith('bearer '):
+        user = await sync_to_async(_authenticate)(authorization[7:].strip())
+    if user is None:
+        await _reply(send, 401, {"error": "Ticket o token inválido o ausente."}, cors)
+        return
+
+    if user.role == 'user' and not user.branch_id:
+        await _reply(send, 403, {"error": "Tu usuario no tiene una sucursal asignada."}, cors)
+        return
+    branch_id = user.branch_id if user.role == 'user' else None
+    if user.role == 'admin' and query.get('branch_id'):
+        try:
+            branch_id = int(query['branch_id'][0])
+        except ValueError:
+            await _reply(send, 400, {"error": "branch_id inválido."}, cors)
+            return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+            *cors,
+        ],
+    })
+    subscription = get_broker().subscribe(user.business_id, branch_id)
+    disconnect = asyncio.ensure_future(receive())
+    try:
+        await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+        while True:
+            get = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({get, disconnect}, timeout=settings.REALTIME_HEARTBEAT_SECONDS,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                message = disconnect.result()
+                if message['type'] == 'http.disconnect':
+                    get.cancel()
+                    break
+                disconnect = asyncio.ensure_future(receive())
+            if get in done:
+                event = get.result()
+                data = json.dumps({k: v for k, v in event.items() if k != 'branches'}, cls=DjangoJSONEncoder)
+                chunk = f"event: {event['type']}\ndata: {data}\n\n".encode('utf-8')
+            else:
+                get.cancel()
+                chunk = b': ping\n\n'
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        subscription.close()
+        disconnect.cancel()
@@ -0,0 +1,91 @@
+"""
+Caché de datos de referencia (empresas, sucursales, categorías y proveedores)
+ya serializados, para que los serializers anidados no vuelvan a consultarlos
+en cada fila.
+
+Cada proceso guarda las representaciones en un LRU acotado. La coherencia
+entre procesos se logra con un número de versión por empresa guardado en la
+caché compartida de Django (CACHES, Redis con varios workers): las escrituras lo incrementan al
+confirmar y cada proceso lo relee como mucho cada
+REFERENCE_CACHE_VERSION_CHECK_SECONDS.
+"""
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .cache import LRUCache
+
+reference_cache = LRUCache(maxsize=settings.REFERENCE_CACHE_SIZE, ttl=settings.REFERENCE_CACHE_TTL)
+
+_versions = {}
+_versions_lock = threading.Lock()
+
+
+def _version_key(business_id):
+    return f"inventory360:refdata:{business_id}:version"
+
+
+def current_version(business_id):
+    now = time.monotonic()
+    with _versions_lock:
+        known = _versions.get(business_id)
+    if known is not None and now - known[1] < settings.REFERENCE_CACHE_VERSION_CHECK_SECONDS:
+        return known[0]
+    key = _version_key(business_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, timeout=None)
+        version = cache.get(key, 1)
+    with _versions_lock:
+        _versions[business_id] = (version, now)
+    if known is not None and known[0] != version:
+        reference_cache.invalidate_tag(('business', business_id))
+    return version
+
+
+def bump_version(business_id):
+    """Invalida los datos de referencia de una empresa en todos los procesos."""
+    def bump():
+        key = _version_key(business_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, 2, timeout=None)
+        reference_cache.invalidate_tag(('business', business_id))
+        with _versions_lock:
+            _versions.pop(business_id, None)
+
+    reference_cache.invalidate_tag(('business', business_id))
+    transaction.on_commit(bump)
+
+
+def _load(kind, object_id):
+    from .models import Branch, Business, Category, Supplier
+    from .serializer import BranchSerializer, BusinessSerializer, CategorySerializer, SupplierSerializer
+    model, serializer_class = {
+        'business': (Business, BusinessSerializer),
+        'branch': (Branch, BranchSerializer),
+        'category': (Category, CategorySerializer),
+        'supplier': (Supplier, SupplierSerializer),
+    }[kind]
+    instance = model.objects.filter(pk=object_id).first()
+    if instance is None:
+        return None, None
+    business_id = instance.pk if kind == 'business' else instance.business_id
+    return business_id, dict(serializer_class(instance).data)
+
+
+def get_reference(kind, object_id):
+    if object_id is None:
+        return None
+    entry = reference_cache.get((kind, object_id))
+    if entry is not None:
+        business_id, version, data = entry
+        if version == current_version(business_id):
+            return data
+    business_id, data = _load(kind, object_id)
+    if data is None:
+        return None
+    reference_cache.set((kind, object_id), (business_id, current_version(business_id), data), tags=[('business', business_id)])
+    return data
@@ -0,0 +1,86 @@
+import decimal
+import msgpack
+import orjson
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from rest_framework import renderers, parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+_fallback_encoder = JSONEncoder()
+
+
+def _default(obj):
+    # Decimal, fechas y horas con el JSONEncoder de DRF: mismo texto que JSONRenderer
+    # (orjson difiere, por ejemplo, con horas con zona o zonas que no reconoce).
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    return _fallback_encoder.default(obj)
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """
+    JSONRenderer de DRF reemplazado por orjson. Las fechas (datetime, date, time)
+    se delegan al encoder de DRF; los serializers ya las entregan como texto, así
+    que solo pasan por Python las que vienen crudas de .values().
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(data, default=_default, option=option)
+
+
+class ORJSONParser(parsers.JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+def _msgpack_default(obj):
+    if isinstance(obj, decimal.Decimal):
+        return str(obj)
+    return _fallback_encoder.default(obj)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """Se elige con `Accept: application/msgpack`."""
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_msgpack_default, use_bin_type=True, datetime=False)
+
+
+class MessagePackParser(parsers.BaseParser):
+    media_type = 'application/msgpack'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError, ValueError) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class LargeResponseGZipMiddleware(GZipMiddleware):
+    """
+    GZip solo para respuestas que lo justifican: cuerpos de al menos
+    GZIP_MIN_BYTES (listados) y streams NDJSON. Las respuestas JSON chicas no
+    ganan nada y los eventos SSE deben salir sin búfer.
+    """
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        if not response.streaming and len(response.content) < settings.GZIP_MIN_BYTES:
+            return response
+        return super().process_response(request, response)
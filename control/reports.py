@@ -0,0 +1,218 @@
+"""
+Series temporales de compras y ventas agrupadas por día, semana o mes.
+
+Toda la serie sale de un único GROUP BY (movimientos vigentes y, si el rango
+llega a la zona archivada, los archivados unidos en la misma consulta); los
+períodos sin movimientos se completan en Python.
+
+También arma los reportes mensuales que precompute_reports guarda en
+TenantReport.
+"""
+from datetime import date, datetime, time, timedelta
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+from .models import ArchivedMovement, Movement, Stock, StockValuation, TenantReport
+from .valuation import valuation_summary
+
+GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+SPLITS = {
+    'branch': ('branch_id', 'branch__name'),
+    'category': ('product__category_id', 'product__category__name'),
+    'product': ('product_id', 'product__name'),
+}
+
+
+def bucket_start(day, granularity):
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def buckets(start, end, granularity):
+    """Inicio de cada período entre start y end (inclusive)."""
+    step = relativedelta(months=1) if granularity == 'month' else timedelta(days=7 if granularity == 'week' else 1)
+    current = bucket_start(start, granularity)
+    result = []
+    while current <= end:
+        result.append(current)
+        current += step
+    return result
+
+
+def _grouped(model, business_id, start, end, granularity, split, branch_id):
+    queryset = model.objects.filter(
+        branch__business_id=business_id,
+        movement_type__in=['sale', 'purchase'],
+        date__gte=timezone.make_aware(datetime.combine(start, time.min)),
+        date__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min)),
+    )
+    if branch_id:
+        queryset = queryset.filter(branch_id=branch_id)
+    group = ['bucket', 'movement_type'] + (list(SPLITS[split]) if split else [])
+    return (
+        queryset.annotate(bucket=GRANULARITIES[granularity]('date', output_field=DateField()))
+        .values(*group)
+        .annotate(units=Sum('quantity'), amount=Sum(F('unit_price') * F('quantity')), movements=Count('id'))
+        .order_by()
+    )
+
+
+def _empty_point(period):
+    return {'period': period, 'sales_units': 0, 'sales_amount': 0, 'sales_count': 0,
+            'purchase_units': 0, 'purchase_amount': 0, 'purchase_count': 0}
+
+
+def sales_series(business_id, start, end, granularity='day', split=None, branch_id=None):
+    """
+    Devuelve una serie por cada valor de `split` (sucursal, categoría o
+    producto), o una sola serie si no se divide.
+    """
+    periods = buckets(start, end, granularity)
+    rows = _grouped(Movement, business_id, start, end, granularity, split, branch_id)
+    # archive_movements solo mueve movimientos anteriores a su corte: un rango que
+    # empieza después no necesita tocar ArchivedMovement.
+    archive_cutoff = timezone.now() - timedelta(days=settings.MOVEMENT_ARCHIVE_AFTER_DAYS)
+    if timezone.make_aware(datetime.combine(start, time.min)) < archive_cutoff:
+        rows = rows.union(
+            _grouped(ArchivedMovement, business_id, start, end, granularity, split, branch_id), all=True,
+        )
+    key_field, name_field = SPLITS[split] if split else (None, None)
+    series = {}
+    for row in rows:
+        period = row['bucket']
+        if isinstance(period, datetime):
+            period = period.date()
+        key = row[key_field] if split else None
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = {
+                'key': key,
+                'name': row[name_field] if split else None,
+                'points': {p: _empty_point(p) for p in periods},
+            }
+        point = entry['points'].get(period)
+        if point is None:
+            continue
+        prefix = 'sales' if row['movement_type'] == 'sale' else 'purchase'
+        point[f'{prefix}_units'] += abs(row['units'] or 0)
+        point[f'{prefix}_amount'] += abs(row['amount'] or 0)
+        point[f'{prefix}_count'] += row['movements']
+    if not split and None not in series:
+        series[None] = {'key': None, 'name': None, 'points': {p: _empty_point(p) for p in periods}}
+    return [
+        {**entry, 'points': list(entry['points'].values())}
+        for entry in sorted(series.values(), key=lambda e: (e['name'] is None, e['name'] or '', e['key'] or 0))
+    ]
+
+
+def default_range(granularity, today=None):
+    today = today or timezone.localdate()
+    if granularity == 'month':
+        return (today - relativedelta(months=5)).replace(day=1), today
+    if granularity == 'week':
+        return today - timedelta(weeks=11), today
+    return today - timedelta(days=29), today
+
+
+def parse_day(value):
+    return date.fromisoformat(value) if value else None
+
+
+def month_bounds(period):
+    """'AAAA-MM' -> (primer día, último día)."""
+    start = datetime.strptime(period, '%Y-%m').date()
+    return start, start + relativedelta(months=1) - timedelta(days=1)
+
+
+def _totals(points):
+    keys = [k for k in _empty_point(None) if k != 'period']
+    return {k: sum(point[k] for point in points) for k in keys}
+
+
+def sales_summary(business_id, period):
+    start, end = month_bounds(period)
+    by_branch = sales_series(business_id, start, end, 'day', split='branch')
+    by_product = sales_series(business_id, start, end, 'month', split='product')
+    products = [
+        {'product_id': entry['key'], 'name': entry['name'], **_totals(entry['points'])}
+        for entry in by_product
+    ]
+    products.sort(key=lambda p: p['sales_amount'], reverse=True)
+    branches = [
+        {'branch_id': entry['key'], 'name': entry['name'], **_totals(entry['points']), 'daily': entry['points']}
+        for entry in by_branch
+    ]
+    return {
+        'period': period,
+        'totals': _totals([point for entry in by_branch for point in entry['points']]),
+        'branches': branches,
+        'top_products': products[:20],
+    }
+
+
+def low_stock_digest(business_id):
+    rows = (
+        Stock.objects.filter(branch__business_id=business_id, quantity__lt=F('minimum_stock'))
+        .order_by('branch__name', 'product__name')
+        .values('product_id', 'product__name', 'branch_id', 'branch__name', 'quantity', 'minimum_stock')
+    )
+    return {
+        'count': len(rows),
+        'items': [
+            {'product_id': r['product_id'], 'product': r['product__name'], 'branch_id': r['branch_id'],
+             'branch': r['branch__name'], 'quantity': r['quantity'], 'minimum_stock': r['minimum_stock'],
+             'missing': r['minimum_stock'] - r['quantity']}
+            for r in rows
+        ],
+    }
+
+
+def valuation_report(business_id):
+    queryset = StockValuation.objects.filter(branch__business_id=business_id)
+    return {method: valuation_summary(queryset, method) for method in ('average', 'fifo')}
+
+
+REPORT_BUILDERS = {
+    'sales_summary': sales_summary,
+    'low_stock': lambda business_id, period: low_stock_digest(business_id),
+    'valuation': lambda business_id, period: valuation_report(business_id),
+}
+
+# Fotos del estado actual, no resúmenes de un mes: se guardan bajo el mes en que
+# se generan aunque el comando resuma un período anterior.
+SNAPSHOT_KINDS = {'low_stock', 'valuation'}
+
+
+def report_period(kind, period):
+    return timezone.localdate().strftime('%Y-%m') if kind in SNAPSHOT_KINDS else period
+
+
+def store_tenant_reports(business_id, period, kinds, resume=False):
+    """Calcula y guarda los reportes de una empresa. Con resume omite los que ya existen."""
+    targets = {kind: report_period(kind, period) for kind in kinds}
+    done = set()
+    if resume:
+        done = set(TenantReport.objects.filter(business_id=business_id, kind__in=kinds, period__in=set(targets.values()))
+                   .values_list('kind', 'period'))
+    reports = [
+        TenantReport(business_id=business_id, kind=kind, period=target, data=REPORT_BUILDERS[kind](business_id, period))
+        for kind, target in targets.items() if (kind, target) not in done
+    ]
+    # Una sola escritura por empresa al final: los cálculos (solo lecturas) no retienen bloqueos.
+    # MySQL no admite indicar las columnas del conflicto: usa la clave única que choque.
+    conflict = {'update_conflicts': True, 'update_fields': ['data', 'generated_at']}
+    if connection.features.supports_update_conflicts_with_target:
+        conflict['unique_fields'] = ['business', 'kind', 'period']
+    TenantReport.objects.bulk_create(reports, **conflict)
+    return [report.kind for report in reports]
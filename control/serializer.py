@@ -1,20 +1,53 @@
 from rest_framework import serializers
+from drf_spectacular.extensions import OpenApiSerializerFieldExtension
 from django.core.validators import RegexValidator
-from .models import Business, Branch, Product, Movement, Stock, Document, Category, Supplier
+from .models import Business, Branch, Product, Movement, ArchivedMovement, Stock, Document, Category, Supplier
 from django.db.models import Sum
+from django.conf import settings
+from django.db import transaction
+from .realtime import publish_after_commit, publish_movements
+from .reference import get_reference
+from .services import lock_stocks, apply_stock_deltas, movement_lines, update_document_totals
+from .supplier_prices import apply_purchases
+from .valuation import apply_movements as apply_valuation
+from rest_framework.settings import api_settings
+import uuid
 
 text_only_validator = RegexValidator(
     regex=r'^[a-zA-ZáéíóúÁÉÍÓÚñÑ\s\'-]+$',
     message='Este campo solo puede contener letras, espacios, guiones, apóstrofes o caracteres en español (como tildes y ñ).'
 )
 
+class CachedReferenceField(serializers.Field):
+    """Representación anidada de solo lectura servida desde la caché de datos de referencia."""
+    def __init__(self, kind, **kwargs):
+        self.kind = kind
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return get_reference(self.kind, value)
+
+class CachedReferenceFieldExtension(OpenApiSerializerFieldExtension):
+    """En el esquema OpenAPI, el campo es el serializer anidado que cachea (ver reference.py)."""
+    target_class = CachedReferenceField
+
+    def map_serializer_field(self, auto_schema, direction):
+        serializer_class = {
+            'business': BusinessSerializer,
+            'branch': BranchSerializer,
+            'category': CategorySerializer,
+            'supplier': SupplierSerializer,
+        }[self.target.kind]
+        return auto_schema.resolve_serializer(serializer_class, direction).ref
+
 class BusinessSerializer(serializers.ModelSerializer):
     class Meta:
         model = Business
         fields = '__all__'
 
 class BranchSerializer(serializers.ModelSerializer):
-    business = BusinessSerializer(read_only=True)
+    business = CachedReferenceField('business', source='business_id')
     class Meta:
         model = Branch
         fields = ['id', 'name', 'address', 'phone', 'business']
@@ -33,18 +66,33 @@ class CategorySerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 class ProductSerializer(serializers.ModelSerializer):
-    business = BusinessSerializer(read_only=True)
-    category = CategorySerializer(read_only=True)
+    business = CachedReferenceField('business', source='business_id')
+    category = CachedReferenceField('category', source='category_id', allow_null=True)
     category_id = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), source='category', write_only=True, required=False, allow_null=True)
     name = serializers.CharField(validators=[text_only_validator])
     description = serializers.CharField(validators=[text_only_validator])
+    sku = serializers.CharField(max_length=64, required=False, allow_null=True, allow_blank=True)
     stock = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'category', 'category_id', 'business', 'stock']
+        fields = ['id', 'name', 'description', 'price', 'sku', 'category', 'category_id', 'business', 'stock']
+
+    def validate_sku(self, value):
+        value = (value or '').strip() or None
+        if value is None:
+            return None
+        request = self.context.get('request')
+        queryset = Product.objects.filter(business_id=request.user.business_id, sku=value)
+        if self.instance is not None:
+            queryset = queryset.exclude(pk=self.instance.pk)
+        if queryset.exists():
+            raise serializers.ValidationError("Ya existe un producto con este SKU en tu empresa.")
+        return value
 
     def get_stock(self, obj):
+        if hasattr(obj, 'total_stock'):
+            return obj.total_stock or 0
         total = Stock.objects.filter(product=obj).aggregate(total_stock=Sum('quantity'))['total_stock']
         return total or 0
 
@@ -62,7 +110,8 @@ class ProductSerializer(serializers.ModelSerializer):
 class DocumentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Document
-        fields = ['id', 'document_type', 'document_number', 'date', 'business', 'created_by']
+        fields = ['id', 'document_type', 'document_number', 'date', 'business', 'created_by', 'line_count', 'total_quantity', 'total_amount']
+        read_only_fields = ['line_count', 'total_quantity', 'total_amount']
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         request = self.context.get('request')
@@ -74,7 +123,7 @@ class DocumentSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 class SupplierSerializer(serializers.ModelSerializer):
-    business = BusinessSerializer(read_only=True)
+    business = CachedReferenceField('business', source='business_id')
 
     class Meta:
         model = Supplier
@@ -84,32 +133,33 @@ class SupplierSerializer(serializers.ModelSerializer):
 class MovementSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), source='product', write_only=True)
-    branch = BranchSerializer(read_only=True)
+    branch = CachedReferenceField('branch', source='branch_id')
     branch_id = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all(), source='branch', write_only=True)
-    branch_from = BranchSerializer(read_only=True)
+    branch_from = CachedReferenceField('branch', source='branch_from_id', allow_null=True)
     branch_from_id = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all(), source='branch_from', write_only=True, required=False, allow_null=True)
     user = serializers.ReadOnlyField(source='user.email')
     document = DocumentSerializer(read_only=True)
     document_id = serializers.PrimaryKeyRelatedField(queryset=Document.objects.all(), source='document', write_only=True, required=False, allow_null=True)
-    supplier = SupplierSerializer(read_only=True)
+    supplier = CachedReferenceField('supplier', source='supplier_id', allow_null=True)
     supplier_id = serializers.PrimaryKeyRelatedField(queryset=Supplier.objects.all(), source='supplier', write_only=True, required=False, allow_null=True)
     quantity = serializers.IntegerField(min_value=1)
     unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
     
     class Meta:
         model = Movement
-        fields = ['id', 'movement_type', 'quantity', 'date', 'product', 'product_id', 'branch', 'branch_id', 'branch_from', 'branch_from_id', 'user', 'document', 'document_id', 'unit_price', 'supplier', 'supplier_id']
+        fields = ['id', 'movement_type', 'quantity', 'date', 'product', 'product_id', 'branch', 'branch_id', 'branch_from', 'branch_from_id', 'user', 'document', 'document_id', 'unit_price', 'supplier', 'supplier_id', 'client_id', 'client_timestamp', 'flagged']
+        read_only_fields = ['client_id', 'client_timestamp', 'flagged']
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         request = self.context.get('request')
         user = request.user
         if user.is_authenticated:
-            self.fields['product_id'].queryset = Product.objects.filter(business=user.business)
-            self.fields['branch_id'].queryset = Branch.objects.filter(business=user.business)
-            self.fields['branch_from_id'].queryset = Branch.objects.filter(business=user.business)
-            self.fields['document_id'].queryset = Document.objects.filter(business=user.business)
-            self.fields['supplier_id'].queryset = Supplier.objects.filter(business=user.business)
+            self.fields['product_id'].queryset = Product.objects.filter(business_id=user.business_id)
+            self.fields['branch_id'].queryset = Branch.objects.filter(business_id=user.business_id)
+            self.fields['branch_from_id'].queryset = Branch.objects.filter(business_id=user.business_id)
+            self.fields['document_id'].queryset = Document.objects.filter(business_id=user.business_id)
+            self.fields['supplier_id'].queryset = Supplier.objects.filter(business_id=user.business_id)
 
     def validate(self, data):
         product = data['product']
@@ -133,9 +183,9 @@ class MovementSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("El precio unitario es requerido para compras y ventas.")
         if movement_type in ['adjustment', 'transfer'] and unit_price:
             raise serializers.ValidationError("El precio unitario no debe especificarse para ajustes o transferencias.")
-        if product.business != user.business or branch.business != user.business:
+        if product.business_id != user.business_id or branch.business_id != user.business_id:
             raise serializers.ValidationError("El producto o la sucursal no pertenecen a tu empresa.")
-        if branch_from and branch_from.business != user.business:
+        if branch_from and branch_from.business_id != user.business_id:
             raise serializers.ValidationError("La sucursal de origen no pertenece a tu empresa.")
         if movement_type == 'purchase' and not user.can_purchase:
             raise serializers.ValidationError("No tienes permiso para registrar compras.")
@@ -145,51 +195,86 @@ class MovementSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("No tienes permiso para registrar ajustes.")
         if movement_type == 'transfer' and not user.can_transfer:
             raise serializers.ValidationError("No tienes permiso para registrar transferencias.")
-        if document and document.business != user.business:
+        if movement_type == 'transfer' and settings.EDGE_MODE:
+            raise serializers.ValidationError("Las transferencias se registran en el central, no en el nodo de sucursal.")
+        if document and document.business_id != user.business_id:
             raise serializers.ValidationError("El documento no pertenece a tu empresa.")
-        if movement_type == 'sale' or (movement_type == 'adjustment' and quantity < 0):
-            try:
-                stock = Stock.objects.get(product=product, branch=branch)
-                if stock.quantity < abs(quantity):
-                    raise serializers.ValidationError(f"Stock insuficiente. Disponible: {stock.quantity}")
-            except Stock.DoesNotExist:
-                raise serializers.ValidationError("No hay stock registrado para este producto en esta sucursal.")
-        if movement_type == 'transfer':
-            if not branch_from or branch == branch_from:
-                raise serializers.ValidationError("Debes especificar una sucursal de origen diferente a la de destino.")
-            try:
-                stock_from = Stock.objects.get(product=product, branch=branch_from)
-                if stock_from.quantity < abs(quantity):
-                    raise serializers.ValidationError(f"Stock insuficiente en la sucursal de origen. Disponible: {stock_from.quantity}")
-            except Stock.DoesNotExist:
-                raise serializers.ValidationError("No hay stock registrado en la sucursal de origen.")
+        if movement_type == 'transfer' and (not branch_from or branch == branch_from):
+            raise serializers.ValidationError("Debes especificar una sucursal de origen diferente a la de destino.")
         return data
+    @transaction.atomic
     def create(self, validated_data):
+        """
+        El stock se verifica aquí, con las filas ya bloqueadas (una sola consulta),
+        y no en validate(), para que dos ventas simultáneas no lean el mismo saldo.
+        """
+        user = self.context['request'].user
+        movement_type = validated_data['movement_type']
+        quantity = validated_data['quantity']
+        product_id = validated_data['product'].id
+        branch_id = validated_data['branch'].id
+        if movement_type == 'transfer':
+            source = (product_id, validated_data['branch_from'].id)
+            deltas = {source: -quantity, (product_id, branch_id): quantity}
+        elif movement_type == 'purchase' or (movement_type == 'adjustment' and quantity > 0):
+            source = None
+            deltas = {(product_id, branch_id): quantity}
+        else:
+            source = (product_id, branch_id)
+            deltas = {source: -abs(quantity)}
+
+        stocks = lock_stocks(deltas)
+        if source is not None:
+            error = None
+            if source not in stocks:
+                error = ("No hay stock registrado en la sucursal de origen." if movement_type == 'transfer'
+                         else "No hay stock registrado para este producto en esta sucursal.")
+            elif stocks[source].quantity < abs(deltas[source]):
+                where = " en la sucursal de origen" if movement_type == 'transfer' else ""
+                error = f"Stock insuficiente{where}. Disponible: {stocks[source].quantity}"
+            if error:
+                raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [error]})
+        if len(stocks) < len(deltas):
+            stocks = lock_stocks(deltas, create_missing=True)
+
         movement = super().create(validated_data)
-        product = movement.product
-        branch = movement.branch
-        branch_from = movement.branch_from
-        quantity = movement.quantity
-        movement_type = movement.movement_type
-        stock_to, _ = Stock.objects.get_or_create(product=product, branch=branch, defaults={'quantity': 0, 'minimum_stock': 0})
-        if movement_type == 'purchase' or (movement_type == 'adjustment' and quantity > 0):
-            stock_to.quantity += quantity
-        elif movement_type == 'sale' or (movement_type == 'adjustment' and quantity < 0):
-            stock_to.quantity -= abs(quantity)
-        elif movement_type == 'transfer':
-            if branch_from:
-                stock_from, _ = Stock.objects.get_or_create(product=product, branch=branch_from, defaults={'quantity': 0, 'minimum_stock': 0})
-                if stock_from.quantity >= quantity:
-                    stock_from.quantity -= quantity
-                    stock_from.save()
-                stock_to.quantity += quantity
-        stock_to.save()
+        apply_stock_deltas(user.business_id, deltas, stocks)
+        publish_movements(user.business_id, [movement])
+        apply_valuation([movement])
+        apply_purchases(user.business_id, [movement])
+        movement.stock_after = [
+            {'branch_id': key[1], 'quantity': stocks[key].quantity} for key in sorted(deltas)
+        ]
         return movement
 
+    def to_representation(self, instance):
+        if not self.context.get('compact'):
+            return super().to_representation(instance)
+        # Respuesta liviana de las escrituras: solo ids y el stock resultante.
+        return {
+            'id': instance.id,
+            'movement_type': instance.movement_type,
+            'quantity': instance.quantity,
+            'date': self.fields['date'].to_representation(instance.date),
+            'product_id': instance.product_id,
+            'branch_id': instance.branch_id,
+            'branch_from_id': instance.branch_from_id,
+            'document_id': instance.document_id,
+            'supplier_id': instance.supplier_id,
+            'unit_price': self.fields['unit_price'].to_representation(instance.unit_price) if instance.unit_price is not None else None,
+            'user': self.context['request'].user.email,
+            'stock': getattr(instance, 'stock_after', None),
+        }
+
+class ArchivedMovementSerializer(MovementSerializer):
+    class Meta(MovementSerializer.Meta):
+        model = ArchivedMovement
+        read_only_fields = MovementSerializer.Meta.fields
+
 class StockSerializer(serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), source='product', write_only=True)
-    branch = BranchSerializer(read_only=True)
+    branch = CachedReferenceField('branch', source='branch_id')
     branch_id = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all(), source='branch', write_only=True)
     quantity = serializers.ReadOnlyField()
     minimum_stock = serializers.IntegerField(min_value=0)
@@ -207,4 +292,288 @@ class StockSerializer(serializers.ModelSerializer):
             
     class Meta:
         model = Stock
-        fields = ['id', 'product', 'product_id', 'branch', 'branch_id', 'quantity', 'minimum_stock', 'is_low_stock']
\ No newline at end of file
+        fields = ['id', 'product', 'product_id', 'branch', 'branch_id', 'quantity', 'minimum_stock', 'is_low_stock']
+
+class TransferLineSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1)
+
+class TransferSerializer(serializers.Serializer):
+    branch_from_id = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all(), source='branch_from')
+    branch_id = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all(), source='branch')
+    document_number = serializers.CharField(max_length=50, required=False)
+    lines = TransferLineSerializer(many=True, allow_empty=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            self.fields['branch_from_id'].queryset = Branch.objects.filter(business_id=request.user.business_id)
+            self.fields['branch_id'].queryset = Branch.objects.filter(business_id=request.user.business_id)
+
+    def validate_document_number(self, value):
+        if Document.objects.filter(document_number=value).exists():
+            raise serializers.ValidationError("Ya existe un documento con este número.")
+        return value
+
+    def validate(self, data):
+        user = self.context['request'].user
+        if not user.can_transfer:
+            raise serializers.ValidationError("No tienes permiso para registrar transferencias.")
+        if data['branch'] == data['branch_from']:
+            raise serializers.ValidationError("Debes especificar una sucursal de origen diferente a la de destino.")
+        product_ids = {line['product_id'] for line in data['lines']}
+        found = set(Product.objects.filter(business_id=user.business_id, id__in=product_ids).values_list('id', flat=True))
+        missing = sorted(product_ids - found)
+        if missing:
+            raise serializers.ValidationError(f"Los productos {missing} no pertenecen a tu empresa.")
+        return data
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        branch = validated_data['branch']
+        branch_from = validated_data['branch_from']
+        lines = validated_data['lines']
+        totals = {}
+        for line in lines:
+            totals[line['product_id']] = totals.get(line['product_id'], 0) + line['quantity']
+
+        with transaction.atomic():
+            keys = [(product_id, b.id) for product_id in totals for b in (branch, branch_from)]
+            stocks = lock_stocks(keys, create_missing=True)
+            errors = []
+            for product_id, quantity in sorted(totals.items()):
+                available = stocks[(product_id, branch_from.id)].quantity
+                if available < quantity:
+                    errors.append(f"Producto {product_id}: stock insuficiente en la sucursal de origen. Disponible: {available}")
+            if errors:
+                raise serializers.ValidationError({'lines': errors})
+
+            document = Document.objects.create(
+                document_type='transfer_note',
+                document_number=validated_data.get('document_number') or f"TR-{uuid.uuid4().hex[:12].upper()}",
+                business_id=user.business_id,
+                created_by=user,
+            )
+            movements = Movement.objects.bulk_create([
+                Movement(
+                    movement_type='transfer',
+                    product_id=line['product_id'],
+                    branch=branch,
+                    branch_from=branch_from,
+                    quantity=line['quantity'],
+                    document=document,
+                    user=user,
+                )
+                for line in lines
+            ], batch_size=500)
+            deltas = {}
+            for product_id, quantity in totals.items():
+                deltas[(product_id, branch_from.id)] = -quantity
+                deltas[(product_id, branch.id)] = quantity
+            apply_stock_deltas(user.business_id, deltas, stocks)
+            apply_valuation(movements)
+            update_document_totals(movement_lines(movements))
+            document.refresh_from_db(fields=['line_count', 'total_quantity', 'total_amount'])
+            publish_after_commit(user.business_id, [{
+                'type': 'transfer',
+                'branches': [branch.id, branch_from.id],
+                'document_id': document.id,
+                'branch_id': branch.id,
+                'branch_from_id': branch_from.id,
+                'lines': len(lines),
+            }])
+        return document
+
+    def to_representation(self, instance):
+        return {
+            'document': DocumentSerializer(instance, context=self.context).data,
+            'branch_from_id': self.validated_data['branch_from'].id,
+            'branch_id': self.validated_data['branch'].id,
+            'lines': len(self.validated_data['lines']),
+            'products': len({line['product_id'] for line in self.validated_data['lines']}),
+        }
+
+
+class SyncItemSerializer(serializers.Serializer):
+    client_id = serializers.CharField(max_length=60)
+    client_timestamp = serializers.DateTimeField(required=False, allow_null=True)
+    movement_type = serializers.ChoiceField(choices=['purchase', 'sale', 'adjustment'])
+    product_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField()
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, required=False, allow_null=True)
+    document_id = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+    supplier_id = serializers.IntegerField(min_value=1, required=False, allow_null=True)
+
+    def validate(self, data):
+        movement_type = data['movement_type']
+        if data['quantity'] == 0 or (movement_type != 'adjustment' and data['quantity'] < 0):
+            raise serializers.ValidationError("La cantidad debe ser mayor a cero.")
+        if movement_type in ['purchase', 'sale'] and not data.get('unit_price'):
+            raise serializers.ValidationError("El precio unitario es requerido para compras y ventas.")
+        if movement_type == 'adjustment' and data.get('unit_price'):
+            raise serializers.ValidationError("El precio unitario no debe especificarse para ajustes o transferencias.")
+        return data
+
+class MovementSyncSerializer(serializers.Serializer):
+    """
+    Lote de movimientos registrados sin conexión por un POS, en el orden del
+    cliente. Se aplica en una sola transacción y devuelve un resultado por ítem:
+    applied, duplicate, rejected, flagged (stock negativo permitido) o adjusted
+    (se agregó un ajuste compensatorio antes de la venta).
+    """
+    POLICIES = ['reject', 'allow_negative', 'adjust']
+    PERMISSIONS = {
+        'purchase': ('can_purchase', "No tienes permiso para registrar compras."),
+        'sale': ('can_sale', "No tienes permiso para registrar ventas."),
+        'adjustment': ('can_adjust', "No tienes permiso para registrar ajustes."),
+    }
+    DOCUMENT_TYPES = {'sale': 'invoice', 'purchase': 'purchase_order', 'adjustment': 'adjustment_note'}
+    # 'adjust' registra ajustes compensatorios; 'allow_negative' deja vender sin stock.
+    POLICY_PERMISSIONS = {
+        'adjust': [('can_adjust', "La política adjust registra ajustes y no tienes permiso para registrarlos.")],
+        'allow_negative': [('can_sale', "La política allow_negative requiere permiso para registrar ventas.")],
+    }
+
+    branch_id = serializers.PrimaryKeyRelatedField(queryset=Branch.objects.all(), source='branch')
+    policy = serializers.ChoiceField(choices=POLICIES, required=False)
+    items = serializers.ListField(child=serializers.DictField(), allow_empty=False, max_length=settings.OFFLINE_SYNC_MAX_ITEMS)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request and request.user.is_authenticated:
+            self.fields['branch_id'].queryset = Branch.objects.filter(business_id=request.user.business_id)
+
+    def validate_branch_id(self, branch):
+        user = self.context['request'].user
+        if user.role == 'user' and branch.id != user.branch_id:
+            raise serializers.ValidationError("Solo puedes sincronizar movimientos de tu sucursal.")
+        return branch
+
+    def validate(self, data):
+        # La política la elige el cliente: no puede dar más de lo que el usuario puede registrar.
+        policy = data.get('policy') or settings.OFFLINE_SYNC_DEFAULT_POLICY
+        for permission, message in self.POLICY_PERMISSIONS.get(policy, []):
+            if not getattr(self.context['request'].user, permission):
+                raise serializers.ValidationError({'policy': message})
+        return data
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        branch = validated_data['branch']
+        policy = validated_data.get('policy') or settings.OFFLINE_SYNC_DEFAULT_POLICY
+        results = []
+        pending = []
+        seen = set()
+        for raw in validated_data['items']:
+            item = SyncItemSerializer(data=raw)
+            client_id = str(raw.get('client_id', ''))[:60]
+            result = {'client_id': client_id}
+            results.append(result)
+            if not item.is_valid():
+                result.update(status='rejected', error=item.errors)
+                continue
+            data = item.validated_data
+            if data['client_id'] in seen:
+                result['status'] = 'duplicate'
+                continue
+            seen.add(data['client_id'])
+            pending.append((result, data))
+
+        with transaction.atomic():
+            # Un lote por sucursal a la vez: así la deduplicación no compite con otro reintento.
+            Branch.objects.select_for_update().filter(id=branch.id).first()
+            existing = dict(Movement.objects.filter(branch=branch, client_id__in=seen).values_list('client_id', 'id'))
+            # Un lote reenviado después de archivar sus originales no se vuelve a aplicar.
+            existing.update(ArchivedMovement.objects.filter(branch=branch, client_id__in=seen).values_list('client_id', 'id'))
+            product_ids = {data['product_id'] for _, data in pending}
+            products = set(Product.objects.filter(business_id=user.business_id, id__in=product_ids).values_list('id', flat=True))
+            documents = dict(Document.objects.filter(
+                business_id=user.business_id, id__in={d['document_id'] for _, d in pending if d.get('document_id')}
+            ).values_list('id', 'document_type'))
+            suppliers = set(Supplier.objects.filter(
+                business_id=user.business_id, id__in={d['supplier_id'] for _, d in pending if d.get('supplier_id')}
+            ).values_list('id', flat=True))
+
+            stocks = lock_stocks([(product_id, branch.id) for product_id in products], create_missing=True)
+            running = {product_id: stocks[(product_id, branch.id)].quantity for product_id in products}
+            movements = []
+            for result, data in pending:
+                error = self._item_error(user, data, existing, products, documents, suppliers)
+                if error == 'duplicate':
+                    result.update(status='duplicate', id=existing[data['client_id']])
+                    continue
+                if error:
+                    result.update(status='rejected', error=error)
+                    continue
+                product_id = data['product_id']
+                quantity = data['quantity']
+                delta = quantity if data['movement_type'] == 'purchase' or (data['movement_type'] == 'adjustment' and quantity > 0) else -abs(quantity)
+                status = 'applied'
+                flagged = False
+                if delta < 0 and running[product_id] + delta < 0:
+                    if policy == 'reject':
+                        result.update(status='rejected', error=f"Stock insuficiente. Disponible: {running[product_id]}")
+                        continue
+                    if policy == 'allow_negative':
+                        status, flagged = 'flagged', True
+                    else:
+                        missing = -(running[product_id] + delta)
+                        movements.append(Movement(
+                            movement_type='adjustment', product_id=product_id, branch=branch, quantity=missing,
+                            user=user, client_id=f"{data['client_id']}:adj", client_timestamp=data.get('client_timestamp'),
+                            flagged=True,
+                        ))
+                        running[product_id] += missing
+                        status = 'adjusted'
+                running[product_id] += delta
+                movements.append(Movement(
+                    movement_type=data['movement_type'], product_id=product_id, branch=branch, quantity=quantity,
+                    unit_price=data.get('unit_price'), document_id=data.get('document_id'), supplier_id=data.get('supplier_id'),
+                    user=user, client_id=data['client_id'], client_timestamp=data.get('client_timestamp'), flagged=flagged,
+                ))
+                result['status'] = status
+
+            Movement.objects.bulk_create(movements, batch_size=500)
+            ids = dict(Movement.objects.filter(branch=branch, client_id__in=[m.client_id for m in movements]).values_list('client_id', 'id'))
+            for movement in movements:
+                movement.id = ids.get(movement.client_id)
+            for result in results:
+                if result.get('status') in ('applied', 'flagged', 'adjusted'):
+                    result['id'] = ids.get(result['client_id'])
+            deltas = {
+                (product_id, branch.id): running[product_id] - stocks[(product_id, branch.id)].quantity
+                for product_id in products
+            }
+            apply_stock_deltas(user.business_id, deltas, stocks)
+            apply_valuation(movements)
+            update_document_totals(movement_lines(movements))
+            apply_purchases(user.business_id, movements)
+            publish_movements(user.business_id, movements)
+        return results
+
+    def _item_error(self, user, data, existing, products, documents, suppliers):
+        if data['client_id'] in existing:
+            return 'duplicate'
+        permission, message = self.PERMISSIONS[data['movement_type']]
+        if not getattr(user, permission):
+            return message
+        if data['product_id'] not in products:
+            return "El producto no pertenece a tu empresa."
+        document_id = data.get('document_id')
+        if document_id:
+            expected = self.DOCUMENT_TYPES[data['movement_type']]
+            if document_id not in documents:
+                return "El documento no pertenece a tu empresa."
+            if documents[document_id] != expected:
+                return f"El documento debe ser de tipo '{expected}' para movimientos de tipo '{data['movement_type']}'."
+        if data.get('supplier_id') and data['supplier_id'] not in suppliers:
+            return "El proveedor no pertenece a tu empresa."
+        return None
+
+    def to_representation(self, instance):
+        counts = {}
+        for result in instance:
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        return {'summary': counts, 'results': instance}
@@ -0,0 +1,107 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F
+from .cache import invalidate_scanned_products
+from .changefeed import record_stock_changes
+from .models import Branch, Document, Product, Stock
+from .realtime import publish_stock_changes
+
+
+def lock_stocks(keys, create_missing=False):
+    """
+    Bloquea las filas de Stock de los pares (product_id, branch_id) indicados.
+    Las filas se bloquean siempre en orden (product_id, branch_id) para que dos
+    escrituras concurrentes nunca se esperen mutuamente en orden inverso.
+    Devuelve un diccionario {(product_id, branch_id): Stock}.
+    """
+    keys = sorted(set(keys))
+    if not keys:
+        return {}
+    product_ids = {product_id for product_id, _ in keys}
+    branch_ids = {branch_id for _, branch_id in keys}
+    wanted = set(keys)
+    missing = set()
+    if create_missing:
+        missing = wanted - set(
+            Stock.objects.filter(product_id__in=product_ids, branch_id__in=branch_ids).values_list('product_id', 'branch_id')
+        )
+        if missing:
+            Stock.objects.bulk_create(
+                [Stock(product_id=product_id, branch_id=branch_id, quantity=0, minimum_stock=0) for product_id, branch_id in sorted(missing)],
+                ignore_conflicts=True,
+            )
+    rows = (
+        Stock.objects.select_for_update()
+        .filter(product_id__in=product_ids, branch_id__in=branch_ids)
+        .order_by('product_id', 'branch_id')
+    )
+    stocks = {(s.product_id, s.branch_id): s for s in rows if (s.product_id, s.branch_id) in wanted}
+    if missing:
+        # bulk_create no dispara post_save: las filas nuevas se registran aquí en el
+        # feed de cambios (si otra escritura ganó la carrera, la entrada se repite).
+        businesses = dict(Branch.objects.filter(id__in={branch_id for _, branch_id in missing}).values_list('id', 'business_id'))
+        for branch_id, business_id in businesses.items():
+            record_stock_changes(business_id, [stocks[key] for key in sorted(missing) if key[1] == branch_id and key in stocks])
+    return stocks
+
+
+def apply_stock_deltas(business_id, deltas, stocks):
+    """
+    Aplica los deltas netos {(product_id, branch_id): delta} sobre filas ya
+    bloqueadas con lock_stocks y las persiste en un único UPDATE por lote.
+    """
+    assert transaction.get_connection().in_atomic_block, "apply_stock_deltas requiere una transacción activa."
+    changes = []
+    for key, delta in deltas.items():
+        if not delta:
+            continue
+        stock = stocks[key]
+        changes.append((stock, stock.quantity))
+        stock.quantity += delta
+    changed = [stock for stock, _ in changes]
+    if changed:
+        Stock.objects.bulk_update(changed, ['quantity'], batch_size=500)
+        invalidate_scanned_products({stock.product_id for stock in changed})
+        record_stock_changes(business_id, changed)
+        publish_stock_changes(business_id, changes)
+    return changed
+
+
+def update_document_totals(lines, sign=1):
+    """
+    Suma (sign=1) o resta (sign=-1) líneas de movimiento a los totales de sus
+    documentos, con un UPDATE atómico por documento y en orden de id.
+    `lines`: iterable de (document_id, quantity, unit_price).
+    """
+    deltas = {}
+    for document_id, quantity, unit_price in lines:
+        if not document_id:
+            continue
+        count, total_quantity, amount = deltas.get(document_id, (0, 0, Decimal('0')))
+        deltas[document_id] = (
+            count + sign,
+            total_quantity + sign * quantity,
+            amount + sign * quantity * (unit_price or 0),
+        )
+    for document_id, (count, total_quantity, amount) in sorted(deltas.items()):
+        Document.objects.filter(pk=document_id).update(
+            line_count=F('line_count') + count,
+            total_quantity=F('total_quantity') + total_quantity,
+            total_amount=F('total_amount') + amount,
+        )
+
+
+def movement_lines(movements):
+    return [(m.document_id, m.quantity, m.unit_price) for m in movements]
+
+
+def branch_products(business_id, branch_id):
+    """
+    Productos que maneja una sucursal: los que tienen fila de Stock en ella (el
+    alta de productos y las escrituras de movimientos la crean). Se resuelve como
+    semi-join sobre el índice (branch, product) de Stock, sin JOIN ni DISTINCT.
+    """
+    return Product.objects.filter(
+        business_id=business_id,
+        id__in=Stock.objects.filter(branch_id=branch_id).values('product_id'),
+    )
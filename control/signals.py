@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+from .cache import invalidate_scanned_products
+from .changefeed import record_changes
+from .edge import configure_sqlite, new_client_id
+from .models import Branch, Business, Category, Movement, Product, Stock, Supplier
+from .reference import bump_version
+from .services import movement_lines, update_document_totals
+from .supplier_prices import recompute_after_commit
+
+
+@receiver([post_save, post_delete], sender=Product)
+def invalidate_product_scan(sender, instance, **kwargs):
+    invalidate_scanned_products([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=Stock)
+def invalidate_stock_scan(sender, instance, **kwargs):
+    invalidate_scanned_products([instance.product_id])
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Branch)
+@receiver([post_save, post_delete], sender=Supplier)
+def record_catalog_change(sender, instance, signal, **kwargs):
+    record_changes(instance.business_id, sender._meta.model_name, [instance.pk], deleted=signal is post_delete)
+
+
+@receiver([post_save, post_delete], sender=Stock)
+def record_stock_change(sender, instance, signal, **kwargs):
+    if Stock._meta.get_field('branch').is_cached(instance):
+        business_id = instance.branch.business_id
+    else:
+        business_id = Branch.objects.filter(id=instance.branch_id).values_list('business_id', flat=True).first()
+    if business_id is not None:
+        record_changes(business_id, 'stock', [instance.pk], branch_id=instance.branch_id, deleted=signal is post_delete)
+
+
+@receiver([post_save, post_delete], sender=Business)
+@receiver([post_save, post_delete], sender=Branch)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Supplier)
+def invalidate_reference_data(sender, instance, **kwargs):
+    bump_version(instance.pk if sender is Business else instance.business_id)
+
+
+# Los caminos que usan bulk_create (transferencias, sincronización offline)
+# llaman a update_document_totals y apply_purchases explícitamente; el alta
+# individual llama a apply_purchases desde el serializer.
+@receiver(pre_save, sender=Movement)
+def remember_previous_line(sender, instance, **kwargs):
+    if not instance._state.adding and instance.pk:
+        instance._previous_line = Movement.objects.filter(pk=instance.pk).values_list(
+            'document_id', 'quantity', 'unit_price', 'movement_type', 'supplier_id', 'product_id',
+        ).first()
+
+
+def _purchase_pair(movement_type, supplier_id, product_id):
+    return (supplier_id, product_id) if movement_type == 'purchase' and supplier_id else None
+
+
+@receiver(post_save, sender=Movement)
+def add_document_line(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_line', None)
+    if previous:
+        update_document_totals([previous[:3]], sign=-1)
+        instance._previous_line = None
+    update_document_totals(movement_lines([instance]))
+    if not previous and Movement.document.is_cached(instance) and instance.document:
+        # Para que la respuesta que anida el documento ya incluya esta línea.
+        document = instance.document
+        document.line_count += 1
+        document.total_quantity += instance.quantity
+        document.total_amount += instance.quantity * (instance.unit_price or 0)
+    if not created:
+        pairs = [_purchase_pair(instance.movement_type, instance.supplier_id, instance.product_id)]
+        if previous:
+            pairs.append(_purchase_pair(*previous[3:]))
+        recompute_after_commit([pair for pair in pairs if pair])
+
+
+@receiver(post_delete, sender=Movement)
+def remove_document_line(sender, instance, **kwargs):
+    update_document_totals(movement_lines([instance]), sign=-1)
+    pair = _purchase_pair(instance.movement_type, instance.supplier_id, instance.product_id)
+    if pair:
+        recompute_after_commit([pair])
+
+
+@receiver(pre_save, sender=Movement)
+def stamp_edge_client_id(sender, instance, **kwargs):
+    # En el nodo de sucursal cada movimiento nace con el client_id con el que
+    # se enviará al central; el id local se repite si el nodo se reinicia.
+    if settings.EDGE_MODE and instance._state.adding and not instance.client_id:
+        instance.client_id = new_client_id()
+
+
+@receiver(connection_created)
+def configure_edge_database(sender, connection, **kwargs):
+    configure_sqlite(connection)
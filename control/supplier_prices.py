@@ -0,0 +1,233 @@
+"""
+Índice de precios de compra por (empresa, proveedor, producto): último,
+mínimo, máximo y promedio ponderado por cantidad, con la cantidad de compras y
+la fecha de la última.
+
+Solo cuentan las compras con proveedor y precio. Las filas se actualizan al
+escribir cada compra. Mínimo, máximo y último no se pueden deshacer
+incrementalmente: al editar o borrar una compra se recalculan desde las
+compras las filas de los pares (proveedor, producto) afectados, después del
+commit. `python manage.py rebuild_supplier_prices` recalcula empresas enteras.
+"""
+import heapq
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from .models import ArchivedMovement, Movement, Supplier, SupplierPrice
+
+AVERAGE_PLACES = Decimal('0.0001')
+ZERO = Decimal('0')
+FIELDS = ['last_price', 'min_price', 'max_price', 'average_price', 'purchase_count', 'quantity_purchased', 'last_purchase_at']
+
+# Criterio para elegir el proveedor de cada producto: el de último precio más
+# bajo o el de la compra más reciente.
+PICKS = {
+    'cheapest': [F('last_price').asc(), F('last_purchase_at').desc()],
+    'recent': [F('last_purchase_at').desc(), F('last_price').asc()],
+}
+
+
+def _purchase(movement_type, supplier_id, unit_price):
+    return movement_type == 'purchase' and supplier_id and unit_price is not None
+
+
+def _add(entry, quantity, unit_price, date):
+    quantity = abs(quantity)
+    if not entry.purchase_count:
+        entry.min_price = entry.max_price = entry.last_price = unit_price
+        entry.average_price = Decimal(unit_price)
+        entry.last_purchase_at = date
+    total = entry.average_price * entry.quantity_purchased + unit_price * quantity
+    entry.quantity_purchased += quantity
+    entry.purchase_count += 1
+    if entry.quantity_purchased:
+        entry.average_price = (total / entry.quantity_purchased).quantize(AVERAGE_PLACES)
+    entry.min_price = min(entry.min_price, unit_price)
+    entry.max_price = max(entry.max_price, unit_price)
+    if date >= entry.last_purchase_at:
+        entry.last_price = unit_price
+        entry.last_purchase_at = date
+
+
+def _new(business_id, supplier_id, product_id, unit_price, date):
+    return SupplierPrice(
+        business_id=business_id, supplier_id=supplier_id, product_id=product_id, last_price=unit_price,
+        min_price=unit_price, max_price=unit_price, average_price=unit_price, last_purchase_at=date,
+    )
+
+
+def apply_purchases(business_id, movements):
+    """
+    Incorpora las compras recién creadas. Se llama explícitamente desde cada
+    camino de escritura, dentro de su transacción y después de bloquear el stock.
+    """
+    purchases = [m for m in movements if _purchase(m.movement_type, m.supplier_id, m.unit_price)]
+    if not purchases:
+        return
+    assert transaction.get_connection().in_atomic_block, "apply_purchases requiere una transacción activa."
+    now = timezone.now()
+    first = {}
+    for m in purchases:
+        first.setdefault((m.supplier_id, m.product_id), m)
+    entries = {}
+    for attempt in range(2):
+        queryset = SupplierPrice.objects.select_for_update().filter(
+            business_id=business_id,
+            supplier_id__in={supplier_id for supplier_id, _ in first},
+            product_id__in={product_id for _, product_id in first},
+        ).order_by('supplier_id', 'product_id')
+        entries = {(e.supplier_id, e.product_id): e for e in queryset if (e.supplier_id, e.product_id) in first}
+        missing = first.keys() - entries.keys()
+        if not missing or attempt:
+            break
+        # Solo la primera compra de cada par: se crea la fila (sin compras) y se bloquea como las demás.
+        SupplierPrice.objects.bulk_create([
+            _new(business_id, supplier_id, product_id, first[(supplier_id, product_id)].unit_price, now)
+            for supplier_id, product_id in sorted(missing)
+        ], ignore_conflicts=True)
+    for m in purchases:
+        _add(entries[(m.supplier_id, m.product_id)], m.quantity, m.unit_price, m.date or now)
+    SupplierPrice.objects.bulk_update(list(entries.values()), FIELDS, batch_size=500)
+
+
+def rebuild(business_id, querysets):
+    """Recalcula las filas de una empresa desde uno o más querysets de movimientos, mezclados por fecha."""
+    fields = ('date', 'id', 'supplier_id', 'product_id', 'quantity', 'unit_price')
+    streams = [
+        qs.filter(movement_type='purchase', supplier__isnull=False, unit_price__isnull=False)
+        .order_by('date', 'id').values_list(*fields).iterator(chunk_size=5000)
+        for qs in querysets
+    ]
+    entries = {}
+    for date, _, supplier_id, product_id, quantity, unit_price in heapq.merge(*streams):
+        key = (supplier_id, product_id)
+        if key not in entries:
+            entries[key] = _new(business_id, supplier_id, product_id, unit_price, date)
+        _add(entries[key], quantity, unit_price, date)
+    return list(entries.values())
+
+
+def _purchases(business_id, pairs):
+    querysets = []
+    for model in (ArchivedMovement, Movement):
+        queryset = model.objects.filter(
+            branch__business_id=business_id, movement_type='purchase', supplier__isnull=False, unit_price__isnull=False,
+        )
+        if pairs is not None:
+            queryset = queryset.filter(
+                supplier_id__in={supplier_id for supplier_id, _ in pairs},
+                product_id__in={product_id for _, product_id in pairs},
+            )
+        querysets.append(queryset)
+    return querysets
+
+
+def recompute(business_id, pairs=None):
+    """
+    Recalcula desde las compras (vigentes y archivadas) las filas de una empresa,
+    o solo las de los pares (proveedor, producto) indicados. Devuelve cuántas
+    filas quedaron.
+
+    Primero crea, en su propia transacción, las filas que faltan; después las
+    bloquea y recién entonces lee las compras. Una compra simultánea confirmada
+    antes del bloqueo entra en esa lectura; una posterior espera el bloqueo y
+    se suma al resultado. Así ninguna choca con una inserción del recálculo.
+    """
+    if pairs is not None:
+        pairs = set(pairs)
+        if not pairs:
+            return 0
+    found = set()
+    for queryset in _purchases(business_id, pairs):
+        found.update(queryset.values_list('supplier_id', 'product_id').distinct().order_by())
+    if pairs is not None:
+        found &= pairs
+    now = timezone.now()
+    with transaction.atomic():
+        SupplierPrice.objects.bulk_create([
+            _new(business_id, supplier_id, product_id, ZERO, now) for supplier_id, product_id in sorted(found)
+        ], batch_size=1000, ignore_conflicts=True)
+    with transaction.atomic():
+        rows = SupplierPrice.objects.select_for_update().filter(business_id=business_id).order_by('supplier_id', 'product_id')
+        if pairs is not None:
+            rows = rows.filter(
+                supplier_id__in={supplier_id for supplier_id, _ in pairs},
+                product_id__in={product_id for _, product_id in pairs},
+            )
+        rows = {(row.supplier_id, row.product_id): row for row in rows}
+        if pairs is not None:
+            rows = {key: row for key, row in rows.items() if key in pairs}
+        entries = {(e.supplier_id, e.product_id): e for e in rebuild(business_id, _purchases(business_id, pairs))}
+        changed, stale = [], []
+        for key, row in rows.items():
+            entry = entries.get(key)
+            if entry is None:
+                stale.append(row.pk)
+                continue
+            for field in FIELDS:
+                setattr(row, field, getattr(entry, field))
+            changed.append(row)
+        SupplierPrice.objects.bulk_update(changed, FIELDS, batch_size=500)
+        if stale:
+            SupplierPrice.objects.filter(pk__in=stale).delete()
+    return len(changed)
+
+
+class _PendingRecompute:
+    """Callback de on_commit que junta los pares de toda la transacción."""
+
+    def __init__(self, pairs):
+        self.pairs = set(pairs)
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        businesses = dict(Supplier.objects.filter(
+            id__in={supplier_id for supplier_id, _ in self.pairs},
+        ).values_list('id', 'business_id'))
+        by_business = {}
+        for supplier_id, product_id in self.pairs:
+            # Un proveedor borrado ya se llevó sus filas en cascada.
+            if supplier_id in businesses:
+                by_business.setdefault(businesses[supplier_id], set()).add((supplier_id, product_id))
+        for business_id, pairs in sorted(by_business.items()):
+            recompute(business_id, pairs)
+
+
+def recompute_after_commit(pairs):
+    """
+    Programa el recálculo de los pares (proveedor, producto) para después del
+    commit: una sola vez por transacción aunque se editen o borren muchas
+    compras (p. ej. en cascada al borrar un producto), y sobre datos ya
+    confirmados.
+    """
+    pairs = {(supplier_id, product_id) for supplier_id, product_id in pairs if supplier_id}
+    if not pairs:
+        return
+    connection = transaction.get_connection()
+    # Si ya hay uno pendiente en esta transacción, se le suman los pares.
+    for entry in connection.run_on_commit:
+        if isinstance(entry[1], _PendingRecompute) and not entry[1].done:
+            entry[1].pairs |= pairs
+            return
+    transaction.on_commit(_PendingRecompute(pairs))
+
+
+def best_suppliers(business_id, pick='cheapest', category_id=None, product_ids=None):
+    """Un proveedor por producto según `pick`, en una sola consulta (ROW_NUMBER por producto)."""
+    queryset = SupplierPrice.objects.filter(business_id=business_id)
+    if category_id:
+        queryset = queryset.filter(product__category_id=category_id)
+    if product_ids:
+        queryset = queryset.filter(product_id__in=product_ids)
+    return (
+        queryset.annotate(rank=Window(RowNumber(), partition_by=[F('product_id')], order_by=PICKS[pick]))
+        .filter(rank=1)
+        .order_by('product__name', 'product_id')
+        .values(
+            'product_id', 'product__name', 'supplier_id', 'supplier__name', 'last_price', 'min_price', 'max_price',
+            'average_price', 'purchase_count', 'last_purchase_at',
+        )
+    )
@@ -0,0 +1,122 @@
+"""
+Borrado diferido de empresas.
+
+DeleteUserView solo marca la empresa y desactiva a sus usuarios; el comando
+process_tenant_deletions borra después las filas por lotes acotados, en orden
+de dependencias, para que ni la memoria ni el tiempo de bloqueo crezcan con el
+tamaño de la empresa.
+"""
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from .models import (
+    ArchivedMovement, Branch, Business, Category, ChangeFeedSequence, ChangeLogEntry, CostLayer, Document, IdempotencyKey,
+    Movement, Product, Stock, StockValuation, Supplier, SupplierPrice, TenantDeletion, TenantReport,
+)
+
+
+def deletion_plan(business_id):
+    """
+    Pasos (nombre, queryset, borrado_directo) en orden de dependencias. Los pasos
+    con borrado directo no necesitan señales ni cascadas: todo lo que apunta a
+    esas filas ya se borró en un paso anterior.
+    """
+    User = get_user_model()
+    return [
+        ('change_log', ChangeLogEntry.objects.filter(business_id=business_id), True),
+        ('change_feed_sequence', ChangeFeedSequence.objects.filter(business_id=business_id), True),
+        ('reports', TenantReport.objects.filter(business_id=business_id), True),
+        ('idempotency_keys', IdempotencyKey.objects.filter(user__business_id=business_id), True),
+        ('archived_movements', ArchivedMovement.objects.filter(branch__business_id=business_id), True),
+        ('movements', Movement.objects.filter(branch__business_id=business_id), True),
+        ('stocks', Stock.objects.filter(branch__business_id=business_id), True),
+        ('cost_layers', CostLayer.objects.filter(branch__business_id=business_id), True),
+        ('valuations', StockValuation.objects.filter(branch__business_id=business_id), True),
+        ('supplier_prices', SupplierPrice.objects.filter(business_id=business_id), True),
+        ('documents', Document.objects.filter(business_id=business_id), True),
+        ('products', Product.objects.filter(business_id=business_id), True),
+        ('categories', Category.objects.filter(business_id=business_id), True),
+        ('suppliers', Supplier.objects.filter(business_id=business_id), True),
+        ('tokens', OutstandingToken.objects.filter(user__business_id=business_id), False),
+        ('users', User.objects.filter(business_id=business_id), False),
+        ('branches', Branch.objects.filter(business_id=business_id), True),
+        ('business', Business.objects.filter(id=business_id), False),
+    ]
+
+
+def request_tenant_deletion(business):
+    """Marca la empresa para borrar y bloquea el acceso de sus usuarios de inmediato."""
+    User = get_user_model()
+    with transaction.atomic():
+        Business.objects.filter(pk=business.pk).update(deletion_requested_at=timezone.now())
+        User.objects.filter(business=business).update(is_active=False)
+        return TenantDeletion.objects.create(business_id=business.pk, business_name=business.name)
+
+
+class TenantDeletionLost(Exception):
+    """Otra ejecución retomó la solicitud: esta debe dejarla."""
+
+
+def claim_tenant_deletion(deletion):
+    """
+    Toma la solicitud con un UPDATE condicional, así de dos ejecuciones
+    superpuestas solo una la procesa. Una solicitud en 'running' se retoma solo
+    si su proceso dejó de renovar heartbeat_at durante
+    TENANT_DELETION_LEASE_SECONDS (se cayó a mitad de camino).
+    """
+    now = timezone.now()
+    stale = now - timedelta(seconds=settings.TENANT_DELETION_LEASE_SECONDS)
+    claimed = TenantDeletion.objects.filter(pk=deletion.pk).filter(
+        Q(status__in=['pending', 'failed'])
+        | Q(status='running', heartbeat_at__lt=stale)
+        | Q(status='running', heartbeat_at__isnull=True)
+    ).update(status='running', heartbeat_at=now, started_at=Coalesce('started_at', now))
+    if claimed:
+        deletion.refresh_from_db()
+    return bool(claimed)
+
+
+def _renew(deletion, *fields):
+    """Guarda el progreso y renueva el heartbeat, solo si la solicitud sigue siendo nuestra."""
+    now = timezone.now()
+    updated = TenantDeletion.objects.filter(pk=deletion.pk, heartbeat_at=deletion.heartbeat_at).update(
+        heartbeat_at=now, **{field: getattr(deletion, field) for field in fields}
+    )
+    if not updated:
+        raise TenantDeletionLost(f"La eliminación de '{deletion.business_name}' la retomó otro proceso.")
+    deletion.heartbeat_at = now
+
+
+def run_tenant_deletion(deletion, batch_size=1000, sleep=0, log=None):
+    """Procesa una solicitud ya tomada con claim_tenant_deletion."""
+    for step, queryset, raw in deletion_plan(deletion.business_id):
+        deletion.current_step = step
+        _renew(deletion, 'current_step')
+        model = queryset.model
+        while True:
+            ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                batch = model._base_manager.filter(pk__in=ids)
+                if raw:
+                    deleted = batch._raw_delete(batch.db)
+                else:
+                    deleted = len(ids)
+                    batch.delete()
+            deletion.rows_deleted += deleted
+            _renew(deletion, 'rows_deleted')
+            if log:
+                log(f"[{deletion.business_name}] {step}: {deletion.rows_deleted} filas eliminadas")
+            if sleep:
+                time.sleep(sleep)
+    deletion.status = 'done'
+    deletion.current_step = ''
+    deletion.finished_at = timezone.now()
+    _renew(deletion, 'status', 'current_step', 'finished_at')
@@ -1,3 +1,978 @@
-from django.test import TestCase
+import asyncio
+from datetime import datetime, timedelta
+from decimal import Decimal
+import os
+import tempfile
+from pathlib import Path
+from io import StringIO
+from unittest import mock
+from django.core.management import CommandError, call_command
+from django.conf import settings
+from django.core.paginator import EmptyPage
+from drf_spectacular.generators import SchemaGenerator
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from Inventory360 import schema
+from user_control.models import User
+from .admin import EstimatedCountPaginator
+from .cache import scan_cache
+from .changefeed import build_page
+from .edge import push
+from .services import branch_products
+from .realtime import InProcessBroker, _redeem_ticket, issue_stream_ticket, publish_stock_changes, sse_application
+from .throttling import _GLOBAL_SLOTS_KEY, acquire_slots, release_slots
+from .models import ArchivedMovement, Branch, Business, Category, ChangeLogEntry, CostLayer, Document, IdempotencyKey, Movement, Product, Stock, Supplier, SupplierPrice, TenantDeletion, TenantReport
+from .valuation import Ledger, replay
+from .tenants import TenantDeletionLost, claim_tenant_deletion, request_tenant_deletion, run_tenant_deletion
 
-# Create your tests here.
+
+class InventoryTestCase(TestCase):
+    """Empresa con dos sucursales, cinco productos con stock 10 en ambas y un admin."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.business = Business.objects.create(name='Empresa', address='Calle 1', phone='1')
+        cls.branch = Branch.objects.create(name='Centro', address='Calle 1', phone='1', business=cls.business)
+        cls.other_branch = Branch.objects.create(name='Norte', address='Calle 2', phone='2', business=cls.business)
+        cls.category = Category.objects.create(name='General', business=cls.business)
+        cls.user = User.objects.create_user(
+            username='admin', email='admin@empresa.com', password='clave', name='Admin', role='admin',
+            business=cls.business, can_purchase=True, can_sale=True, can_adjust=True, can_transfer=True,
+        )
+        cls.products = [
+            Product.objects.create(name=f"Producto {i}", description='-', price=10, business=cls.business, category=cls.category)
+            for i in range(5)
+        ]
+        Stock.objects.bulk_create([
+            Stock(product=product, branch=branch, quantity=10, minimum_stock=5)
+            for product in cls.products for branch in (cls.branch, cls.other_branch)
+        ])
+
+    def setUp(self):
+        # Los buckets del throttling viven en la caché: cada prueba empieza con todos llenos.
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class MovementFilterTests(InventoryTestCase):
+    DAYS = 400
+    PER_DAY = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Movement.objects.bulk_create([
+            Movement(movement_type='sale', product=cls.products[i % 5], branch=(cls.branch, cls.other_branch)[i % 2],
+                     quantity=1, unit_price=10)
+            for i in range(cls.DAYS * cls.PER_DAY)
+        ])
+        # date es auto_now_add: se reparte después, PER_DAY movimientos por día hacia atrás.
+        cls.now = timezone.now()
+        for day in range(cls.DAYS):
+            Movement.objects.filter(id__in=list(
+                Movement.objects.order_by('id').values_list('id', flat=True)[day * cls.PER_DAY:(day + 1) * cls.PER_DAY]
+            )).update(date=cls.now - timedelta(days=day))
+
+    def _params(self):
+        return {
+            'branch': self.branch.id,
+            'date_from': (self.now - timedelta(days=30)).date().isoformat(),
+            'date_to': (self.now - timedelta(days=21)).date().isoformat(),
+        }
+
+    def test_date_range_and_branch_list_query_count(self):
+        # Con la caché de referencia caliente: movimientos (con usuario y documento)
+        # y sus productos con el stock sumado.
+        self.client.get('/api/control/movements/', self._params())
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/control/movements/', self._params())
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()
+        self.assertEqual(len(rows), 10 * self.PER_DAY // 2)
+        self.assertTrue(all(row['branch']['id'] == self.branch.id for row in rows))
+
+    def test_branch_date_index_exists(self):
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(cursor, Movement._meta.db_table)
+        index = constraints.get('movement_branch_date_idx')
+        self.assertIsNotNone(index)
+        self.assertTrue(index['index'])
+        self.assertEqual(index['columns'], ['branch_id', 'date'])
+
+    def test_query_count_does_not_grow_with_the_range(self):
+        # Diez días o cien: las mismas dos consultas, sin una por fila.
+        params = {**self._params(), 'date_from': (self.now - timedelta(days=120)).date().isoformat()}
+        self.client.get('/api/control/movements/', params)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/control/movements/', params)
+        self.assertEqual(len(response.json()), 100 * self.PER_DAY // 2)
+
+
+class EstimatedCountPaginatorTests(InventoryTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Movement.objects.bulk_create([
+            Movement(movement_type='sale', product=cls.products[0], branch=cls.branch, quantity=1, unit_price=10)
+            for _ in range(240)
+        ])
+
+    def _paginator(self):
+        return EstimatedCountPaginator(Movement.objects.filter(branch=self.branch).order_by('id'), 10)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=30)
+    def test_pages_beyond_capped_count(self):
+        paginator = self._paginator()
+        self.assertEqual((paginator.count, paginator.num_pages), (31, 4))
+        # 240 movimientos: 24 páginas reales, aunque el conteo se corte en 31.
+        self.assertEqual(len(paginator.page(24).object_list), 10)
+        with self.assertRaises(EmptyPage):
+            paginator.page(25)
+        self.assertEqual(list(paginator.get_elided_page_range(10)),
+                         [1, 2, paginator.ELLIPSIS, 7, 8, 9, 10, 11, paginator.ELLIPSIS])
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=1000)
+    def test_exact_count_below_cap(self):
+        paginator = self._paginator()
+        self.assertEqual((paginator.count, paginator.num_pages), (240, 24))
+        with self.assertRaises(EmptyPage):
+            paginator.page(25)
+
+
+class TenantDeletionClaimTests(InventoryTestCase):
+    def test_overlapping_runs_claim_a_deletion_once(self):
+        deletion = request_tenant_deletion(self.business)
+        first, second = (TenantDeletion.objects.get(pk=deletion.pk) for _ in range(2))
+        self.assertTrue(claim_tenant_deletion(first))
+        self.assertFalse(claim_tenant_deletion(second))
+
+    def test_abandoned_deletion_is_reclaimed_and_the_old_run_stops(self):
+        deletion = request_tenant_deletion(self.business)
+        self.assertTrue(claim_tenant_deletion(deletion))
+        stale = timezone.now() - timedelta(seconds=settings.TENANT_DELETION_LEASE_SECONDS + 1)
+        TenantDeletion.objects.filter(pk=deletion.pk).update(heartbeat_at=stale)
+        retaken = TenantDeletion.objects.get(pk=deletion.pk)
+        self.assertTrue(claim_tenant_deletion(retaken))
+        deletion.heartbeat_at = stale
+        with self.assertRaises(TenantDeletionLost):
+            run_tenant_deletion(deletion)
+        run_tenant_deletion(retaken)
+        retaken.refresh_from_db()
+        self.assertEqual(retaken.status, 'done')
+        self.assertFalse(Business.objects.filter(pk=self.business.pk).exists())
+
+
+class LedgerReplayTests(InventoryTestCase):
+    def test_position_can_start_with_any_movement_type(self):
+        now = timezone.now()
+        for movement_type, quantity, unit_price in [
+            ('sale', 3, None), ('adjustment', -2, None), ('purchase', 4, None), ('transfer', 1, None),
+        ]:
+            ledger = Ledger()
+            ledger.apply(movement_type, 1, 1, 2 if movement_type == 'transfer' else None, quantity, unit_price, now)
+            for position in ledger.positions.values():
+                self.assertIsInstance(position.valuation.average_value, Decimal)
+
+    def test_replay_matches_incremental_valuation(self):
+        product = self.products[0]
+        sale = {'movement_type': 'sale', 'product_id': product.id, 'branch_id': self.branch.id, 'quantity': 2, 'unit_price': '10.00'}
+        purchase = {'movement_type': 'purchase', 'product_id': product.id, 'branch_id': self.branch.id, 'quantity': 5, 'unit_price': '4.00'}
+        transfer = {'movement_type': 'transfer', 'product_id': product.id, 'branch_id': self.other_branch.id,
+                    'branch_from_id': self.branch.id, 'quantity': 3}
+        # La primera escritura de la posición es una venta, sin costo conocido.
+        for body in (sale, purchase, transfer, sale):
+            response = self.client.post('/api/control/movements/', body, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+        ledger, count = replay([Movement.objects.all()])
+        self.assertEqual(count, 4)
+        for valuation in product.valuations.all():
+            replayed = ledger.positions[(valuation.product_id, valuation.branch_id)].valuation
+            self.assertEqual(replayed.quantity, valuation.quantity)
+            self.assertEqual(replayed.average_cost, valuation.average_cost)
+            self.assertEqual(Decimal(replayed.average_value).quantize(Decimal('0.01')), valuation.average_value.quantize(Decimal('0.01')))
+            self.assertEqual(Decimal(replayed.fifo_value).quantize(Decimal('0.01')), valuation.fifo_value.quantize(Decimal('0.01')))
+
+
+class MovementWriteQueryBudgetTests(InventoryTestCase):
+    """
+    Presupuesto fijo de consultas del alta individual (POST movements/). Dentro
+    de TestCase la transacción de la vista cuenta dos más (SAVEPOINT y RELEASE).
+    """
+
+    def _post(self, body):
+        return self.client.post('/api/control/movements/', body, format='json')
+
+    def test_sale_query_budget(self):
+        product = self.products[0]
+        body = {'movement_type': 'sale', 'product_id': product.id, 'branch_id': self.branch.id, 'quantity': 1, 'unit_price': '10.00'}
+        self._post(body)
+        # Producto y sucursal; bloqueo del stock, alta, stock, feed de cambios y valuación.
+        with self.assertNumQueries(11):
+            response = self._post(body)
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def test_transfer_with_document_query_budget(self):
+        product = self.products[0]
+        document = Document.objects.create(document_type='transfer_note', document_number='TR-1',
+                                           business=self.business, created_by=self.user)
+        body = {'movement_type': 'transfer', 'product_id': product.id, 'branch_id': self.other_branch.id,
+                'branch_from_id': self.branch.id, 'quantity': 1, 'document_id': document.id}
+        self._post(body)
+        # Además: sucursal de origen, documento, sus totales y la capa FIFO de destino.
+        with self.assertNumQueries(15):
+            response = self._post(body)
+        self.assertEqual(response.status_code, 201, response.content)
+        document.refresh_from_db()
+        self.assertEqual((document.line_count, document.total_quantity), (2, 2))
+
+
+class AdmissionControlTests(InventoryTestCase):
+    def test_streaming_response_holds_its_slot_until_sent(self):
+        response = self.client.get('/api/control/stocks/matrix/', {'stream': 1})
+        self.assertEqual(len(cache.get(_GLOBAL_SLOTS_KEY)), 1)
+        b''.join(response.streaming_content)
+        response.close()
+        self.assertEqual(cache.get(_GLOBAL_SLOTS_KEY), {})
+
+    @override_settings(THROTTLE_BUSINESS_MAX_CONCURRENCY=1)
+    def test_business_read_slots(self):
+        slots = acquire_slots(self.business.id, priority=False)
+        self.assertIsNone(acquire_slots(self.business.id, priority=False))
+        self.assertIsNotNone(acquire_slots(self.business.id, priority=True))
+        release_slots(slots)
+        self.assertIsNotNone(acquire_slots(self.business.id, priority=False))
+
+    @override_settings(THROTTLE_AUTH_BUCKET={'capacity': 2, 'refill_per_second': 0.001})
+    def test_login_has_its_own_bucket(self):
+        anonymous = APIClient()
+        codes = [
+            anonymous.post('/user-control/login/', {'email': self.user.email, 'password': 'otra'}, format='json').status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(codes, [401, 401, 429])
+        self.assertEqual(self.client.get('/api/control/products/').status_code, 200)
+
+
+class DocumentTotalsTests(InventoryTestCase):
+    """Los totales mantenidos al escribir coinciden con el recálculo de repair_document_totals."""
+
+    def setUp(self):
+        super().setUp()
+        self.invoice = Document.objects.create(document_type='invoice', document_number='F-1',
+                                               business=self.business, created_by=self.user)
+        self.other_invoice = Document.objects.create(document_type='invoice', document_number='F-2',
+                                                     business=self.business, created_by=self.user)
+
+    def assertTotalsMatchRepair(self):
+        def totals():
+            return {d.id: (d.line_count, d.total_quantity, d.total_amount) for d in Document.objects.order_by('id')}
+        stored = totals()
+        call_command('repair_document_totals', stdout=StringIO())
+        self.assertEqual(stored, totals())
+
+    def _sale(self, quantity=2, unit_price='7.50', document=None):
+        response = self.client.post('/api/control/movements/', {
+            'movement_type': 'sale', 'product_id': self.products[0].id, 'branch_id': self.branch.id,
+            'quantity': quantity, 'unit_price': unit_price, 'document_id': (document or self.invoice).id,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def test_create(self):
+        self._sale()
+        self._sale(quantity=1, unit_price='3.25')
+        self.assertTotalsMatchRepair()
+        self.invoice.refresh_from_db()
+        self.assertEqual((self.invoice.line_count, self.invoice.total_quantity, self.invoice.total_amount),
+                         (2, 3, Decimal('18.25')))
+
+    def test_update(self):
+        movement_id = self._sale()
+        self._sale(quantity=1)
+        body = {'movement_type': 'sale', 'product_id': self.products[0].id, 'branch_id': self.branch.id,
+                'quantity': 4, 'unit_price': '2.00', 'document_id': self.invoice.id}
+        response = self.client.put(f'/api/control/movements/{movement_id}/', body, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTotalsMatchRepair()
+        body['document_id'] = self.other_invoice.id
+        response = self.client.put(f'/api/control/movements/{movement_id}/', body, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTotalsMatchRepair()
+        self.other_invoice.refresh_from_db()
+        self.assertEqual((self.other_invoice.line_count, self.other_invoice.total_amount), (1, Decimal('8.00')))
+
+    def test_delete(self):
+        movement_id = self._sale()
+        self._sale(quantity=1)
+        self.assertEqual(self.client.delete(f'/api/control/movements/{movement_id}/').status_code, 204)
+        self.assertTotalsMatchRepair()
+
+    def test_transfer(self):
+        response = self.client.post('/api/control/transfers/', {
+            'branch_from_id': self.branch.id, 'branch_id': self.other_branch.id,
+            'lines': [{'product_id': product.id, 'quantity': 2} for product in self.products[:3]],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertTotalsMatchRepair()
+        document = Document.objects.get(document_type='transfer_note')
+        self.assertEqual((document.line_count, document.total_quantity), (3, 6))
+
+    def test_sync(self):
+        response = self.client.post('/api/control/sync/movements/', {
+            'branch_id': self.branch.id, 'policy': 'reject',
+            'items': [
+                {'client_id': f'pos-{i}', 'movement_type': 'sale', 'product_id': self.products[i].id,
+                 'quantity': i + 1, 'unit_price': '4.00', 'document_id': self.invoice.id}
+                for i in range(3)
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTotalsMatchRepair()
+        self.invoice.refresh_from_db()
+        self.assertEqual((self.invoice.line_count, self.invoice.total_quantity, self.invoice.total_amount),
+                         (3, 6, Decimal('24.00')))
+
+
+class SupplierPriceTests(InventoryTestCase):
+    """Editar o borrar una compra recalcula, al confirmar, la fila de su par (proveedor, producto)."""
+
+    def setUp(self):
+        super().setUp()
+        self.supplier = Supplier.objects.create(name='Proveedor', business=self.business)
+        self.other_supplier = Supplier.objects.create(name='Otro', business=self.business)
+
+    def _body(self, unit_price, quantity=2, supplier=None):
+        return {'movement_type': 'purchase', 'product_id': self.products[0].id, 'branch_id': self.branch.id,
+                'quantity': quantity, 'unit_price': unit_price, 'supplier_id': (supplier or self.supplier).id}
+
+    def _purchase(self, unit_price, quantity=2):
+        response = self.client.post('/api/control/movements/', self._body(unit_price, quantity), format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def _row(self, supplier=None):
+        return SupplierPrice.objects.filter(supplier=supplier or self.supplier, product=self.products[0]).values_list(
+            'last_price', 'min_price', 'max_price', 'purchase_count', 'quantity_purchased',
+        ).first()
+
+    def test_update_recomputes(self):
+        first = self._purchase('5.00')
+        self._purchase('8.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/api/control/movements/{first}/', self._body('9.00', quantity=1), format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self._row(), (Decimal('8.00'), Decimal('8.00'), Decimal('9.00'), 2, 3))
+
+    def test_update_moves_purchase_to_other_supplier(self):
+        first = self._purchase('5.00')
+        self._purchase('8.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(f'/api/control/movements/{first}/',
+                                       self._body('5.00', supplier=self.other_supplier), format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self._row(), (Decimal('8.00'), Decimal('8.00'), Decimal('8.00'), 1, 2))
+        self.assertEqual(self._row(self.other_supplier), (Decimal('5.00'), Decimal('5.00'), Decimal('5.00'), 1, 2))
+
+    def test_delete_recomputes_and_removes_empty_rows(self):
+        first = self._purchase('5.00')
+        second = self._purchase('8.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/control/movements/{second}/').status_code, 204)
+        self.assertEqual(self._row(), (Decimal('5.00'), Decimal('5.00'), Decimal('5.00'), 1, 2))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/control/movements/{first}/').status_code, 204)
+        self.assertIsNone(self._row())
+
+    def test_rebuild_command_keeps_rows(self):
+        self._purchase('5.00')
+        self._purchase('8.00')
+        before = list(SupplierPrice.objects.values_list('id', 'last_price', 'purchase_count'))
+        call_command('rebuild_supplier_prices', stdout=StringIO())
+        self.assertEqual(list(SupplierPrice.objects.values_list('id', 'last_price', 'purchase_count')), before)
+
+
+class FakeCentral:
+    """Responde sync/movements/ como el central, rechazando los productos de `rejected_products`."""
+
+    def __init__(self):
+        self.rejected_products = set()
+        self.received = []
+
+    def request(self, method, path, payload=None):
+        self.received.append([item['client_id'] for item in payload['items']])
+        return {'results': [
+            {'client_id': item['client_id'], 'status': 'rejected', 'error': 'Producto dado de baja.'}
+            if item['product_id'] in self.rejected_products else {'client_id': item['client_id'], 'status': 'applied'}
+            for item in payload['items']
+        ]}
+
+
+class EdgeModeTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        edge_settings = override_settings(EDGE_MODE=True, EDGE_STATE_PATH=os.path.join(directory.name, 'state.json'))
+        edge_settings.enable()
+        self.addCleanup(edge_settings.disable)
+        self.state = {'business_id': self.business.id, 'branch_id': self.branch.id, 'cursor': 0,
+                      'pushed_movement_id': 0, 'retry': []}
+
+    def _sale(self, product):
+        response = self.client.post('/api/control/movements/', {
+            'movement_type': 'sale', 'product_id': product.id, 'branch_id': self.branch.id,
+            'quantity': 1, 'unit_price': '10.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Movement.objects.get(id=response.json()['id'])
+
+    def test_movements_get_unique_client_id_at_write_time(self):
+        first, second = self._sale(self.products[0]), self._sale(self.products[0])
+        self.assertTrue(first.client_id.startswith('edge-'))
+        self.assertNotEqual(first.client_id, second.client_id)
+
+    def test_central_only_writes_are_rejected(self):
+        movement = self._sale(self.products[0])
+        responses = [
+            self.client.post('/api/control/transfers/', {
+                'branch_from_id': self.branch.id, 'branch_id': self.other_branch.id,
+                'lines': [{'product_id': self.products[0].id, 'quantity': 1}],
+            }, format='json'),
+            self.client.post('/api/control/documents/', {'document_type': 'invoice', 'document_number': 'F-1'}, format='json'),
+            self.client.post('/api/control/categories/', {'name': 'Otra'}, format='json'),
+            self.client.delete(f'/api/control/movements/{movement.id}/'),
+        ]
+        self.assertEqual([r.status_code for r in responses], [403, 403, 403, 403])
+        response = self.client.post('/api/control/movements/', {
+            'movement_type': 'transfer', 'product_id': self.products[0].id, 'branch_id': self.other_branch.id,
+            'branch_from_id': self.branch.id, 'quantity': 1,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/control/documents/').status_code, 200)
+
+    def test_rejected_movements_stay_queued(self):
+        central = FakeCentral()
+        central.rejected_products = {self.products[1].id}
+        accepted, rejected = self._sale(self.products[0]), self._sale(self.products[1])
+        self.assertEqual(push(central, self.state, 100), 1)
+        self.assertEqual(self.state['retry'], [rejected.id])
+        self.assertEqual(self.state['pushed_movement_id'], rejected.id)
+
+        later = self._sale(self.products[0])
+        self.assertEqual(push(central, self.state, 100), 1)
+        # El rechazado se reenvía primero, con el mismo client_id.
+        self.assertEqual(central.received[1:], [[rejected.client_id], [later.client_id]])
+        self.assertEqual(self.state['retry'], [rejected.id])
+
+        central.rejected_products = set()
+        self.assertEqual(push(central, self.state, 100), 1)
+        self.assertEqual(self.state['retry'], [])
+        self.assertNotIn(accepted.client_id, central.received[-1])
+
+
+class ChangeFeedTests(InventoryTestCase):
+    def _page(self, since=0):
+        response = self.client.get('/api/control/changes/', {'since': since})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def _entry(self, entity, object_id, **kwargs):
+        return ChangeLogEntry.objects.create(business_id=self.business.id, entity=entity, object_id=object_id, **kwargs)
+
+    def test_late_commit_is_served_after_the_cursor(self):
+        cursor = self._page()['cursor']
+        # Id que obtuvo una transacción larga antes que la entrada ya servida; confirma después.
+        reserved = self._entry('product', self.products[0].id)
+        reserved_id = reserved.id
+        reserved.delete()
+        self._entry('category', self.category.id)
+        cursor = self._page(cursor)['cursor']
+        self._entry('product', self.products[0].id, id=reserved_id)
+        page = self._page(cursor)
+        self.assertGreater(page['cursor'], cursor)
+        self.assertEqual([row['id'] for row in page['changes']['product']['upserts']], [self.products[0].id])
+        self.assertEqual(self._page(page['cursor'])['changes'], {})
+
+    def test_reset_is_scoped_to_the_business(self):
+        # Otra empresa con entradas más antiguas que todas las de esta.
+        other = Business.objects.create(name='Otra', address='-', phone='1')
+        ChangeLogEntry.objects.all().delete()
+        ChangeLogEntry.objects.create(id=1, business_id=other.id, entity='category', object_id=1)
+        first = self._entry('category', self.category.id)
+        cursor = self._page()['cursor']
+        for product in self.products:
+            self._entry('product', product.id)
+        self.assertFalse(self._page(cursor)['reset'])
+        # La retención purgó entradas de esta empresa posteriores al cursor; las de la otra siguen.
+        ChangeLogEntry.objects.filter(business_id=self.business.id).exclude(id=first.id).order_by('id').first().delete()
+        ChangeLogEntry.objects.filter(id=first.id).delete()
+        self.assertTrue(self._page(cursor)['reset'])
+        self.assertFalse(build_page(other.id, 0, 100)['reset'])
+
+    def test_stock_created_by_a_write_is_recorded(self):
+        branch = Branch.objects.create(name='Sur', address='Calle 3', phone='3', business=self.business)
+        cursor = self._page()['cursor']
+        # El ítem se rechaza (proveedor ajeno), pero la fila de stock ya se creó para bloquearla.
+        response = self.client.post('/api/control/sync/movements/', {
+            'branch_id': branch.id, 'policy': 'reject',
+            'items': [{'client_id': 'pos-1', 'movement_type': 'purchase', 'product_id': self.products[0].id,
+                       'quantity': 3, 'unit_price': '2.00', 'supplier_id': 999999}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['results'][0]['status'], 'rejected')
+        stocks = self._page(cursor)['changes']['stock']['upserts']
+        self.assertEqual([(row['branch_id'], row['quantity']) for row in stocks], [(branch.id, 0)])
+
+
+class ReferenceSchemaTests(TestCase):
+    def test_cached_references_are_nested_components(self):
+        schemas = SchemaGenerator().get_schema(request=None, public=True)['components']['schemas']
+        expected = {
+            ('Product', 'business'): ('Business', False), ('Product', 'category'): ('Category', True),
+            ('Branch', 'business'): ('Business', False), ('Supplier', 'business'): ('Business', False),
+            ('Movement', 'branch'): ('Branch', False), ('Movement', 'branch_from'): ('Branch', True),
+            ('Movement', 'supplier'): ('Supplier', True), ('Stock', 'branch'): ('Branch', False),
+        }
+        for (component, field), (target, nullable) in expected.items():
+            prop = schemas[component]['properties'][field]
+            self.assertEqual(prop['allOf'], [{'$ref': f'#/components/schemas/{target}'}], (component, field))
+            self.assertEqual(prop.get('nullable', False), nullable, (component, field))
+
+
+class SchemaArtifactTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        artifacts_dir = override_settings(OPENAPI_SCHEMA_DIR=Path(directory.name))
+        artifacts_dir.enable()
+        self.addCleanup(artifacts_dir.disable)
+        for patcher in (mock.patch.object(schema, '_code_version', 'v1'), mock.patch.dict(schema._artifacts, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.client = APIClient()
+
+    def test_served_with_etag(self):
+        response = self.client.get('/api/schema/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(schema.artifact_path('yaml').exists())
+        self.assertEqual(response.content, schema.artifact_path('yaml').read_bytes())
+        etag = response['ETag']
+        response = self.client.get('/api/schema/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response['ETag']), (304, etag))
+
+    def test_rebuilt_per_code_version(self):
+        call_command('build_openapi_schema', stdout=StringIO())
+        self.assertTrue(schema.artifact_path('json').exists())
+        artifact = schema.artifact_path('yaml')
+        artifact.write_bytes(artifact.read_bytes() + b'# v1\n')
+        # La versión ya construida se sirve del artefacto, sin regenerarlo.
+        with mock.patch.object(schema, 'build_artifacts', wraps=schema.build_artifacts) as build:
+            first = self.client.get('/api/schema/')
+            self.assertTrue(first.content.endswith(b'# v1\n'))
+            build.assert_not_called()
+            schema._code_version = 'v2'
+            second = self.client.get('/api/schema/')
+            build.assert_called_once()
+        self.assertTrue(schema.artifact_path('yaml', 'v2').exists())
+        self.assertFalse(second.content.endswith(b'# v1\n'))
+        self.assertNotEqual(first['ETag'], second['ETag'])
+
+
+class IdempotencyTests(InventoryTestCase):
+    def _sale(self, key, quantity=2):
+        return self.client.post('/api/control/movements/', {
+            'movement_type': 'sale', 'product_id': self.products[0].id, 'branch_id': self.branch.id,
+            'quantity': quantity, 'unit_price': '5.00',
+        }, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def _stock(self):
+        return Stock.objects.get(product=self.products[0], branch=self.branch).quantity
+
+    def test_retry_replays_the_stored_response(self):
+        first = self._sale('venta-1')
+        second = self._sale('venta-1')
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Movement.objects.count(), 1)
+        self.assertEqual(self._stock(), 8)
+
+    def test_same_key_with_another_body_conflicts(self):
+        self.assertEqual(self._sale('venta-1').status_code, 201)
+        self.assertEqual(self._sale('venta-1', quantity=3).status_code, 422)
+        self.assertEqual(self._stock(), 8)
+
+    def test_failed_attempt_leaves_no_pending_key(self):
+        self.assertEqual(self._sale('venta-1', quantity=50).status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self._sale('venta-1').status_code, 201)
+
+    def test_stale_pending_key_is_reclaimed(self):
+        # Fila pendiente que dejó un proceso caído antes de guardar la respuesta.
+        IdempotencyKey.objects.create(user=self.user, key='venta-1', request_hash='x',
+                                      expires_at=timezone.now() + timedelta(hours=1))
+        response = self._sale('venta-1')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self._sale('venta-1')['Idempotent-Replayed'], 'true')
+        self.assertEqual(self._stock(), 8)
+
+
+class MovementSyncTests(InventoryTestCase):
+    def _sync(self, items, policy='reject'):
+        return self.client.post('/api/control/sync/movements/', {
+            'branch_id': self.branch.id, 'policy': policy, 'items': items,
+        }, format='json')
+
+    def _oversell(self, client_id='pos-1'):
+        return {'client_id': client_id, 'movement_type': 'sale', 'product_id': self.products[0].id,
+                'quantity': 12, 'unit_price': '5.00'}
+
+    def test_adjust_policy_requires_can_adjust(self):
+        cashier = User.objects.create_user(
+            username='caja', email='caja@empresa.com', password='clave', name='Caja', role='user',
+            business=self.business, branch=self.branch, can_sale=True, can_adjust=False,
+        )
+        self.client.force_authenticate(cashier)
+        response = self._sync([self._oversell()], policy='adjust')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('policy', response.json())
+        self.assertFalse(Movement.objects.exists())
+        self.client.force_authenticate(self.user)
+        response = self._sync([self._oversell()], policy='adjust')
+        self.assertEqual(response.json()['results'][0]['status'], 'adjusted')
+
+    def test_replay_after_archiving_is_a_duplicate(self):
+        item = {'client_id': 'pos-1', 'movement_type': 'sale', 'product_id': self.products[0].id,
+                'quantity': 2, 'unit_price': '5.00'}
+        self.assertEqual(self._sync([item]).json()['results'][0]['status'], 'applied')
+        movement = Movement.objects.get(client_id='pos-1')
+        ArchivedMovement.objects.create(
+            id=movement.id, movement_type='sale', product=movement.product, branch=movement.branch,
+            quantity=movement.quantity, unit_price=movement.unit_price, date=movement.date, client_id=movement.client_id,
+        )
+        Movement.objects.filter(id=movement.id)._raw_delete(Movement.objects.db)
+        result = self._sync([item]).json()['results'][0]
+        self.assertEqual((result['status'], result['id']), ('duplicate', movement.id))
+        self.assertFalse(Movement.objects.exists())
+        self.assertEqual(Stock.objects.get(product=self.products[0], branch=self.branch).quantity, 8)
+
+
+class ValuationTests(InventoryTestCase):
+    """Costo promedio y FIFO mantenidos en cada movimiento, y su lectura en valuation/."""
+
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Nuevo', description='-', price=10, business=self.business, category=self.category)
+        Stock.objects.bulk_create([Stock(product=self.product, branch=branch, quantity=0) for branch in (self.branch, self.other_branch)])
+
+    def _post(self, movement_type, quantity, unit_price=None, **extra):
+        body = {'movement_type': movement_type, 'product_id': self.product.id, 'branch_id': self.branch.id,
+                'quantity': quantity, 'unit_price': unit_price, **extra}
+        response = self.client.post('/api/control/movements/', body, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+
+    def _position(self, branch):
+        valuation = self.product.valuations.get(branch=branch)
+        layers = list(CostLayer.objects.filter(product=self.product, branch=branch).order_by('id')
+                      .values_list('quantity_remaining', 'unit_cost'))
+        return valuation.quantity, valuation.average_cost, valuation.average_value, valuation.fifo_value, layers
+
+    def _total(self, method, branch):
+        response = self.client.get('/api/control/valuation/', {'method': method, 'branch_id': branch.id})
+        self.assertEqual(response.status_code, 200, response.content)
+        return Decimal(str(response.json()['total_value']))
+
+    def test_average_and_fifo_after_purchases_sale_and_transfer(self):
+        self._post('purchase', 10, '4.00')
+        self._post('purchase', 10, '6.00')
+        self.assertEqual(self._position(self.branch), (20, Decimal('5.0000'), Decimal('100.0000'), Decimal('100.0000'),
+                                                       [(10, Decimal('4.0000')), (10, Decimal('6.0000'))]))
+        # La venta sale al costo promedio y consume la capa más antigua primero.
+        self._post('sale', 15, '9.00')
+        self.assertEqual(self._position(self.branch), (5, Decimal('5.0000'), Decimal('25.0000'), Decimal('30.0000'),
+                                                       [(5, Decimal('6.0000'))]))
+        self._post('transfer', 2, branch_id=self.other_branch.id, branch_from_id=self.branch.id)
+        self.assertEqual(self._position(self.branch), (3, Decimal('5.0000'), Decimal('15.0000'), Decimal('18.0000'),
+                                                       [(3, Decimal('6.0000'))]))
+        self.assertEqual(self._position(self.other_branch), (2, Decimal('5.0000'), Decimal('10.0000'), Decimal('12.0000'),
+                                                             [(2, Decimal('6.0000'))]))
+        self.assertEqual(self._total('average', self.branch), Decimal('15'))
+        self.assertEqual(self._total('fifo', self.branch), Decimal('18'))
+
+    def test_branch_id_is_validated(self):
+        other = Business.objects.create(name='Otra', address='-', phone='1')
+        foreign = Branch.objects.create(name='Ajena', address='-', phone='1', business=other)
+        self.assertEqual(self.client.get('/api/control/valuation/', {'branch_id': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/control/valuation/', {'branch_id': foreign.id}).status_code, 404)
+
+
+class SalesReportTests(InventoryTestCase):
+    def _at(self, moment, quantity, movement_type='sale', unit_price=Decimal('2.00')):
+        movement = Movement.objects.create(movement_type=movement_type, product=self.products[0], branch=self.branch,
+                                           quantity=quantity, unit_price=unit_price)
+        Movement.objects.filter(id=movement.id).update(date=timezone.make_aware(moment))
+        return movement
+
+    def _points(self, **params):
+        response = self.client.get('/api/control/reports/sales/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        series = response.json()['series']
+        self.assertEqual(len(series), 1)
+        return {point['period']: point for point in series[0]['points']}
+
+    def _units(self, **params):
+        return {period: point['sales_units'] for period, point in self._points(**params).items() if point['sales_units']}
+
+    def test_bucket_boundaries(self):
+        self._at(datetime(2024, 1, 7, 23, 59, 59), 1)   # domingo
+        self._at(datetime(2024, 1, 8, 0, 0, 0), 2)      # lunes
+        self._at(datetime(2024, 1, 31, 23, 59, 59), 4)
+        self._at(datetime(2024, 2, 1, 0, 0, 0), 8)
+        self.assertEqual(self._units(granularity='day', date_from='2024-01-01', date_to='2024-02-29'),
+                         {'2024-01-07': 1, '2024-01-08': 2, '2024-01-31': 4, '2024-02-01': 8})
+        self.assertEqual(self._units(granularity='week', date_from='2024-01-01', date_to='2024-02-29'),
+                         {'2024-01-01': 1, '2024-01-08': 2, '2024-01-29': 12})
+        self.assertEqual(self._units(granularity='month', date_from='2024-01-01', date_to='2024-02-29'),
+                         {'2024-01-01': 7, '2024-02-01': 8})
+        # date_to incluye su día completo y nada del siguiente.
+        self.assertEqual(self._units(granularity='month', date_from='2024-01-08', date_to='2024-01-31'),
+                         {'2024-01-01': 6})
+
+    def test_archived_movements_are_included(self):
+        self._at(datetime(2024, 3, 5, 10), 2)
+        archived = [
+            ('sale', 3, datetime(2024, 3, 5, 12)),
+            ('purchase', 10, datetime(2024, 3, 20, 9)),
+        ]
+        ArchivedMovement.objects.bulk_create([
+            ArchivedMovement(id=100000 + i, movement_type=movement_type, product=self.products[0], branch=self.branch,
+                             quantity=quantity, unit_price=Decimal('2.00'), date=timezone.make_aware(moment))
+            for i, (movement_type, quantity, moment) in enumerate(archived)
+        ])
+        day = self._points(granularity='day', date_from='2024-03-01', date_to='2024-03-31')['2024-03-05']
+        self.assertEqual((day['sales_units'], day['sales_count'], Decimal(str(day['sales_amount']))), (5, 2, Decimal('10')))
+        month = self._points(granularity='month', date_from='2024-03-01', date_to='2024-03-31')['2024-03-01']
+        self.assertEqual((month['sales_units'], month['purchase_units'], month['purchase_count']), (5, 10, 1))
+
+    def test_branch_id_is_validated(self):
+        params = {'granularity': 'day', 'date_from': '2024-01-01', 'date_to': '2024-01-31'}
+        self.assertEqual(self.client.get('/api/control/reports/sales/', {**params, 'branch_id': 'abc'}).status_code, 400)
+        other = Business.objects.create(name='Otra', address='-', phone='1')
+        foreign = Branch.objects.create(name='Ajena', address='-', phone='1', business=other)
+        self.assertEqual(self.client.get('/api/control/reports/sales/', {**params, 'branch_id': foreign.id}).status_code, 404)
+
+
+class ArchiveMovementsTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cutoff = timezone.now() - timedelta(days=settings.MOVEMENT_ARCHIVE_AFTER_DAYS)
+        self.month = timezone.localtime(self.cutoff).strftime('%Y-%m')
+        for days, quantity in [(settings.MOVEMENT_ARCHIVE_AFTER_DAYS + 1, 2), (settings.MOVEMENT_ARCHIVE_AFTER_DAYS + 40, 3), (1, 5)]:
+            movement = Movement.objects.create(movement_type='sale', product=self.products[0], branch=self.branch,
+                                               quantity=quantity, unit_price=Decimal('2.00'))
+            Movement.objects.filter(id=movement.id).update(date=timezone.now() - timedelta(days=days))
+
+    def _snapshot(self):
+        listing = self.client.get('/api/control/movements/', {'include_archived': '1'})
+        self.assertEqual(listing.status_code, 200, listing.content)
+        report = self.client.get('/api/control/reports/sales/', {
+            'granularity': 'month', 'date_from': (self.cutoff - timedelta(days=60)).date().isoformat(),
+            'date_to': timezone.localdate().isoformat(),
+        })
+        self.assertEqual(report.status_code, 200, report.content)
+        return listing.json(), report.json()
+
+    def test_refuses_while_sales_summary_lags_behind_cutoff(self):
+        with self.assertRaises(CommandError):
+            call_command('archive_movements', stdout=StringIO())
+        self.assertFalse(ArchivedMovement.objects.exists())
+        call_command('archive_movements', force=True, stdout=StringIO())
+        self.assertEqual(ArchivedMovement.objects.count(), 2)
+
+    def test_archiving_keeps_listing_and_report_totals(self):
+        call_command('precompute_reports', period=self.month, workers=1, kinds='sales_summary', stdout=StringIO())
+        before = self._snapshot()
+        call_command('archive_movements', stdout=StringIO())
+        self.assertEqual(ArchivedMovement.objects.count(), 2)
+        self.assertEqual(Movement.objects.filter(date__lt=self.cutoff).count(), 0)
+        self.assertEqual(self._snapshot(), before)
+        self.assertEqual(len(before[0]), Movement.objects.count() + 2)
+
+
+class ScanTests(InventoryTestCase):
+    def setUp(self):
+        super().setUp()
+        scan_cache.clear()
+        self.product = self.products[0]
+        Product.objects.filter(id=self.product.id).update(sku='779001')
+
+    def _scan(self, sku='779001'):
+        return self.client.get(f'/api/control/scan/{sku}/', {'branch_id': self.branch.id})
+
+    def test_sku_is_unique_per_business(self):
+        body = {'name': 'Repetido', 'description': '-', 'price': '5.00', 'sku': '779001'}
+        response = self.client.post('/api/control/products/', body, format='json')
+        self.assertEqual(response.status_code, 400, response.content)
+        self.assertIn('sku', response.json())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Product.objects.create(name='Repetido', description='-', price=5, business=self.business, sku='779001')
+        other = Business.objects.create(name='Otra', address='-', phone='1')
+        Product.objects.create(name='Ajeno', description='-', price=5, business=other, sku='779001')
+        # Sin SKU no hay conflicto aunque haya varios productos.
+        self.assertEqual(Product.objects.filter(business=self.business, sku__isnull=True).count(), 4)
+
+    def test_scan_returns_local_stock(self):
+        response = self._scan()
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual((response.json()['id'], response.json()['quantity'], response.json()['branch_id']),
+                         (self.product.id, 10, self.branch.id))
+        self.assertEqual(self._scan('no-existe').status_code, 404)
+
+    def test_cached_scan_is_invalidated_on_changes(self):
+        self.assertEqual(self._scan().json()['quantity'], 10)
+        self.assertEqual(len(scan_cache), 1)
+
+        stock = Stock.objects.get(product=self.product, branch=self.branch)
+        stock.minimum_stock = 12
+        stock.save()
+        self.assertEqual(self._scan().json()['is_low_stock'], True)
+
+        response = self.client.post('/api/control/movements/', {
+            'movement_type': 'sale', 'product_id': self.product.id, 'branch_id': self.branch.id,
+            'quantity': 3, 'unit_price': '10.00',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(self._scan().json()['quantity'], 7)
+
+        self.product.refresh_from_db()
+        self.product.price = Decimal('12.50')
+        self.product.save()
+        self.assertEqual(self._scan().json()['price'], '12.50')
+
+
+class RealtimeTests(InventoryTestCase):
+    def test_stream_ticket_is_single_use(self):
+        response = self.client.post('/api/control/stream/ticket/')
+        self.assertEqual(response.status_code, 201, response.content)
+        ticket = response.json()['ticket']
+        self.assertEqual(_redeem_ticket(ticket), self.user)
+        self.assertIsNone(_redeem_ticket(ticket))
+        self.assertIsNone(_redeem_ticket('inventado'))
+
+    def test_stream_rejects_redeemed_ticket(self):
+        ticket = issue_stream_ticket(self.user)
+        _redeem_ticket(ticket)
+        sent = []
+
+        async def receive():
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(sse_application({'type': 'http', 'query_string': f'ticket={ticket}'.encode(), 'headers': []},
+                                    receive, send))
+        self.assertEqual(sent[0]['status'], 401)
+
+    def test_broker_fans_out_by_business_and_branch(self):
+        broker = InProcessBroker()
+        stock = Stock.objects.get(product=self.products[0], branch=self.branch)
+        stock.quantity = 3  # cruza el mínimo (5): evento de stock y de stock bajo
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        async def subscribe():
+            return {
+                'business': broker.subscribe(self.business.id),
+                'branch': broker.subscribe(self.business.id, self.branch.id),
+                'other_branch': broker.subscribe(self.business.id, self.other_branch.id),
+                'other_business': broker.subscribe(self.business.id + 1),
+            }
+
+        async def drain(subscription):
+            await asyncio.sleep(0)
+            events = []
+            while not subscription.queue.empty():
+                events.append(await subscription.get())
+            subscription.close()
+            return events
+
+        subscriptions = loop.run_until_complete(subscribe())
+        with mock.patch('control.realtime.get_broker', return_value=broker):
+            with self.captureOnCommitCallbacks(execute=True):
+                publish_stock_changes(self.business.id, [(stock, 10)])
+        received = {name: loop.run_until_complete(drain(s)) for name, s in subscriptions.items()}
+        self.assertEqual([e['type'] for e in received['business']], ['stock', 'low_stock'])
+        self.assertEqual(received['branch'], received['business'])
+        self.assertEqual(received['business'][0]['delta'], -7)
+        self.assertEqual(received['other_branch'], [])
+        self.assertEqual(received['other_business'], [])
+        self.assertEqual(broker._subscriptions, {})
+
+
+class PrecomputeReportsTests(InventoryTestCase):
+    def _run(self, **options):
+        out = StringIO()
+        call_command('precompute_reports', period='2024-03', workers=1, stdout=out, **options)
+        return out.getvalue()
+
+    def test_rerun_overwrites_instead_of_duplicating(self):
+        movement = Movement.objects.create(movement_type='sale', product=self.products[0], branch=self.branch,
+                                           quantity=4, unit_price=Decimal('2.50'))
+        Movement.objects.filter(id=movement.id).update(date=timezone.make_aware(datetime(2024, 3, 10, 12)))
+        self._run()
+        month = timezone.localdate().strftime('%Y-%m')
+        self.assertEqual(
+            set(TenantReport.objects.values_list('business_id', 'kind', 'period')),
+            {(self.business.id, 'sales_summary', '2024-03'), (self.business.id, 'low_stock', month),
+             (self.business.id, 'valuation', month)},
+        )
+        first = dict(TenantReport.objects.values_list('kind', 'data'))
+        self.assertEqual(first['sales_summary']['totals']['sales_units'], 4)
+
+        Movement.objects.filter(id=movement.id).update(quantity=6)
+        self._run()
+        self.assertEqual(TenantReport.objects.count(), 3)
+        second = dict(TenantReport.objects.values_list('kind', 'data'))
+        self.assertEqual(second['sales_summary']['totals']['sales_units'], 6)
+        self.assertEqual(second['low_stock'], first['low_stock'])
+
+    def test_resume_skips_existing_reports(self):
+        self._run(kinds='sales_summary')
+        generated_at = TenantReport.objects.get().generated_at
+        output = self._run(resume=True)
+        self.assertIn('low_stock, valuation', output)
+        self.assertEqual(TenantReport.objects.get(kind='sales_summary').generated_at, generated_at)
+        self.assertIn('ya calculados', self._run(resume=True))
+        self.assertEqual(TenantReport.objects.count(), 3)
+
+
+class BranchProductsTests(InventoryTestCase):
+    def test_only_products_stocked_in_the_branch(self):
+        only_other = Product.objects.create(name='Solo Norte', description='-', price=10, business=self.business)
+        Stock.objects.create(product=only_other, branch=self.other_branch, quantity=1, minimum_stock=0)
+        unstocked = Product.objects.create(name='Sin stock', description='-', price=10, business=self.business)
+        other_business = Business.objects.create(name='Otra', address='-', phone='1')
+        foreign = Product.objects.create(name='Ajeno', description='-', price=10, business=other_business)
+        # Fila inconsistente (producto ajeno en esta sucursal): el filtro por empresa la descarta.
+        Stock.objects.create(product=foreign, branch=self.branch, quantity=1, minimum_stock=0)
+
+        queryset = branch_products(self.business.id, self.branch.id)
+        self.assertNotIn('JOIN', str(queryset.query))
+        self.assertEqual(sorted(queryset.values_list('id', flat=True)), sorted(p.id for p in self.products))
+        self.assertEqual(list(branch_products(self.business.id, self.other_branch.id).filter(id__in=[only_other.id, unstocked.id])
+                              .values_list('id', flat=True)), [only_other.id])
+
+    def test_branch_user_lists_branch_products(self):
+        only_other = Product.objects.create(name='Solo Norte', description='-', price=10, business=self.business)
+        Stock.objects.create(product=only_other, branch=self.other_branch, quantity=1, minimum_stock=0)
+        seller = User.objects.create_user(username='vendedor', email='vendedor@empresa.com', password='clave', name='Vendedor',
+                                          role='user', business=self.business, branch=self.branch)
+        self.client.force_authenticate(seller)
+        response = self.client.get('/api/control/products/')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(sorted(p['id'] for p in response.json()), sorted(p.id for p in self.products))
@@ -0,0 +1,308 @@
+"""
+Control de admisión por empresa y por usuario.
+
+Cada solicitud tiene un costo según su clase (detalle, listado, escritura,
+reporte o lote, ver THROTTLE_COSTS). El costo se descuenta de dos token
+buckets guardados en la caché compartida (CACHES): uno por empresa y otro por
+usuario. Las solicitudes sin usuario (login, refresh y verificación de tokens,
+alta de administrador) usan un bucket propio por IP, THROTTLE_AUTH_BUCKET, y
+no consumen el de nadie más.
+
+Además hay un tope de solicitudes simultáneas. Las escrituras (ventas del POS,
+compras, sincronización) tienen prioridad:
+- las lecturas y los reportes no pueden usar la reserva de cada bucket
+  (THROTTLE_WRITE_RESERVE);
+- tampoco pueden usar los lugares de concurrencia reservados
+  (THROTTLE_RESERVED_FOR_WRITES);
+- cada empresa tiene un tope propio de lecturas simultáneas.
+
+Así, una empresa grande que exporta no satura la base para las demás ni
+bloquea sus propias cajas.
+
+Con Redis, buckets y lugares se leen y actualizan en un solo script Lua, de
+forma atómica entre todos los workers. Cada lugar ocupado es una entrada con
+su hora en un conjunto ordenado: las de un proceso que murió sin devolverlas
+vencen a los THROTTLE_SLOT_TTL segundos, sin que el contador se desfase. Con
+otro backend (nodo edge, pruebas) se usa la caché bajo un lock del proceso.
+"""
+import threading
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework import exceptions
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+_GLOBAL_SLOTS_KEY = 'inventory360:admission:slots'
+
+_local_lock = threading.Lock()
+
+# KEYS: los buckets. ARGV: ahora, costo y, por bucket, capacidad, recarga por
+# segundo y piso. Descuenta de todos o de ninguno; devuelve la espera (o '0').
+_TAKE_TOKENS = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local levels = {}
+local wait = 0
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3])
+    local rate = tonumber(ARGV[i * 3 + 1])
+    local floor = tonumber(ARGV[i * 3 + 2])
+    local state = redis.call('HMGET', key, 'tokens', 'stamp')
+    local tokens = tonumber(state[1]) or capacity
+    local stamp = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - stamp) * rate)
+    if tokens - cost < floor then
+        wait = math.max(wait, (cost + floor - tokens) / rate)
+    end
+    levels[i] = tokens
+end
+if wait > 0 then
+    return tostring(wait)
+end
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[i * 3])
+    local rate = tonumber(ARGV[i * 3 + 1])
+    redis.call('HSET', key, 'tokens', tostring(levels[i] - cost), 'stamp', ARGV[1])
+    redis.call('EXPIRE', key, math.ceil(capacity / rate) + 60)
+end
+return '0'
+"""
+
+# KEYS: un conjunto ordenado de ocupantes por tope. ARGV: ahora, TTL, ocupante y
+# un tope por clave. Ocupa un lugar en todos o en ninguno.
+_ACQUIRE_SLOTS = """
+local now = tonumber(ARGV[1])
+local ttl = tonumber(ARGV[2])
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now - ttl)
+    if redis.call('ZCARD', key) >= tonumber(ARGV[i + 3]) then
+        return 0
+    end
+end
+for _, key in ipairs(KEYS) do
+    redis.call('ZADD', key, now, ARGV[3])
+    redis.call('EXPIRE', key, ttl)
+end
+return 1
+"""
+
+
+class Throttled(exceptions.Throttled):
+    extra_detail_singular = 'Reintenta en {wait} segundo.'
+    extra_detail_plural = 'Reintenta en {wait} segundos.'
+
+
+def cost_class(request, view):
+    """
+    Las vistas declaran `throttle_cost` (una clase, o un dict por acción del
+    ViewSet); si no, se deduce del método y de la acción.
+    """
+    declared = getattr(view, 'throttle_cost', None)
+    if isinstance(declared, dict):
+        declared = declared.get(getattr(view, 'action', None))
+    if declared:
+        return declared
+    if request.method not in SAFE_METHODS:
+        return 'write'
+    if getattr(view, 'action', None) == 'list':
+        return 'list'
+    return 'detail'
+
+
+def _redis():
+    """Cliente de Redis de la caché por defecto, o None con otro backend."""
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        return backend, backend._cache.get_client(write=True)
+    return backend, None
+
+
+def take_tokens(buckets, cost, now):
+    """
+    Descuenta `cost` de todos los buckets [(clave, bucket, piso)] o de ninguno.
+    Devuelve 0 si alcanzó, o los segundos a esperar.
+    """
+    backend, client = _redis()
+    if client is not None:
+        script = client.register_script(_TAKE_TOKENS)
+        args = [now, cost]
+        for _, bucket, floor in buckets:
+            args += [bucket['capacity'], bucket['refill_per_second'], floor]
+        return float(script(keys=[backend.make_key(key) for key, _, _ in buckets], args=args))
+    with _local_lock:
+        levels = []
+        wait = 0
+        for key, bucket, floor in buckets:
+            capacity, rate = bucket['capacity'], bucket['refill_per_second']
+            tokens, stamp = backend.get(key) or (capacity, now)
+            tokens = min(capacity, tokens + max(0, now - stamp) * rate)
+            if tokens - cost < floor:
+                wait = max(wait, (cost + floor - tokens) / rate)
+            levels.append(tokens)
+        if wait:
+            return wait
+        for (key, bucket, _), tokens in zip(buckets, levels):
+            backend.set(key, (tokens - cost, now), timeout=int(bucket['capacity'] / bucket['refill_per_second']) + 60)
+        return 0
+
+
+def acquire_slots(business_id, priority):
+    """
+    Ocupa un lugar de concurrencia global y, para lecturas, uno de la empresa.
+    Devuelve los lugares ocupados [(clave, ocupante)] o None si algún tope está lleno.
+    """
+    limits = [(_GLOBAL_SLOTS_KEY, settings.THROTTLE_MAX_CONCURRENCY - (0 if priority else settings.THROTTLE_RESERVED_FOR_WRITES))]
+    if not priority and business_id:
+        limits.append((f'inventory360:admission:slots:{business_id}', settings.THROTTLE_BUSINESS_MAX_CONCURRENCY))
+    holder = uuid.uuid4().hex
+    now = time.time()
+    ttl = settings.THROTTLE_SLOT_TTL
+    backend, client = _redis()
+    if client is not None:
+        script = client.register_script(_ACQUIRE_SLOTS)
+        keys = [backend.make_key(key) for key, _ in limits]
+        if not script(keys=keys, args=[now, ttl, holder] + [limit for _, limit in limits]):
+            return None
+        return [(key, holder) for key, _ in limits]
+    with _local_lock:
+        holders = {}
+        for key, limit in limits:
+            holders[key] = {h: at for h, at in (backend.get(key) or {}).items() if at > now - ttl}
+            if len(holders[key]) >= limit:
+                return None
+        for key, _ in limits:
+            holders[key][holder] = now
+            backend.set(key, holders[key], timeout=ttl)
+    return [(key, holder) for key, _ in limits]
+
+
+def release_slots(slots):
+    if not slots:
+        return
+    backend, client = _redis()
+    if client is not None:
+        with client.pipeline() as pipe:
+            for key, holder in slots:
+                pipe.zrem(backend.make_key(key), holder)
+            pipe.execute()
+        return
+    with _local_lock:
+        for key, holder in slots:
+            holders = backend.get(key) or {}
+            if holders.pop(holder, None) is not None:
+                backend.set(key, holders, timeout=settings.THROTTLE_SLOT_TTL)
+
+
+class CostAwareThrottle(BaseThrottle):
+    def __init__(self):
+        self._wait = None
+
+    def buckets(self, request):
+        user = request.user
+        if user and user.is_authenticated:
+            buckets = [(f'inventory360:bucket:user:{user.pk}', settings.THROTTLE_USER_BUCKET)]
+            if user.business_id:
+                buckets.insert(0, (f'inventory360:bucket:business:{user.business_id}', settings.THROTTLE_BUSINESS_BUCKET))
+            return buckets
+        # Login, refresh y demás solicitudes anónimas: bucket propio por IP.
+        return [(f'inventory360:bucket:auth:{self.get_ident(request)}', settings.THROTTLE_AUTH_BUCKET)]
+
+    def allow_request(self, request, view):
+        priority = request.method not in SAFE_METHODS
+        cost = settings.THROTTLE_COSTS[cost_class(request, view)]
+        business_id = getattr(request.user, 'business_id', None)
+        slots = acquire_slots(business_id, priority)
+        if slots is None:
+            self._wait = settings.THROTTLE_BUSY_RETRY_AFTER
+            raise Throttled(wait=self._wait, detail="El servidor está ocupado.")
+        buckets = [
+            (key, bucket, 0 if priority else bucket['capacity'] * settings.THROTTLE_WRITE_RESERVE)
+            for key, bucket in self.buckets(request)
+        ]
+        wait = take_tokens(buckets, cost, time.time())
+        if wait:
+            release_slots(slots)
+            self._wait = wait
+            raise Throttled(wait=self._wait, detail="Se alcanzó el límite de solicitudes de tu empresa o usuario.")
+        request._request.admission_slots = slots
+        return True
+
+    def wait(self):
+        return self._wait
+
+
+class _SlotReleaser:
+    """
+    Envuelve el contenido de una respuesta streaming y devuelve los lugares al
+    agotarse o al cerrarse (Django cierra la respuesta también si el cliente se
+    desconecta a mitad de camino).
+    """
+
+    def __init__(self, slots):
+        self.slots = slots
+
+    def release(self):
+        slots, self.slots = self.slots, None
+        release_slots(slots)
+
+    def close(self):
+        self.release()
+
+
+class _ReleaseWhenClosed(_SlotReleaser):
+    def __init__(self, content, slots):
+        super().__init__(slots)
+        self.iterator = iter(content)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self.iterator)
+        except StopIteration:
+            self.release()
+            raise
+
+
+class _AsyncReleaseWhenClosed(_SlotReleaser):
+    def __init__(self, content, slots):
+        super().__init__(slots)
+        self.iterator = content.__aiter__()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.iterator.__anext__()
+        except StopAsyncIteration:
+            self.release()
+            raise
+
+
+class AdmissionSlotMiddleware:
+    """
+    Devuelve los lugares de concurrencia ocupados por CostAwareThrottle al
+    terminar la solicitud; en las respuestas streaming, al terminar de enviarlas.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            release_slots(getattr(request, 'admission_slots', ()))
+            raise
+        slots = getattr(request, 'admission_slots', ())
+        if slots and response.streaming:
+            wrapper = _AsyncReleaseWhenClosed if getattr(response, 'is_async', False) else _ReleaseWhenClosed
+            response.streaming_content = wrapper(response.streaming_content, slots)
+        else:
+            release_slots(slots)
+        return response
@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     BusinessView, BranchView, ProductView, MovementView, 
     StockView, DocumentView, CategoryView, DashboardDataView, 
-    SupplierView
+    SupplierView, TransferView, ScanView, StreamTicketView, ChangeFeedView,
+    MovementSyncView, ValuationView, SalesReportView, PrecomputedReportView, SupplierPriceView
 )
 
 router = DefaultRouter()
@@ -20,5 +21,14 @@ router.register(r'suppliers', SupplierView, basename='supplier')
 urlpatterns = [
     path('', include(router.urls)),
     path('dashboard-data/', DashboardDataView.as_view(), name='dashboard-data'),
+    path('transfers/', TransferView.as_view(), name='transfers'),
+    path('scan/<str:sku>/', ScanView.as_view(), name='scan'),
+    path('stream/ticket/', StreamTicketView.as_view(), name='stream-ticket'),
+    path('changes/', ChangeFeedView.as_view(), name='changes'),
+    path('sync/movements/', MovementSyncView.as_view(), name='sync-movements'),
+    path('valuation/', ValuationView.as_view(), name='valuation'),
+    path('reports/sales/', SalesReportView.as_view(), name='sales-report'),
+    path('reports/precomputed/', PrecomputedReportView.as_view(), name='precomputed-reports'),
+    path('supplier-prices/', SupplierPriceView.as_view(), name='supplier-prices'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,239 @@
+"""
+Valorización del inventario por (producto, sucursal).
+
+Cada movimiento actualiza dos valuaciones a la vez:
+- costo promedio ponderado: las compras recalculan el costo promedio y las
+  salidas descuentan unidades a ese costo;
+- FIFO: cada entrada abre una capa de costo (CostLayer) y las salidas
+  consumen primero las capas más antiguas.
+
+Las transferencias sacan el costo de la sucursal de origen y lo llevan a la de
+destino. Las entradas sin precio (ajustes positivos) se valúan al costo
+promedio vigente. Con stock negativo el valor queda en cero hasta que una
+entrada cubre el faltante.
+"""
+import heapq
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from .models import CostLayer, StockValuation
+
+ZERO = Decimal('0')
+COST_PLACES = Decimal('0.0001')
+
+
+class Position:
+    def __init__(self, valuation, layers):
+        self.valuation = valuation
+        self.layers = layers  # capas abiertas, la más antigua primero
+        self.touched = {}
+        self.closed = []
+
+    def receive(self, quantity, unit_cost, received_at, chunks=None):
+        v = self.valuation
+        if unit_cost is None:
+            unit_cost = v.average_cost
+        deficit = max(-v.quantity, 0)
+        v.quantity += quantity
+        if v.quantity > 0:
+            v.average_value += min(quantity, v.quantity) * unit_cost
+            v.average_cost = (v.average_value / v.quantity).quantize(COST_PLACES)
+        for chunk_quantity, chunk_cost in chunks or [(quantity, unit_cost)]:
+            skipped = min(deficit, chunk_quantity)
+            deficit -= skipped
+            chunk_quantity -= skipped
+            if chunk_quantity > 0:
+                self.layers.append(CostLayer(
+                    product_id=v.product_id, branch_id=v.branch_id, unit_cost=chunk_cost,
+                    quantity_remaining=chunk_quantity, received_at=received_at,
+                ))
+                v.fifo_value += chunk_quantity * chunk_cost
+
+    def issue(self, quantity):
+        """Descuenta unidades y devuelve los tramos (cantidad, costo) que salieron."""
+        v = self.valuation
+        covered = min(quantity, max(v.quantity, 0))
+        v.average_value = max(v.average_value - (covered * v.average_cost).quantize(COST_PLACES), ZERO)
+        v.quantity -= quantity
+        if v.quantity <= 0:
+            v.average_value = ZERO
+
+        chunks = []
+        remaining = quantity
+        while remaining and self.layers:
+            layer = self.layers[0]
+            taken = min(remaining, layer.quantity_remaining)
+            chunks.append((taken, layer.unit_cost))
+            layer.quantity_remaining -= taken
+            remaining -= taken
+            v.fifo_value -= taken * layer.unit_cost
+            if layer.quantity_remaining == 0:
+                self.layers.pop(0)
+                if layer.pk:
+                    self.touched.pop(layer.pk, None)
+                    self.closed.append(layer.pk)
+            elif layer.pk:
+                self.touched[layer.pk] = layer
+        if not self.layers:
+            v.fifo_value = ZERO
+        if remaining:
+            chunks.append((remaining, v.average_cost))
+        return chunks
+
+
+class Ledger:
+    """Posiciones de valuación en memoria sobre las que se aplican movimientos."""
+
+    def __init__(self):
+        self.positions = {}
+
+    @classmethod
+    def load(cls, keys):
+        """Carga y bloquea (en orden) las posiciones indicadas; requiere transacción."""
+        ledger = cls()
+        keys = sorted(set(keys))
+        if not keys:
+            return ledger
+        product_ids = {product_id for product_id, _ in keys}
+        branch_ids = {branch_id for _, branch_id in keys}
+        wanted = set(keys)
+        for attempt in range(2):
+            valuations = (
+                StockValuation.objects.select_for_update()
+                .filter(product_id__in=product_ids, branch_id__in=branch_ids)
+                .order_by('product_id', 'branch_id')
+            )
+            for valuation in valuations:
+                key = (valuation.product_id, valuation.branch_id)
+                if key in wanted:
+                    ledger.positions[key] = Position(valuation, [])
+            missing = wanted - ledger.positions.keys()
+            if not missing or attempt:
+                break
+            # Solo la primera vez que se valoriza cada posición.
+            StockValuation.objects.bulk_create(
+                [StockValuation(product_id=product_id, branch_id=branch_id) for product_id, branch_id in sorted(missing)],
+                ignore_conflicts=True,
+            )
+            ledger.positions.clear()
+        layers = (
+            CostLayer.objects.filter(product_id__in=product_ids, branch_id__in=branch_ids, quantity_remaining__gt=0)
+            .order_by('id')
+        )
+        for layer in layers:
+            position = ledger.positions.get((layer.product_id, layer.branch_id))
+            if position is not None:
+                position.layers.append(layer)
+        return ledger
+
+    def position(self, product_id, branch_id):
+        key = (product_id, branch_id)
+        if key not in self.positions:
+            # Los defaults del modelo son enteros: la posición nueva arranca con Decimal
+            # para que quantize() funcione aunque su primer movimiento sea una salida.
+            valuation = StockValuation(
+                product_id=product_id, branch_id=branch_id,
+                quantity=0, average_cost=ZERO, average_value=ZERO, fifo_value=ZERO,
+            )
+            self.positions[key] = Position(valuation, [])
+        return self.positions[key]
+
+    def apply(self, movement_type, product_id, branch_id, branch_from_id, quantity, unit_price, date):
+        if movement_type == 'transfer' and branch_from_id:
+            source = self.position(product_id, branch_from_id)
+            unit_cost = source.valuation.average_cost
+            chunks = source.issue(abs(quantity))
+            self.position(product_id, branch_id).receive(abs(quantity), unit_cost, date, chunks)
+        elif movement_type in ('purchase', 'transfer') or (movement_type == 'adjustment' and quantity > 0):
+            self.position(product_id, branch_id).receive(abs(quantity), unit_price if movement_type == 'purchase' else None, date)
+        else:
+            self.position(product_id, branch_id).issue(abs(quantity))
+
+    def save(self):
+        positions = list(self.positions.values())
+        now = timezone.now()
+        for position in positions:
+            v = position.valuation
+            v.average_value = Decimal(v.average_value).quantize(COST_PLACES)
+            v.fifo_value = Decimal(v.fifo_value).quantize(COST_PLACES)
+            v.updated_at = now
+        existing = [p.valuation for p in positions if p.valuation.pk]
+        new = [p.valuation for p in positions if not p.valuation.pk]
+        if existing:
+            StockValuation.objects.bulk_update(
+                existing, ['quantity', 'average_cost', 'average_value', 'fifo_value', 'updated_at'], batch_size=500,
+            )
+        if new:
+            StockValuation.objects.bulk_create(new, batch_size=1000)
+
+        closed = [pk for p in positions for pk in p.closed]
+        if closed:
+            CostLayer.objects.filter(pk__in=closed).delete()
+        touched = [layer for p in positions for layer in p.touched.values()]
+        if touched:
+            CostLayer.objects.bulk_update(touched, ['quantity_remaining'], batch_size=500)
+        opened = [layer for p in positions for layer in p.layers if not layer.pk]
+        if opened:
+            CostLayer.objects.bulk_create(opened, batch_size=1000)
+
+
+def _keys(movements):
+    for m in movements:
+        yield (m.product_id, m.branch_id)
+        if m.movement_type == 'transfer' and m.branch_from_id:
+            yield (m.product_id, m.branch_from_id)
+
+
+def apply_movements(movements):
+    """
+    Actualiza la valuación con movimientos recién creados, en el orden dado.
+    Se llama explícitamente desde cada camino de escritura (también los que usan
+    bulk_create), dentro de su transacción y después de bloquear el stock.
+    """
+    assert transaction.get_connection().in_atomic_block, "apply_movements requiere una transacción activa."
+    ledger = Ledger.load(_keys(movements))
+    for m in movements:
+        ledger.apply(m.movement_type, m.product_id, m.branch_id, m.branch_from_id, m.quantity, m.unit_price,
+                     m.date or timezone.now())
+    ledger.save()
+
+
+def replay(querysets):
+    """
+    Recalcula desde cero las posiciones a partir de uno o más querysets de
+    movimientos (p. ej. ArchivedMovement y Movement), mezclados por fecha.
+    """
+    fields = ('date', 'id', 'movement_type', 'product_id', 'branch_id', 'branch_from_id', 'quantity', 'unit_price')
+    streams = [qs.order_by('date', 'id').values_list(*fields).iterator(chunk_size=5000) for qs in querysets]
+    ledger = Ledger()
+    count = 0
+    for date, _, movement_type, product_id, branch_id, branch_from_id, quantity, unit_price in heapq.merge(*streams):
+        ledger.apply(movement_type, product_id, branch_id, branch_from_id, quantity, unit_price, date)
+        count += 1
+    return ledger, count
+
+
+def valuation_summary(queryset, method='average'):
+    """Totales por sucursal y categoría de un queryset de StockValuation, en una consulta."""
+    rows = (
+        queryset.values('branch_id', 'branch__name', 'product__category_id', 'product__category__name')
+        .annotate(quantity=Sum('quantity'), value=Sum(f'{method}_value'))
+        .order_by('branch__name', 'branch_id', 'product__category__name')
+    )
+    branches = {}
+    total = 0
+    for row in rows:
+        branch = branches.setdefault(row['branch_id'], {
+            'branch_id': row['branch_id'], 'name': row['branch__name'], 'quantity': 0, 'value': 0, 'categories': [],
+        })
+        branch['categories'].append({
+            'category_id': row['product__category_id'],
+            'name': row['product__category__name'],
+            'quantity': row['quantity'],
+            'value': row['value'],
+        })
+        branch['quantity'] += row['quantity']
+        branch['value'] += row['value']
+        total += row['value']
+    return {'method': method, 'total_value': total, 'branches': list(branches.values())}
@@ -1,23 +1,50 @@
-from rest_framework import viewsets, permissions, serializers
+from rest_framework import viewsets, permissions, serializers, status
 from rest_framework.viewsets import ReadOnlyModelViewSet
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.exceptions import ParseError
 from rest_framework.permissions import IsAuthenticated
-from .models import Business, Branch, Product, Movement, Stock, Document, Category, Supplier
+from .models import Business, Branch, Product, Movement, ArchivedMovement, Stock, StockValuation, Document, Category, Supplier, TenantReport
 from .serializer import (
     BusinessSerializer, BranchSerializer, ProductSerializer,
-    MovementSerializer, StockSerializer, DocumentSerializer, CategorySerializer, SupplierSerializer
+    MovementSerializer, StockSerializer, DocumentSerializer, CategorySerializer, SupplierSerializer,
+    TransferSerializer, ArchivedMovementSerializer, MovementSyncSerializer
 )
+from .cache import scan_cache
+from .changefeed import FEED_FIELDS, build_page
+from .edge import CentralWritesOnly
+from .filters import DocumentFilter, MovementFilter
+from .idempotency import IdempotentCreateMixin, run_idempotent
+from .realtime import issue_stream_ticket
+from .services import branch_products
+from .supplier_prices import PICKS, best_suppliers
+from .valuation import valuation_summary
+from .reports import GRANULARITIES, SPLITS, buckets, default_range, parse_day, sales_series
 from user_control.permissions import IsAdminUserCustom
 from rest_framework.views import APIView
-from django.db.models import Sum, Count, F
+from django.db.models import Sum, Count, F, Q, FilteredRelation, Prefetch
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import timedelta
-from dateutil.relativedelta import relativedelta
 import calendar
-from rest_framework.filters import SearchFilter
+import orjson
+from rest_framework.filters import OrderingFilter, SearchFilter
 from django_filters.rest_framework import DjangoFilterBackend
 
+def parse_branch_id(user, raw):
+    """
+    branch_id de la consulta como entero y de la empresa del usuario.
+    Devuelve (branch_id, None) o (None, respuesta de error).
+    """
+    try:
+        branch_id = int(raw)
+    except (TypeError, ValueError):
+        return None, Response({"error": "branch_id debe ser un entero."}, status=status.HTTP_400_BAD_REQUEST)
+    if not Branch.objects.filter(id=branch_id, business_id=user.business_id).exists():
+        return None, Response({"error": "La sucursal no pertenece a tu empresa."}, status=status.HTTP_404_NOT_FOUND)
+    return branch_id, None
+
 class BusinessView(viewsets.ReadOnlyModelViewSet):
     serializer_class = BusinessSerializer
     permission_classes = [IsAuthenticated]
@@ -25,16 +52,16 @@ class BusinessView(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         return Business.objects.filter(id=self.request.user.business_id)
 
-class BranchView(viewsets.ModelViewSet):
+class BranchView(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = BranchSerializer
-    permission_classes = [IsAuthenticated] 
+    permission_classes = [IsAuthenticated, CentralWritesOnly]
 
     def get_queryset(self):
         return Branch.objects.filter(business=self.request.user.business)
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
-            self.permission_classes = [IsAuthenticated, IsAdminUserCustom]
+            self.permission_classes = [IsAuthenticated, IsAdminUserCustom, CentralWritesOnly]
         return super().get_permissions()
 
     def perform_create(self, serializer):
@@ -46,9 +73,9 @@ class BranchView(viewsets.ModelViewSet):
             raise serializers.ValidationError("No se puede eliminar la última sucursal de la empresa.")
         instance.delete()
 
-class CategoryView(viewsets.ModelViewSet):
+class CategoryView(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = CategorySerializer
-    permission_classes = [IsAuthenticated, IsAdminUserCustom]
+    permission_classes = [IsAuthenticated, IsAdminUserCustom, CentralWritesOnly]
 
     def get_queryset(self):
         return Category.objects.filter(business=self.request.user.business)
@@ -56,7 +83,7 @@ class CategoryView(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(business=self.request.user.business)
 
-class ProductView(viewsets.ModelViewSet):
+class ProductView(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [SearchFilter]
@@ -67,13 +94,13 @@ class ProductView(viewsets.ModelViewSet):
         if user.role == 'admin':
             return Product.objects.filter(business=user.business)
         elif user.role == 'user' and user.branch:
-            return Product.objects.filter(business=user.business, stocks__branch=user.branch).distinct()
+            return branch_products(user.business_id, user.branch_id)
         return Product.objects.none()
 
     def get_permissions(self):
         if self.action in ['destroy', 'update', 'partial_update']:
-            return [IsAuthenticated(), IsAdminUserCustom()]
-        return [IsAuthenticated()]
+            return [IsAuthenticated(), IsAdminUserCustom(), CentralWritesOnly()]
+        return [IsAuthenticated(), CentralWritesOnly()]
 
     def perform_create(self, serializer):
         product = serializer.save(business=self.request.user.business)
@@ -81,9 +108,12 @@ class ProductView(viewsets.ModelViewSet):
         for branch in branches:
             Stock.objects.create(product=product, branch=branch, quantity=0, minimum_stock=10)
 
-class DocumentView(viewsets.ModelViewSet):
+class DocumentView(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = DocumentSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, OrderingFilter]
+    filterset_class = DocumentFilter
+    ordering_fields = ['date', 'total_amount', 'total_quantity', 'line_count']
 
     def get_queryset(self):
         user = self.request.user
@@ -95,33 +125,97 @@ class DocumentView(viewsets.ModelViewSet):
 
     def get_permissions(self):
         if self.action in ['destroy', 'update', 'partial_update']:
-            return [IsAuthenticated(), IsAdminUserCustom()]
-        return [IsAuthenticated()]
+            return [IsAuthenticated(), IsAdminUserCustom(), CentralWritesOnly()]
+        return [IsAuthenticated(), CentralWritesOnly()]
 
-class MovementView(viewsets.ModelViewSet):
+class MovementView(IdempotentCreateMixin, viewsets.ModelViewSet):
     serializer_class = MovementSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend, SearchFilter]
-    filterset_fields = ['movement_type']
+    filterset_class = MovementFilter
 
     def get_queryset(self):
+        return self._scope(Movement.objects.all())
+
+    def _with_relations(self, queryset):
+        # Producto (con su stock total ya sumado), usuario y documento en dos
+        # consultas para toda la página, en lugar de tres por fila.
+        products = Product.objects.annotate(total_stock=Sum('stocks__quantity'))
+        return queryset.select_related('user', 'document').prefetch_related(Prefetch('product', queryset=products))
+
+    def _scope(self, queryset):
         user = self.request.user
         if user.role == 'admin':
-            return Movement.objects.filter(branch__business=user.business)
+            return queryset.filter(branch__business=user.business)
         elif user.role == 'user' and user.branch:
-            return Movement.objects.filter(branch=user.branch)
-        return Movement.objects.none()
+            return queryset.filter(branch=user.branch)
+        return queryset.none()
+
+    def list(self, request, *args, **kwargs):
+        queryset = self._with_relations(self.filter_queryset(self.get_queryset()))
+        if request.query_params.get('include_archived', '').lower() not in ('1', 'true', 'yes'):
+            return Response(self.get_serializer(queryset, many=True).data)
+        queryset = queryset.order_by('-date')
+        filterset = MovementFilter(request.query_params, queryset=self._scope(ArchivedMovement.objects.all()), request=request)
+        if not filterset.is_valid():
+            raise serializers.ValidationError(filterset.errors)
+        archived = self._with_relations(filterset.qs.order_by('-date'))
+        data = self.get_serializer(queryset, many=True).data
+        data += ArchivedMovementSerializer(archived, many=True, context=self.get_serializer_context()).data
+        return Response(data)
 
     def get_permissions(self):
+        # El nodo de sucursal registra movimientos pero no edita ni borra los ya enviados.
         if self.action in ['destroy', 'update', 'partial_update']:
-            return [IsAuthenticated(), IsAdminUserCustom()]
+            return [IsAuthenticated(), IsAdminUserCustom(), CentralWritesOnly()]
         return [IsAuthenticated()]
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        # ?expand=1 devuelve el movimiento creado con todos sus objetos anidados.
+        context['compact'] = self.action == 'create' and self.request.query_params.get('expand', '').lower() not in ('1', 'true', 'yes')
+        return context
+
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
+class TransferView(APIView):
+    """
+    Registra una transferencia completa entre sucursales: crea el documento
+    'transfer_note' y todas sus líneas en una sola transacción.
+    """
+    throttle_cost = 'bulk'
+    permission_classes = [IsAuthenticated, CentralWritesOnly]
+
+    def post(self, request, *args, **kwargs):
+        return run_idempotent(request, lambda: self._create(request))
+
+    def _create(self, request):
+        serializer = TransferSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+class MovementSyncView(APIView):
+    """
+    Recibe en una sola solicitud las ventas, compras y ajustes que un POS
+    acumuló sin conexión. Ver MovementSyncSerializer para las políticas.
+    """
+    throttle_cost = 'bulk'
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        return run_idempotent(request, lambda: self._sync(request))
+
+    def _sync(self, request):
+        serializer = MovementSyncSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
 class StockView(ReadOnlyModelViewSet):
     serializer_class = StockSerializer
+    throttle_cost = {'matrix': 'report'}
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
@@ -134,26 +228,321 @@ class StockView(ReadOnlyModelViewSet):
 
         product_id = self.request.query_params.get('product_id', None)
         branch_id = self.request.query_params.get('branch_id', None)
-        if product_id:
-            queryset = queryset.filter(product_id=product_id)
-        if branch_id:
-            queryset = queryset.filter(branch_id=branch_id)
+        try:
+            if product_id:
+                queryset = queryset.filter(product_id=int(product_id))
+            if branch_id:
+                queryset = queryset.filter(branch_id=int(branch_id))
+        except ValueError:
+            raise ParseError({"error": "product_id y branch_id deben ser enteros."})
 
         return queryset
 
     def get_permissions(self):
         return [IsAuthenticated()]
 
+    @action(detail=False, methods=['get'])
+    def matrix(self, request):
+        """
+        Stock de productos × sucursales en arreglos por columna, sin objetos anidados.
+        ?layout=dense (por defecto) devuelve una grilla por producto con un valor
+        por sucursal (null si no hay fila de stock); ?layout=sparse devuelve solo
+        las celdas existentes como índices. ?stream=1 envía NDJSON: una línea de
+        encabezado con las sucursales y luego una línea por producto.
+        Filtros: category_id, product_ids=1,2,3 y branch_id.
+        """
+        user = request.user
+        params = request.query_params
+        layout = params.get('layout', 'dense')
+        if layout not in ('dense', 'sparse'):
+            return Response({"error": "layout debe ser 'dense' o 'sparse'."}, status=status.HTTP_400_BAD_REQUEST)
+        if user.role == 'user' and not user.branch_id:
+            return Response({"error": "Tu usuario no tiene una sucursal asignada."}, status=status.HTTP_403_FORBIDDEN)
+        queryset = self.get_queryset()
+        branches = Branch.objects.filter(business=user.business)
+        if user.role == 'user':
+            branches = branches.filter(id=user.branch_id)
+        try:
+            if user.role != 'user' and params.get('branch_id'):
+                branches = branches.filter(id=int(params['branch_id']))
+            if params.get('category_id'):
+                queryset = queryset.filter(product__category_id=int(params['category_id']))
+            if params.get('product_ids'):
+                queryset = queryset.filter(product_id__in=[int(p) for p in params['product_ids'].split(',') if p])
+        except ValueError:
+            return Response({"error": "branch_id, category_id y product_ids deben ser enteros."}, status=status.HTTP_400_BAD_REQUEST)
+
+        branch_ids = list(branches.order_by('id').values_list('id', flat=True))
+        column = {branch_id: i for i, branch_id in enumerate(branch_ids)}
+        rows = queryset.order_by('product_id', 'branch_id').values_list('product_id', 'branch_id', 'quantity', 'minimum_stock')
+
+        if params.get('stream', '').lower() in ('1', 'true', 'yes'):
+            return StreamingHttpResponse(self._stream_matrix(rows, branch_ids, column), content_type='application/x-ndjson')
+
+        products = []
+        if layout == 'dense':
+            quantity, minimum = [], []
+            for product_id, branch_id, qty, min_stock in rows.iterator(chunk_size=5000):
+                if branch_id not in column:
+                    continue
+                if not products or products[-1] != product_id:
+                    products.append(product_id)
+                    quantity.append([None] * len(branch_ids))
+                    minimum.append([None] * len(branch_ids))
+                quantity[-1][column[branch_id]] = qty
+                minimum[-1][column[branch_id]] = min_stock
+            return Response({'layout': layout, 'branches': branch_ids, 'products': products,
+                             'quantity': quantity, 'minimum_stock': minimum})
+
+        cells = {'product': [], 'branch': [], 'quantity': [], 'minimum_stock': []}
+        for product_id, branch_id, qty, min_stock in rows.iterator(chunk_size=5000):
+            if branch_id not in column:
+                continue
+            if not products or products[-1] != product_id:
+                products.append(product_id)
+            cells['product'].append(len(products) - 1)
+            cells['branch'].append(column[branch_id])
+            cells['quantity'].append(qty)
+            cells['minimum_stock'].append(min_stock)
+        return Response({'layout': layout, 'branches': branch_ids, 'products': products, 'cells': cells})
+
+    def _stream_matrix(self, rows, branch_ids, column):
+        yield orjson.dumps({'branches': branch_ids}) + b'\n'
+        current, quantity, minimum = None, None, None
+        for product_id, branch_id, qty, min_stock in rows.iterator(chunk_size=5000):
+            if branch_id not in column:
+                continue
+            if product_id != current:
+                if current is not None:
+                    yield orjson.dumps({'p': current, 'q': quantity, 'm': minimum}) + b'\n'
+                current, quantity, minimum = product_id, [None] * len(branch_ids), [None] * len(branch_ids)
+            quantity[column[branch_id]] = qty
+            minimum[column[branch_id]] = min_stock
+        if current is not None:
+            yield orjson.dumps({'p': current, 'q': quantity, 'm': minimum}) + b'\n'
+
     @action(detail=False, methods=['get'], url_path='by-product-name/(?P<product_name>[^/.]+)')
     def by_product_name(self, request, product_name=None):
         queryset = self.get_queryset().filter(product__name__iexact=product_name)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
-class SupplierView(viewsets.ModelViewSet):
-    serializer_class = SupplierSerializer
+class ScanView(APIView):
+    """
+    Resolución de un SKU/código de barras escaneado en el POS: devuelve el
+    producto, su precio y el stock de la sucursal en una sola consulta.
+    Los usuarios de sucursal usan su propia sucursal; los administradores
+    indican ?branch_id=.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, sku, *args, **kwargs):
+        user = request.user
+        if user.role == 'user' and user.branch_id:
+            branch_id = user.branch_id
+        else:
+            try:
+                branch_id = int(request.query_params['branch_id'])
+            except (KeyError, ValueError):
+                return Response({"error": "Debes indicar un branch_id válido."}, status=status.HTTP_400_BAD_REQUEST)
+            if not Branch.objects.filter(id=branch_id, business_id=user.business_id).exists():
+                return Response({"error": "La sucursal no pertenece a tu empresa."}, status=status.HTTP_404_NOT_FOUND)
+
+        cache_key = (user.business_id, branch_id, sku)
+        data = scan_cache.get(cache_key)
+        if data is None:
+            row = (
+                Product.objects.filter(business_id=user.business_id, sku=sku)
+                .annotate(local_stock=FilteredRelation('stocks', condition=Q(stocks__branch_id=branch_id)))
+                .values('id', 'sku', 'name', 'price', 'category_id', 'local_stock__quantity', 'local_stock__minimum_stock')
+                .first()
+            )
+            if row is None:
+                return Response({"error": "No existe un producto con ese SKU."}, status=status.HTTP_404_NOT_FOUND)
+            quantity = row['local_stock__quantity']
+            minimum_stock = row['local_stock__minimum_stock']
+            data = {
+                'id': row['id'],
+                'sku': row['sku'],
+                'name': row['name'],
+                'price': str(row['price']),
+                'category_id': row['category_id'],
+                'branch_id': branch_id,
+                'quantity': quantity,
+                'minimum_stock': minimum_stock,
+                'is_low_stock': quantity is not None and quantity < minimum_stock,
+            }
+            scan_cache.set(cache_key, data, tags=[('product', row['id'])])
+        return Response(data)
+
+class StreamTicketView(APIView):
+    """
+    Ticket de un solo uso para abrir el stream de eventos (stream/?ticket=)
+    sin poner el JWT en la URL.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        return Response({
+            'ticket': issue_stream_ticket(request.user),
+            'expires_in': settings.REALTIME_TICKET_SECONDS,
+        }, status=status.HTTP_201_CREATED)
+
+class ChangeFeedView(APIView):
+    """
+    Cambios de productos, stock, categorías, sucursales y proveedores desde un
+    cursor. Los clientes guardan el `cursor` devuelto y lo envían como ?since=
+    en la siguiente sincronización; con `reset` deben descargar todo de nuevo.
+    """
+    throttle_cost = 'list'
     permission_classes = [IsAuthenticated]
 
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit', settings.CHANGE_FEED_PAGE_SIZE))
+        except ValueError:
+            return Response({"error": "Los parámetros since y limit deben ser enteros."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.CHANGE_FEED_PAGE_SIZE))
+        entities = [e for e in request.query_params.get('entities', '').split(',') if e in FEED_FIELDS] or None
+        branch_id = None
+        if user.role == 'user':
+            if not user.branch_id:
+                return Response({"error": "Tu usuario no tiene una sucursal asignada."}, status=status.HTTP_403_FORBIDDEN)
+            branch_id = user.branch_id
+        return Response(build_page(user.business_id, since, limit, branch_id=branch_id, entities=entities))
+
+class ValuationView(APIView):
+    """
+    Valor del inventario por sucursal y categoría, leído de las valuaciones que
+    se mantienen en cada movimiento (una sola consulta agregada).
+    ?method=average (costo promedio ponderado, por defecto) o ?method=fifo.
+    """
+    throttle_cost = 'report'
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        method = request.query_params.get('method', 'average')
+        if method not in ('average', 'fifo'):
+            return Response({"error": "El parámetro method debe ser 'average' o 'fifo'."}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = StockValuation.objects.filter(branch__business=user.business)
+        if user.role == 'user':
+            if not user.branch_id:
+                return Response({"error": "Tu usuario no tiene una sucursal asignada."}, status=status.HTTP_403_FORBIDDEN)
+            queryset = queryset.filter(branch_id=user.branch_id)
+        elif request.query_params.get('branch_id'):
+            branch_id, error = parse_branch_id(user, request.query_params['branch_id'])
+            if error:
+                return error
+            queryset = queryset.filter(branch_id=branch_id)
+        return Response(valuation_summary(queryset, method))
+
+class SalesReportView(APIView):
+    """
+    Ventas y compras (unidades, montos y cantidad de movimientos) por período.
+    ?granularity=day|week|month&date_from=AAAA-MM-DD&date_to=AAAA-MM-DD
+    &split=branch|category|product&branch_id=N
+    """
+    throttle_cost = 'report'
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        params = request.query_params
+        granularity = params.get('granularity', 'day')
+        split = params.get('split') or None
+        if granularity not in GRANULARITIES:
+            return Response({"error": "granularity debe ser 'day', 'week' o 'month'."}, status=status.HTTP_400_BAD_REQUEST)
+        if split and split not in SPLITS:
+            return Response({"error": "split debe ser 'branch', 'category' o 'product'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            date_from, date_to = parse_day(params.get('date_from')), parse_day(params.get('date_to'))
+        except ValueError:
+            return Response({"error": "Las fechas deben tener el formato AAAA-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+        default_from, default_to = default_range(granularity)
+        date_from, date_to = date_from or default_from, date_to or default_to
+        if date_from > date_to:
+            return Response({"error": "date_from no puede ser posterior a date_to."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(buckets(date_from, date_to, granularity)) > settings.REPORT_MAX_BUCKETS:
+            return Response({"error": f"El rango pedido supera los {settings.REPORT_MAX_BUCKETS} períodos."}, status=status.HTTP_400_BAD_REQUEST)
+
+        branch_id = None
+        if user.role == 'user':
+            if not user.branch_id:
+                return Response({"error": "Tu usuario no tiene una sucursal asignada."}, status=status.HTTP_403_FORBIDDEN)
+            branch_id = user.branch_id
+        elif params.get('branch_id'):
+            branch_id, error = parse_branch_id(user, params['branch_id'])
+            if error:
+                return error
+        return Response({
+            'granularity': granularity,
+            'date_from': date_from,
+            'date_to': date_to,
+            'split': split,
+            'series': sales_series(user.business_id, date_from, date_to, granularity, split, branch_id),
+        })
+
+class PrecomputedReportView(APIView):
+    """
+    Reportes mensuales precalculados por `python manage.py precompute_reports`.
+    Sin parámetros lista los disponibles; con ?kind=sales_summary|low_stock|valuation
+    (y opcionalmente &period=AAAA-MM) devuelve el más reciente.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUserCustom]
+
+    def get(self, request, *args, **kwargs):
+        reports = TenantReport.objects.filter(business_id=request.user.business_id)
+        kind = request.query_params.get('kind')
+        if not kind:
+            return Response(list(reports.order_by('-period', 'kind').values('kind', 'period', 'generated_at')))
+        reports = reports.filter(kind=kind)
+        if request.query_params.get('period'):
+            reports = reports.filter(period=request.query_params['period'])
+        report = reports.order_by('-period').first()
+        if report is None:
+            return Response({"error": "El reporte todavía no fue generado."}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'kind': report.kind, 'period': report.period, 'generated_at': report.generated_at, 'data': report.data})
+
+class SupplierPriceView(APIView):
+    """
+    Proveedor más barato (?pick=cheapest, por el último precio) o más reciente
+    (?pick=recent) de cada producto, leído del índice de precios de compra.
+    Filtros: ?category_id=N o ?product_ids=1,2,3 (al menos uno).
+    """
+    throttle_cost = 'list'
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        params = request.query_params
+        pick = params.get('pick', 'cheapest')
+        if pick not in PICKS:
+            return Response({"error": "pick debe ser 'cheapest' o 'recent'."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            category_id = int(params['category_id']) if params.get('category_id') else None
+            product_ids = [int(p) for p in params['product_ids'].split(',') if p] if params.get('product_ids') else None
+        except ValueError:
+            return Response({"error": "category_id y product_ids deben ser números."}, status=status.HTTP_400_BAD_REQUEST)
+        if not category_id and not product_ids:
+            return Response({"error": "Indica category_id o product_ids."}, status=status.HTTP_400_BAD_REQUEST)
+        rows = best_suppliers(request.user.business_id, pick, category_id, product_ids)
+        return Response([
+            {
+                'product_id': row['product_id'], 'product': row['product__name'],
+                'supplier_id': row['supplier_id'], 'supplier': row['supplier__name'],
+                'last_price': row['last_price'], 'min_price': row['min_price'], 'max_price': row['max_price'],
+                'average_price': row['average_price'], 'purchase_count': row['purchase_count'],
+                'last_purchase_at': row['last_purchase_at'],
+            }
+            for row in rows
+        ])
+
+class SupplierView(IdempotentCreateMixin, viewsets.ModelViewSet):
+    serializer_class = SupplierSerializer
+    permission_classes = [IsAuthenticated, CentralWritesOnly]
+
     def get_queryset(self):
         return Supplier.objects.filter(business=self.request.user.business)
 
@@ -161,6 +550,7 @@ class SupplierView(viewsets.ModelViewSet):
         serializer.save(business=self.request.user.business)
 
 class DashboardDataView(APIView):
+    throttle_cost = 'report'
     permission_classes = [IsAuthenticated]
     def get(self, request, *args, **kwargs):
         user = request.user
@@ -192,23 +582,12 @@ class DashboardDataView(APIView):
 
         recent_activity = Movement.objects.filter(product__business=business).order_by('-date')[:5]
         recent_activity_serializer = MovementSerializer(recent_activity, many=True, context={'request': request})
-        sales_performance = []
-        for i in range(6):
-            month_date = today - relativedelta(months=i)
-            month_name = calendar.month_abbr[month_date.month]
-            
-            sales = Movement.objects.filter(
-                product__business=business,
-                movement_type='sale',
-                date__year=month_date.year,
-                date__month=month_date.month
-            ).aggregate(
-                total=Sum(F('unit_price') * F('quantity'))
-            )['total'] or 0
-            
-            sales_performance.append({'name': month_name, 'ventas': abs(sales)})
-        
-        sales_performance.reverse()
+        start, end = default_range('month', today)
+        series = sales_series(business.id, start, end, 'month')[0]
+        sales_performance = [
+            {'name': calendar.month_abbr[point['period'].month], 'ventas': point['sales_amount']}
+            for point in series['points']
+        ]
 
         data = {
             'total_products': total_products,
@@ -0,0 +1,102 @@
+"""
+Lista negra de tokens con un filtro de pertenencia en memoria.
+
+Cada proceso mantiene el conjunto de JTIs revocados que aún no vencieron. Se
+carga completo la primera vez y luego solo se leen las filas nuevas de
+BlacklistedToken (un rango por clave primaria), como mucho cada
+TOKEN_BLACKLIST_SYNC_SECONDS. Las filas vencidas se eliminan con
+`python manage.py purge_expired_tokens`.
+"""
+import threading
+import time
+from django.conf import settings
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken, UntypedToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+
+class RevokedTokenFilter:
+    def __init__(self):
+        self._revoked = {}
+        self._last_id = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def sync(self, force=False):
+        now = time.monotonic()
+        if not force and self._last_id is not None and now - self._synced_at < settings.TOKEN_BLACKLIST_SYNC_SECONDS:
+            return
+        with self._lock:
+            current = timezone.now()
+            queryset = BlacklistedToken.objects.filter(token__expires_at__gt=current)
+            if self._last_id is None:
+                last_id = BlacklistedToken.objects.aggregate(last=Max('id'))['last'] or 0
+                queryset = queryset.filter(id__lte=last_id)
+            else:
+                # Se relee un margen de ids por si una transacción con un id menor confirmó tarde.
+                queryset = queryset.filter(id__gt=max(0, self._last_id - settings.TOKEN_BLACKLIST_SYNC_OVERLAP))
+                last_id = self._last_id
+            for row_id, jti, expires_at in queryset.values_list('id', 'token__jti', 'token__expires_at').iterator():
+                self._revoked[jti] = expires_at.timestamp()
+                last_id = max(last_id, row_id)
+            self._last_id = last_id
+            self._synced_at = now
+            epoch = current.timestamp()
+            for jti in [jti for jti, exp in self._revoked.items() if exp <= epoch]:
+                del self._revoked[jti]
+
+    def add(self, jti, exp):
+        with self._lock:
+            self._revoked[jti] = exp
+
+    def __contains__(self, jti):
+        self.sync()
+        return jti in self._revoked
+
+
+revoked_tokens = RevokedTokenFilter()
+
+
+class FilteredRefreshToken(RefreshToken):
+    """RefreshToken que consulta el filtro en memoria en lugar de la tabla de la lista negra."""
+
+    def check_blacklist(self):
+        if self.payload[api_settings.JTI_CLAIM] in revoked_tokens:
+            raise TokenError(_("Token is blacklisted"))
+
+    def outstand(self):
+        return OutstandingToken.objects.get_or_create(
+            jti=self.payload[api_settings.JTI_CLAIM],
+            defaults={
+                'user_id': self.payload.get(api_settings.USER_ID_CLAIM),
+                'created_at': self.current_time,
+                'token': str(self),
+                'expires_at': datetime_from_epoch(self.payload['exp']),
+            },
+        )
+
+    def blacklist(self):
+        token, _ = self.outstand()
+        result = BlacklistedToken.objects.get_or_create(token=token)
+        revoked_tokens.add(token.jti, self.payload['exp'])
+        return result
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = FilteredRefreshToken
+
+
+class TokenVerifySerializer(jwt_serializers.TokenVerifySerializer):
+    def validate(self, attrs):
+        token = UntypedToken(attrs['token'])
+        jti = token.get(api_settings.JTI_CLAIM)
+        if jti and jti in revoked_tokens:
+            raise serializers.ValidationError(_("Token is blacklisted"))
+        return {}
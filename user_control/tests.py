@@ -1,3 +1,63 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from control.models import Business
+from .blacklist import FilteredRefreshToken, RevokedTokenFilter
+from .models import User
 
-# Create your tests here.
+
+class TokenBlacklistTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.business = Business.objects.create(name='Empresa', address='Calle 1', phone='1')
+        cls.user = User.objects.create_user(
+            username='admin', email='admin@empresa.com', password='clave', name='Admin', role='admin', business=cls.business,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def _outstanding(self, jti, expires_at):
+        return OutstandingToken.objects.create(user=self.user, jti=jti, token='-', expires_at=expires_at)
+
+    def test_logout_revokes_refresh_token(self):
+        response = self.client.post('/user-control/login/', {'email': 'admin@empresa.com', 'password': 'clave'})
+        self.assertEqual(response.status_code, 200, response.content)
+        tokens = response.json()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(self.client.post('/user-control/logout/', {'refresh': tokens['refresh']}).status_code, 200)
+        self.client.credentials()
+        self.assertEqual(self.client.post('/user-control/token/refresh/', {'refresh': tokens['refresh']}).status_code, 401)
+        self.assertEqual(self.client.post('/user-control/token/verify/', {'token': tokens['refresh']}).status_code, 400)
+
+    @override_settings(TOKEN_BLACKLIST_SYNC_SECONDS=60)
+    def test_filter_syncs_revocations_from_other_processes(self):
+        revoked = RevokedTokenFilter()
+        self.assertNotIn('otro-proceso', revoked)
+        # Otro proceso revoca un token: se ve en la siguiente sincronización, no antes.
+        BlacklistedToken.objects.create(token=self._outstanding('otro-proceso', timezone.now() + timedelta(days=1)))
+        BlacklistedToken.objects.create(token=self._outstanding('vencido', timezone.now() - timedelta(seconds=1)))
+        self.assertNotIn('otro-proceso', revoked)
+        revoked.sync(force=True)
+        self.assertIn('otro-proceso', revoked)
+        self.assertNotIn('vencido', revoked)
+
+    def test_blacklist_applies_in_process_immediately(self):
+        token = FilteredRefreshToken.for_user(self.user)
+        token.blacklist()
+        self.assertEqual(BlacklistedToken.objects.filter(token__jti=token['jti']).count(), 1)
+        self.assertEqual(self.client.post('/user-control/token/refresh/', {'refresh': str(token)}).status_code, 401)
+
+    def test_purge_expired_tokens(self):
+        past = timezone.now() - timedelta(days=1)
+        expired = [self._outstanding(f"vencido-{i}", past) for i in range(5)]
+        BlacklistedToken.objects.create(token=expired[0])
+        valid = self._outstanding('vigente', timezone.now() + timedelta(days=1))
+        BlacklistedToken.objects.create(token=valid)
+        call_command('purge_expired_tokens', batch_size=2, stdout=StringIO())
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['vigente'])
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)), ['vigente'])
@@ -6,7 +6,8 @@ from django.contrib.auth import authenticate, login, logout
 from .models import User
 from .serializer import AdminRegistrationSerializer, UserCreateByAdminSerializer, UserSerializer
 from .permissions import IsAdminUserCustom
-from rest_framework_simplejwt.tokens import RefreshToken
+from .blacklist import FilteredRefreshToken
+from control.tenants import request_tenant_deletion
 
 class RegisterAdminView(generics.CreateAPIView):
     serializer_class = AdminRegistrationSerializer
@@ -37,7 +38,7 @@ class LogoutView(APIView):
     def post(self, request):
         try:
             refresh_token = request.data.get("refresh")
-            token = RefreshToken(refresh_token)
+            token = FilteredRefreshToken(refresh_token)
             token.blacklist()
             return Response({"message": "Sesión cerrada correctamente"}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -71,8 +72,10 @@ class DeleteUserView(APIView):
             ).exclude(pk=user.pk).count()
 
             if other_admins_count == 0:
-                user.business.delete()
-                return Response({"message": "Empresa y cuenta eliminadas con éxito."}, status=status.HTTP_204_NO_CONTENT)
+                # El borrado de los datos de la empresa se completa en segundo plano
+                # (python manage.py process_tenant_deletions).
+                request_tenant_deletion(user.business)
+                return Response({"message": "La empresa y sus cuentas se están eliminando."}, status=status.HTTP_202_ACCEPTED)
         
         user.delete()
         return Response({"message": "Cuenta eliminada con éxito."}, status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file